@@ -1,10 +1,22 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from starlette.routing import Match
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import time
 import uuid
 import os
 
-from rag_pipeline import answer_question
+from rag_pipeline import answer_question_async, stream_answer, warmup
+from search_backends import SEARCH_BACKEND, get_backend, active_backend
+from lexical_index import loaded_index
+from llm_providers import get_llm
+from semantic_cache import answer_cache
+from cache import cache_stats
+import metrics
 from logger_config import setup_logger
 
 app = FastAPI(title="JW Infotech Multimodal RAG")
@@ -12,22 +24,134 @@ logger = setup_logger()
 
 logger.info("api.py loaded")
 
+# Admission control for /ask: at most ASK_MAX_CONCURRENCY requests in the
+# pipeline, at most ASK_MAX_QUEUE waiting (each for ASK_QUEUE_TIMEOUT seconds)
+ASK_MAX_CONCURRENCY = int(os.getenv("ASK_MAX_CONCURRENCY", "16"))
+ASK_MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "64"))
+ASK_QUEUE_TIMEOUT = float(os.getenv("ASK_QUEUE_TIMEOUT", "10"))
+
+_ask_slots = asyncio.Semaphore(ASK_MAX_CONCURRENCY)
+_ask_waiting = 0
+
+# Models and connections are created lazily; warm them before serving traffic
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+
+@app.on_event("startup")
+async def startup_warmup():
+    if not WARMUP_ON_STARTUP:
+        logger.info("[WARMUP] skipped (WARMUP_ON_STARTUP=0)")
+        return
+
+    start_time = time.time()
+    timings = await asyncio.get_running_loop().run_in_executor(None, warmup)
+    logger.info(f"[WARMUP] done in {round(time.time() - start_time, 3)}s steps={timings}")
+
+
+async def acquire_ask_slot():
+    """
+    Wait for a pipeline slot, rejecting with 503 when the queue is full or the wait times out
+    """
+    global _ask_waiting
+
+    if _ask_waiting >= ASK_MAX_QUEUE:
+        logger.warning(f"[RAG_REJECTED] queue full waiting={_ask_waiting}")
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+
+    _ask_waiting += 1
+    try:
+        await asyncio.wait_for(_ask_slots.acquire(), ASK_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"[RAG_REJECTED] queue wait exceeded {ASK_QUEUE_TIMEOUT}s")
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    finally:
+        _ask_waiting -= 1
+
+
+@asynccontextmanager
+async def ask_slot():
+    await acquire_ask_slot()
+    try:
+        yield
+    finally:
+        _ask_slots.release()
+
+
+def route_label(request: Request) -> str:
+    """
+    Route template for metric labels ("/items/{id}", not every concrete
+    path); anything no route matches shares one label
+    """
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    request_id = str(uuid.uuid4())
+    # Reuse the caller's request ID if it sent one; every log line written
+    # while handling the request carries it (metrics.RequestIdFilter)
+    request_id = request.headers.get("x-request-id") or str(uuid.uuid4())
+    token = metrics.set_request_id(request_id)
     start_time = time.time()
+    route = route_label(request)
 
     logger.info(f"[REQUEST_START] id={request_id} method={request.method} path={request.url.path} client={request.client.host if request.client else 'unknown'}")
 
-    response = await call_next(request)
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.HTTP_REQUESTS.inc(method=request.method, path=route, status="500")
+        raise
+    finally:
+        metrics.request_id_var.reset(token)
 
-    duration = round(time.time() - start_time, 3)
-    logger.info(f"[REQUEST_END] id={request_id} status={response.status_code} duration={duration}s")
+    duration = time.time() - start_time
+    metrics.HTTP_REQUESTS.inc(method=request.method, path=route, status=str(response.status_code))
+    metrics.HTTP_SECONDS.observe(duration, method=request.method, path=route)
+    logger.info(f"[REQUEST_END] id={request_id} status={response.status_code} duration={round(duration, 3)}s")
 
+    response.headers["X-Request-ID"] = request_id
     return response
 
 
+def _cache_samples():
+    """
+    Cache and answer-cache counters for /metrics (they keep their own stats)
+    """
+    caches = dict(cache_stats())
+    caches["answer"] = answer_cache.stats()
+
+    for name, stats in caches.items():
+        labels = {"cache": name}
+        yield "rag_cache_entries", "gauge", "Entries held by a cache", labels, stats["entries"]
+        yield "rag_cache_hits_total", "counter", "Cache hits", labels, stats["hits"] + stats.get("shared_hits", 0)
+        yield "rag_cache_misses_total", "counter", "Cache misses", labels, stats["misses"]
+        yield "rag_cache_evictions_total", "counter", "Cache evictions", labels, stats["evictions"]
+
+
+def _search_samples():
+    """
+    Milvus pool utilisation for /metrics (only once the backend exists)
+    """
+    pool = getattr(active_backend(), "pool", None)
+    if pool is None:
+        return
+
+    stats = pool.stats()
+    yield "milvus_pool_size", "gauge", "Pooled Milvus connections", {}, stats["size"]
+    yield "milvus_pool_in_use", "gauge", "Milvus connections currently leased", {}, stats["in_use"]
+    yield "milvus_pool_wait_timeouts_total", "counter", "Leases that timed out waiting", {}, stats["timeouts"]
+    yield "milvus_pool_failures_total", "counter", "Failed Milvus calls", {}, stats["failures"]
+    yield "milvus_circuit_open", "gauge", "1 while the Milvus circuit breaker is open", {}, int(stats["breaker"] == "open")
+
+
+metrics.register_collector(_cache_samples)
+metrics.register_collector(_search_samples)
+
+
 class Query(BaseModel):
     question: str
 
@@ -39,32 +163,101 @@ class Answer(BaseModel):
 @app.get("/health")
 def health():
     logger.info("[HEALTH] called")
-    status = {"api": "ok", "milvus": "down", "llm": "down"}
+    status = {"api": "ok", "milvus": "down", "llm": "down", "search_backend": SEARCH_BACKEND}
 
+    # Real round trip to the backend (Milvus: server version on a pooled
+    # connection), plus pool utilisation and search latency for sizing
     try:
-        from pymilvus import connections
-        if connections.has_connection("default"):
-            status["milvus"] = "ok"
+        backend = get_backend()
+        backend_health = backend.health()["status"]
+        status["search"] = backend.stats()
+        if SEARCH_BACKEND == "milvus":
+            status["milvus"] = backend_health
+        else:
+            status["milvus"] = "not used"
     except Exception:
-        logger.debug("Milvus check failed or not configured")
+        logger.debug("Search backend check failed or not configured", exc_info=True)
 
-    if os.getenv("GROQ_API_KEY"):
+    llm = get_llm()
+    if llm is not None:
         status["llm"] = "ok"
+        status["llm_providers"] = llm.stats()
+
+    index = loaded_index()
+    status["lexical_index"] = index.stats() if index is not None else "not loaded"
+
+    status["answer_cache"] = answer_cache.stats()
+    status["caches"] = cache_stats()
 
     return status
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus text exposition: per-stage latency histograms, cache,
+    fallback and LLM error counters, HTTP and Milvus pool metrics
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/ask", response_model=Answer)
-def ask(query: Query):
+async def ask(query: Query):
     logger.info("🔥 /ask endpoint hit")
     start_time = time.time()
     logger.info(f"[RAG_QUERY] question='{query.question[:200]}'")
 
     try:
-        answer = answer_question(query.question)
+        async with ask_slot():
+            answer = await answer_question_async(query.question)
         duration = round(time.time() - start_time, 3)
         logger.info(f"[RAG_SUCCESS] duration={duration}s")
         return {"answer": answer}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("[RAG_ERROR] Exception while answering", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+
+@app.post("/ask/stream")
+async def ask_stream(query: Query):
+    """
+    NDJSON stream: a "sources" event first, then "token" events, then "done"
+    """
+    logger.info("🔥 /ask/stream endpoint hit")
+    start_time = time.time()
+    logger.info(f"[RAG_QUERY] stream question='{query.question[:200]}'")
+
+    # Take the slot before the response starts so overload can still return 503
+    await acquire_ask_slot()
+    released = False
+
+    def release_slot():
+        # Called from the generator and as a background task (covers clients
+        # that disconnect before the first event); releases exactly once
+        nonlocal released
+        if not released:
+            released = True
+            _ask_slots.release()
+
+    async def events():
+        first_token_at = None
+        try:
+            async for event in stream_answer(query.question):
+                if event["type"] == "token" and first_token_at is None:
+                    first_token_at = time.time()
+                    logger.info(f"[RAG_TTFT] ttft={round(first_token_at - start_time, 3)}s")
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception:
+            logger.error("[RAG_ERROR] Exception while streaming", exc_info=True)
+            yield json.dumps({"type": "error", "detail": "Internal error"}) + "\n"
+        finally:
+            release_slot()
+            logger.info(f"[RAG_STREAM_END] total={round(time.time() - start_time, 3)}s")
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release_slot)
+    )
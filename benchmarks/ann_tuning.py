@@ -0,0 +1,147 @@
+"""
+ann_tuning.py
+
+Recall / latency tuning harness for the Milvus index profiles in milvus_config.py.
+
+For every profile it builds a scratch collection from an embedding store,
+sweeps the profile's search knob (nprobe for IVF_*, ef for HNSW) and reports
+recall@k against the FLAT profile (exact search) together with p50 / p99
+single-query latency.
+
+    python benchmarks/ann_tuning.py --store data/runs/<run_id>/embeddings/clip_text_store \\
+        --profiles IVF_FLAT,IVF_SQ8,HNSW --queries 200 --k 10 --out ann_tuning.json
+
+Scratch collections are named tune_<profile> and dropped afterwards unless --keep.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_store import EmbeddingStore  # noqa: E402
+from milvus_config import (  # noqa: E402
+    MILVUS_HOST, MILVUS_PORT, INDEX_PROFILES, get_profile, index_params, search_params
+)
+
+DEFAULT_SWEEPS = {
+    "nprobe": [1, 2, 4, 8, 16, 32, 64, 128],
+    "ef": [16, 32, 64, 128, 256, 512],
+}
+INSERT_BATCH = 2000
+
+
+def build_collection(profile, vectors):
+    name = f"tune_{profile.lower()}"
+    if utility.has_collection(name):
+        utility.drop_collection(name)
+
+    schema = CollectionSchema(fields=[
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=vectors.shape[1]),
+    ])
+    collection = Collection(name=name, schema=schema)
+
+    for start in range(0, len(vectors), INSERT_BATCH):
+        end = min(start + INSERT_BATCH, len(vectors))
+        collection.insert([list(range(start, end)), vectors[start:end].tolist()])
+    collection.flush()
+
+    collection.create_index(field_name="embedding", index_params=index_params(profile))
+    collection.load()
+    return collection
+
+
+def run_queries(collection, queries, k, params):
+    """
+    One search call per query, as retrieve_context does; returns (ids, latencies_ms)
+    """
+    ids, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits = collection.search(data=[q.tolist()], anns_field="embedding", param=params, limit=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append([hit.id for hit in hits[0]])
+    return ids, np.array(latencies)
+
+
+def recall_at_k(ids, truth, k):
+    return float(np.mean([len(set(a[:k]) & set(t[:k])) / k for a, t in zip(ids, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep Milvus search params for recall@k vs latency")
+    parser.add_argument("--store", required=True, help="embedding store to index")
+    parser.add_argument("--query-store", default=None, help="store to draw queries from (default: --store)")
+    parser.add_argument("--profiles", default="IVF_FLAT,IVF_SQ8,HNSW")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--sweep", default=None, help="comma-separated knob values (default per knob)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write results as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep tune_* collections")
+    args = parser.parse_args()
+
+    connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
+
+    vectors = np.asarray(EmbeddingStore(args.store).vectors(), dtype=np.float32)
+    query_pool = vectors if args.query_store is None else \
+        np.asarray(EmbeddingStore(args.query_store).vectors(), dtype=np.float32)
+
+    rng = np.random.default_rng(args.seed)
+    queries = query_pool[rng.choice(len(query_pool), size=min(args.queries, len(query_pool)), replace=False)]
+
+    print(f"corpus={len(vectors)} dim={vectors.shape[1]} queries={len(queries)} k={args.k}")
+
+    # -------- GROUND TRUTH (FLAT) --------
+    flat = build_collection("FLAT", vectors)
+    truth, flat_lat = run_queries(flat, queries, args.k, search_params("FLAT"))
+    results = [{
+        "profile": "FLAT", "knob": None, "value": None, "recall": 1.0,
+        "p50_ms": float(np.percentile(flat_lat, 50)), "p99_ms": float(np.percentile(flat_lat, 99)),
+    }]
+    collections = [flat]
+
+    # -------- SWEEP --------
+    for profile in args.profiles.split(","):
+        profile = profile.strip()
+        if profile == "FLAT" or profile not in INDEX_PROFILES:
+            continue
+
+        knob = get_profile(profile)["search_knob"]
+        values = [int(v) for v in args.sweep.split(",")] if args.sweep else DEFAULT_SWEEPS[knob]
+
+        collection = build_collection(profile, vectors)
+        collections.append(collection)
+
+        for value in values:
+            ids, lat = run_queries(collection, queries, args.k, search_params(profile, value))
+            results.append({
+                "profile": profile, "knob": knob, "value": value,
+                "recall": recall_at_k(ids, truth, args.k),
+                "p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99)),
+            })
+
+    print(f"{'profile':<10} {'knob':<7} {'value':>6} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['profile']:<10} {str(r['knob'] or '-'):<7} {str(r['value'] or '-'):>6} "
+              f"{r['recall']:>9.3f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"corpus": len(vectors), "queries": len(queries), "k": args.k, "results": results}, f, indent=4)
+        print(f"✔ Results written → {args.out}")
+
+    if not args.keep:
+        for collection in collections:
+            collection.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+bench_api.py
+
+End-to-end load benchmark of the real FastAPI app (api.app) with local
+stand-ins for every external dependency:
+
+- LLM: fake_groq.py server with injectable latency (GROQ_BASE_URL)
+- Vectors: LocalBackend over a synthetic corpus (synthetic_corpus.py)
+- Query encoder: HashingEncoder instead of CLIP
+
+Reports throughput, p50/p95/p99 latency (and time to first token for
+/ask/stream), errors, and a per-stage breakdown from metrics.py, and writes
+everything to a JSON file in benchmarks/results/.
+
+    python benchmarks/bench_api.py --requests 500 --concurrency 32 --llm-latency-ms 400
+    python benchmarks/bench_api.py --endpoint stream --serve     # real HTTP via uvicorn
+
+By default requests go through httpx's in-process ASGI transport, which
+buffers response bodies; use --serve for meaningful TTFT numbers.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from bench_utils import percentiles, write_results
+from synthetic_corpus import HashingEncoder, build_corpus
+import fake_groq
+
+
+def configure(args, run_dir, llm_url):
+    """
+    Environment for the app; must run before api / rag_pipeline are imported
+    """
+    os.environ.update({
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": llm_url,
+        "SEARCH_BACKEND": "local",
+        "LOCAL_INDEX_RUN_DIR": run_dir,
+        "LOCAL_INDEX_MODE": args.index_mode,
+        "WARMUP_ON_STARTUP": "0",
+        "SEMANTIC_CACHE_ENABLED": "1" if args.answer_cache else "0",
+        "ASK_MAX_CONCURRENCY": str(args.max_concurrency),
+        "ASK_MAX_QUEUE": str(max(args.concurrency, 64)),
+    })
+
+
+def stage_breakdown(before, after):
+    """
+    Per-stage count / mean / approximate p95 (bucket upper bound) between two
+    metrics.STAGE_SECONDS snapshots
+    """
+    out = {}
+    for key, series in after.items():
+        prev = before.get(key, {"counts": [0] * len(series["counts"]), "sum": 0.0, "count": 0})
+        count = series["count"] - prev["count"]
+        if count <= 0:
+            continue
+
+        counts = [a - b for a, b in zip(series["counts"], prev["counts"])]
+        bounds = list(series["buckets"]) + [float("inf")]
+        target, seen, p95 = 0.95 * count, 0, None
+        for bound, n in zip(bounds, counts):
+            seen += n
+            if seen >= target:
+                p95 = bound
+                break
+
+        out[key[0]] = {
+            "count": count,
+            "mean_ms": round(1000 * (series["sum"] - prev["sum"]) / count, 2),
+            "p95_le_ms": None if p95 in (None, float("inf")) else round(p95 * 1000, 1),
+        }
+    return out
+
+
+async def one_request(client, endpoint, question):
+    """
+    (status, latency seconds, ttft seconds or None)
+    """
+    started = time.perf_counter()
+
+    if endpoint == "ask":
+        response = await client.post("/ask", json={"question": question})
+        return response.status_code, time.perf_counter() - started, None
+
+    ttft = None
+    async with client.stream("POST", "/ask/stream", json={"question": question}) as response:
+        async for line in response.aiter_lines():
+            if ttft is None and line and json.loads(line).get("type") == "token":
+                ttft = time.perf_counter() - started
+        return response.status_code, time.perf_counter() - started, ttft
+
+
+async def drive(client, questions, args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, ttfts, statuses = [], [], {}
+
+    async def worker(question):
+        async with semaphore:
+            try:
+                status, latency, ttft = await one_request(client, args.endpoint, question)
+            except Exception as e:
+                status, latency, ttft = type(e).__name__, None, None
+
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status == 200:
+            latencies.append(latency)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(q) for q in questions))
+    return time.perf_counter() - started, latencies, ttfts, statuses
+
+
+async def run(args, questions):
+    import httpx
+    import api
+    import metrics
+
+    server = None
+    if args.serve:
+        import uvicorn
+
+        server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=args.port, log_level="warning"))
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://bench", timeout=120)
+
+    async with client:
+        # Warm-up requests load the corpus and open connections; excluded from results
+        await drive(client, questions[:args.warmup], argparse.Namespace(**{**vars(args), "concurrency": 1}))
+
+        before = metrics.STAGE_SECONDS.snapshot()
+        wall, latencies, ttfts, statuses = await drive(client, questions[args.warmup:], args)
+        after = metrics.STAGE_SECONDS.snapshot()
+
+    if server is not None:
+        server.should_exit = True
+        await task
+
+    return wall, latencies, ttfts, statuses, stage_breakdown(before, after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /ask load benchmark with local stand-ins")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-concurrency", type=int, default=16, help="ASK_MAX_CONCURRENCY for the app")
+    parser.add_argument("--endpoint", choices=["ask", "stream"], default="ask")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--index-mode", default="exact", choices=["exact", "ivf", "ivfpq"])
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="fraction of repeated questions")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache on")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--serve", action="store_true", help="run uvicorn and use real HTTP")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    run_dir = os.path.join(workdir, "run")
+    total = args.requests + args.warmup
+    questions = build_corpus(run_dir, docs=args.docs, pages=args.pages, questions=total, seed=args.seed)
+
+    rng = random.Random(args.seed)
+    for i in range(args.warmup, total):
+        if i > args.warmup and rng.random() < args.repeat_ratio:
+            questions[i] = questions[rng.randrange(args.warmup, i)]
+
+    llm, llm_url = fake_groq.start(config=fake_groq.FakeGroqConfig(
+        args.llm_latency_ms, args.llm_jitter_ms, args.token_ms, args.llm_error_rate
+    ))
+    configure(args, run_dir, llm_url)
+
+    import embedder
+    embedder.set_engine(HashingEncoder())
+
+    wall, latencies, ttfts, statuses, stages = asyncio.run(run(args, questions))
+    llm.shutdown()
+
+    results = {
+        "config": vars(args),
+        "completed": len(latencies),
+        "statuses": statuses,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency": {**percentiles(latencies), "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None},
+        "ttft": percentiles(ttfts) if ttfts else None,
+        "llm_requests": llm.config.requests,
+        "stages": stages,
+    }
+
+    print(f"requests={args.requests} concurrency={args.concurrency} endpoint={args.endpoint}")
+    print(f"throughput={results['throughput_rps']} req/s  statuses={statuses}")
+    print("latency " + "  ".join(f"{k}={v}" for k, v in results["latency"].items()))
+    if ttfts:
+        print("ttft    " + "  ".join(f"{k}={v}" for k, v in results["ttft"].items()))
+    print(f"{'stage':<22} {'count':>6} {'mean ms':>9} {'p95<= ms':>9}")
+    for stage, s in sorted(stages.items(), key=lambda kv: -kv[1]["mean_ms"]):
+        print(f"{stage:<22} {s['count']:>6} {s['mean_ms']:>9} {str(s['p95_le_ms']):>9}")
+
+    write_results(f"api_{args.endpoint}", results, args.out)
+    sys.exit(0 if latencies else 1)
+
+
+if __name__ == "__main__":
+    main()
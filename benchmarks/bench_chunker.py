@@ -0,0 +1,116 @@
+"""
+bench_chunker.py
+
+Microbenchmark: original split_into_chunks vs the streaming chunker, both
+reading an extracted-text file from disk. Records wall time (best of
+--repeat) and peak Python heap (tracemalloc) for each.
+
+The streaming chunker is only modestly faster; what it buys is memory that
+stays flat as documents grow (one sentence and one chunk held at a time,
+instead of the whole text, its cleaned copy and every page split).
+
+    python benchmarks/bench_chunker.py --pages 2000 --repeat 3
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from bench_utils import write_results
+
+from text_chunker import clean_text, split_into_chunks, stream_chunks
+
+WORDS = (
+    "connect the red wire to terminal A before powering the unit check fuse "
+    "rating replace the filter every six months error code E42 indicates "
+    "overheating model JX-200 supports remote diagnostics"
+).split()
+
+
+def synthetic_text(pages, sentences_per_page=40, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for p in range(1, pages + 1):
+        out.append(f"\n[PAGE_BREAK_{p}]\n")
+        for _ in range(sentences_per_page):
+            n = rng.randint(6, 30)
+            out.append(" ".join(rng.choice(WORDS) for _ in range(n)) + ".\n")
+    return "".join(out)
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_mb(fn):
+    """
+    Peak traced heap (MB) while fn runs; the chunks themselves are counted,
+    not kept, so only the chunker's own working memory shows
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 2**20, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    text = synthetic_text(args.pages)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "manual.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        del text
+
+        def old():
+            with open(path, "r", encoding="utf-8") as f:
+                return sum(1 for _ in split_into_chunks(clean_text(f.read()), args.max_tokens))
+
+        def new():
+            with open(path, "r", encoding="utf-8") as f:
+                return sum(1 for _ in stream_chunks(f, max_tokens=args.max_tokens))
+
+        old_t, old_chunks = best_of(args.repeat, old)
+        new_t, new_chunks = best_of(args.repeat, new)
+        old_mb, new_mb = peak_mb(old), peak_mb(new)
+        chars = os.path.getsize(path)
+
+    results = {
+        "pages": args.pages,
+        "bytes": chars,
+        "max_tokens": args.max_tokens,
+        "split_into_chunks": {"seconds": round(old_t, 4), "peak_mb": old_mb, "chunks": old_chunks},
+        "stream_chunks": {"seconds": round(new_t, 4), "peak_mb": new_mb, "chunks": new_chunks},
+        "speedup": round(old_t / new_t, 2),
+        "memory_ratio": round(old_mb / new_mb, 1) if new_mb else None,
+    }
+
+    print(f"pages={args.pages} bytes={chars} max_tokens={args.max_tokens}")
+    print(f"split_into_chunks : {old_t:.3f}s  peak={old_mb}MB  chunks={old_chunks}")
+    print(f"stream_chunks     : {new_t:.3f}s  peak={new_mb}MB  chunks={new_chunks}")
+    print(f"speedup           : {results['speedup']}x  memory: {results['memory_ratio']}x less")
+
+    write_results("chunker", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
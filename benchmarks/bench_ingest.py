@@ -0,0 +1,129 @@
+"""
+bench_ingest.py
+
+Throughput of the ingestion stages on synthetic PDFs:
+
+    pdf_parser                  pages/s (once per --workers value)
+    text_chunker                chunks/s
+    metadata_and_linking        images/s
+    clip_text_image_alignment   chunks+images/s (only with --embed; loads CLIP)
+
+Every stage runs in a fresh interpreter inside a scratch directory, so
+nothing is reused from an earlier run's manifest and module-level state
+(run directory, worker pools) starts clean. Results go to a JSON file in
+benchmarks/results/.
+
+    python benchmarks/bench_ingest.py --docs 4 --pages 100 --workers 1,4
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from bench_utils import ROOT, write_results
+from synthetic_corpus import write_pdfs
+
+RUN_ID = "bench"
+MARKER = "BENCH_RESULT "
+
+STAGE_CODE = """
+import sys, json, time
+sys.path.insert(0, {root!r})
+import {module}
+started = time.perf_counter()
+{module}.run({args})
+print({marker!r} + json.dumps({{"seconds": time.perf_counter() - started}}))
+"""
+
+
+def run_stage(workdir, module, args=""):
+    """
+    Run <module>.run(args) in a new interpreter with cwd=workdir; returns seconds
+    """
+    code = STAGE_CODE.format(root=ROOT, module=module, args=args, marker=MARKER)
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PIPELINE_RUN_ID": RUN_ID}
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} failed:\n{proc.stderr[-3000:]}")
+
+    line = next(l for l in reversed(proc.stdout.splitlines()) if l.startswith(MARKER))
+    return json.loads(line[len(MARKER):])["seconds"]
+
+
+def count_lines(folder):
+    total = 0
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), encoding="utf-8") as f:
+            total += sum(1 for _ in f)
+    return total
+
+
+def rate(n, seconds):
+    return round(n / seconds, 2) if seconds else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion stage throughput on synthetic PDFs")
+    parser.add_argument("--docs", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="comma-separated PDF_WORKERS values")
+    parser.add_argument("--embed", action="store_true", help="also benchmark CLIP embedding (downloads the model)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_ingest_")
+    pdf_folder = os.path.join(scratch, "pdfs")
+    total_pages = write_pdfs(pdf_folder, args.docs, args.pages, args.images_per_page)
+    results = {"config": vars(args), "pages": total_pages, "stages": {}}
+
+    workdir = None
+    for workers in sorted({int(w) for w in args.workers.split(",")}):
+        workdir = os.path.join(scratch, f"workers_{workers}")
+        shutil.copytree(pdf_folder, os.path.join(workdir, "data", "manuals"))
+
+        seconds = run_stage(workdir, "pdf_parser", workers)
+        results["stages"][f"pdf_parser[workers={workers}]"] = {
+            "seconds": round(seconds, 3), "pages": total_pages, "pages_per_s": rate(total_pages, seconds)
+        }
+        print(f"✔ pdf_parser workers={workers}: {rate(total_pages, seconds)} pages/s")
+
+    # Downstream stages run on the output of the last pdf_parser run
+    run_dir = os.path.join(workdir, "data", "runs", RUN_ID)
+
+    seconds = run_stage(workdir, "text_chunker")
+    chunks = count_lines(os.path.join(run_dir, "chunks"))
+    results["stages"]["text_chunker"] = {"seconds": round(seconds, 3), "chunks": chunks, "chunks_per_s": rate(chunks, seconds)}
+    print(f"✔ text_chunker: {rate(chunks, seconds)} chunks/s ({chunks} chunks)")
+
+    if args.embed:
+        seconds = run_stage(workdir, "clip_text_image_alignment")
+        images = len(os.listdir(os.path.join(run_dir, "extracted_images")))
+        results["stages"]["embedding"] = {
+            "seconds": round(seconds, 3), "items": chunks + images, "items_per_s": rate(chunks + images, seconds)
+        }
+        print(f"✔ embedding: {rate(chunks + images, seconds)} items/s (includes model load)")
+
+    seconds = run_stage(workdir, "metadata_and_linking")
+    images = len(os.listdir(os.path.join(run_dir, "extracted_images")))
+    results["stages"]["linking"] = {"seconds": round(seconds, 3), "images": images, "images_per_s": rate(images, seconds)}
+    print(f"✔ linking: {rate(images, seconds)} images/s ({images} images)")
+
+    write_results("ingest", results, args.out)
+
+    if not args.keep:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
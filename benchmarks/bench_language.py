@@ -0,0 +1,110 @@
+"""
+bench_language.py
+
+Language handling on the query path: detection latency, the English
+short-circuit of normalize_question / translate_answer, and translation
+cache hits vs misses (a fake translator with --translate-ms latency stands
+in for the backend, so no model or API key is needed).
+
+    python benchmarks/bench_language.py --iterations 2000 --translate-ms 300
+"""
+
+import time
+import argparse
+
+from bench_utils import percentiles, write_results
+
+import language_utils
+from cache import translation_cache
+
+ENGLISH = [
+    "How do I reset the JX-200 after error code E42?",
+    "What is the fuse rating for the main power board",
+    "E-203 error fix",
+    "replace filter every six months or when the warning light is on?",
+]
+
+OTHER = [
+    "¿Cómo reinicio el JX-200 después del código de error E42?",
+    "Comment remplacer le filtre de la pompe ?",
+    "Wie oft muss ich den Filter wechseln?",
+    "JX-200 को कैसे रीसेट करें?",
+    "フィルターの交換方法を教えてください",
+]
+
+
+def timed(iterations, fn, inputs):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def fake_translator(delay):
+    calls = {"batches": 0, "texts": 0}
+
+    def translate(texts, source, target):
+        calls["batches"] += 1
+        calls["texts"] += len(texts)
+        time.sleep(delay)
+        return [f"[{source}->{target}] {t}" for t in texts]
+
+    return translate, calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--translate-ms", type=float, default=300.0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    translator, calls = fake_translator(args.translate_ms / 1000)
+    language_utils.set_translator(translator)
+
+    results = {"iterations": args.iterations, "translate_ms": args.translate_ms}
+
+    results["detect_english"] = percentiles(timed(args.iterations, language_utils.detect_language, ENGLISH))
+    results["detect_other"] = percentiles(timed(args.iterations, language_utils.detect_language, OTHER))
+    results["detected"] = {q: language_utils.detect_language(q) for q in ENGLISH + OTHER}
+
+    # English never reaches the translator
+    results["normalize_english"] = percentiles(timed(args.iterations, language_utils.normalize_question, ENGLISH))
+    results["english_translator_calls"] = calls["batches"]
+
+    translation_cache.clear()
+    miss = timed(len(OTHER), language_utils.normalize_question, OTHER)
+    hit = timed(args.iterations, language_utils.normalize_question, OTHER)
+    results["normalize_miss"] = percentiles(miss)
+    results["normalize_hit"] = percentiles(hit)
+
+    # Batch API: one backend call per language, cached texts skipped
+    translation_cache.clear()
+    calls.update(batches=0, texts=0)
+    answers = [f"Step {i}: turn the unit off and hold RESET for five seconds." for i in range(8)]
+    langs = ["es", "fr", "de", "en"] * 2
+    start = time.perf_counter()
+    language_utils.translate_answers(answers, langs)
+    results["batch_answers"] = {
+        "answers": len(answers),
+        "backend_calls": calls["batches"],
+        "texts_translated": calls["texts"],
+        "ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+    language_utils.set_translator(None)
+
+    print(f"detect (en)         : {results['detect_english']}")
+    print(f"detect (other)      : {results['detect_other']}")
+    print(f"normalize (en)      : {results['normalize_english']}  translator calls={results['english_translator_calls']}")
+    print(f"normalize (miss)    : {results['normalize_miss']}")
+    print(f"normalize (hit)     : {results['normalize_hit']}")
+    print(f"translate_answers   : {results['batch_answers']}")
+
+    write_results("language", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_utils.py
+
+Shared helpers for the benchmark scripts: latency percentiles, the git
+commit under test, and machine-readable result files so runs can be
+compared across commits (benchmarks/results/<name>_<commit>_<time>.json).
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentiles(samples: List[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """
+    {"p50_ms": ..., ...} from samples in seconds (nearest-rank)
+    """
+    if not samples:
+        return {f"p{p}_ms": None for p in points}
+
+    ordered = sorted(samples)
+    out = {}
+    for p in points:
+        rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+        out[f"p{p}_ms"] = round(ordered[rank] * 1000, 2)
+    return out
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def write_results(name: str, results: Dict, out: Optional[str] = None) -> str:
+    """
+    Write results plus run metadata as JSON; returns the file path
+    """
+    commit = git_commit()
+    payload = {
+        "benchmark": name,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        **results,
+    }
+
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{name}_{commit or 'nogit'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=4)
+
+    print(f"✔ Results written → {out}")
+    return out
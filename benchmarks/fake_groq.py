@@ -0,0 +1,156 @@
+"""
+fake_groq.py
+
+Stand-in for the Groq chat completions API with injectable latency, so the
+API can be load-tested without network calls or rate limits. Speaks the
+OpenAI-compatible wire format the groq SDK uses, including stream=True
+(server-sent events). Point the SDK at it with GROQ_BASE_URL.
+
+    python benchmarks/fake_groq.py --port 8765 --latency-ms 400 --token-ms 15
+
+    latency-ms   time before the first byte (plus up to jitter-ms)
+    token-ms     delay between streamed tokens
+    error-rate   fraction of requests answered with HTTP 500
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "According to the manual, disconnect the power supply, remove the front "
+    "cover and replace the filter cartridge, then run the self test."
+)
+
+
+class FakeGroqConfig:
+    def __init__(self, latency_ms=300.0, jitter_ms=50.0, token_ms=10.0, error_rate=0.0, answer=ANSWER):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.answer = answer
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _handler(config: FakeGroqConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.endswith("/chat/completions"):
+                return self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            with config.lock:
+                config.requests += 1
+
+            time.sleep((config.latency_ms + random.uniform(0, config.jitter_ms)) / 1000)
+
+            if random.random() < config.error_rate:
+                return self._json(500, {"error": {"message": "injected failure"}})
+
+            created = int(time.time())
+            model = request.get("model", "fake")
+            words = config.answer.split(" ")
+
+            if not request.get("stream"):
+                return self._json(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": config.answer},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+                })
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(event: str):
+                data = f"data: {event}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            for i, word in enumerate(words):
+                token = word if i == 0 else " " + word
+                send(json.dumps({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }))
+                time.sleep(config.token_ms / 1000)
+
+            send(json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start(port=0, config=None):
+    """
+    Start the server on a daemon thread; returns (server, base_url)
+    """
+    config = config or FakeGroqConfig()
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(config))
+    server.daemon_threads = True
+    server.config = config
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeGroqConfig(args.latency_ms, args.jitter_ms, args.token_ms, args.error_rate)
+    server, url = start(args.port, config)
+    print(f"✔ Fake Groq listening on {url} (set GROQ_BASE_URL={url})")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
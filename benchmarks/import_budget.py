@@ -0,0 +1,105 @@
+"""
+import_budget.py
+
+Cold-start check: measure module import time with `python -X importtime`
+in a fresh interpreter and fail when a module exceeds its budget or pulls in
+a heavy dependency (torch, transformers, pymilvus, ...) at import.
+
+    python benchmarks/import_budget.py [--module api] [--top 15] [--out import_times.json]
+
+Exit status is 1 when any check fails, so it can gate CI.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budget (ms) per module, measured in a fresh process
+BUDGETS_MS = {
+    "run_config": 50,
+    "cache": 150,
+    "search_backends": 400,
+    "retriever": 500,
+    "rag_pipeline": 800,
+    "api": 2000,
+}
+
+# Nothing on the query path may import these at module load; they belong
+# behind lazy initialisation (embedder.get_engine, search backends, warmup)
+FORBIDDEN = ("torch", "transformers", "pymilvus", "groq", "fitz")
+
+
+def import_times(module):
+    """
+    {imported module: (self_us, cumulative_us)} for `import module` in a new interpreter
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def check(module, budget_ms, top):
+    times = import_times(module)
+    total_ms = times[module][1] / 1000
+    heavy = sorted({name.split(".")[0] for name in times} & set(FORBIDDEN))
+
+    ok = total_ms <= budget_ms and not heavy
+    mark = "✔" if ok else "✘"
+    print(f"{mark} {module}: {total_ms:.1f} ms (budget {budget_ms} ms)")
+    if heavy:
+        print(f"    imports heavy dependencies at load: {', '.join(heavy)}")
+
+    slowest = sorted(times.items(), key=lambda kv: kv[1][0], reverse=True)[:top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"    {self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms cum  {name}")
+
+    return {"module": module, "ms": total_ms, "budget_ms": budget_ms, "heavy": heavy, "ok": ok}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget checks")
+    parser.add_argument("--module", action="append", help="module to check (repeatable, default: all budgets)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="override the budget for every module")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list per module")
+    parser.add_argument("--out", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    modules = args.module or list(BUDGETS_MS)
+    results = []
+
+    for module in modules:
+        budget = args.budget_ms if args.budget_ms is not None else BUDGETS_MS.get(module, 500)
+        try:
+            results.append(check(module, budget, args.top))
+        except RuntimeError as e:
+            print(f"✘ {e}")
+            results.append({"module": module, "ok": False, "error": str(e)})
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"✔ Results written → {args.out}")
+
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+synthetic_corpus.py
+
+Synthetic "equipment manual" data for benchmarks, no models or services
+needed:
+
+- build_corpus: a run directory (chunks, CLIP-shaped embedding stores and
+  a BM25 index) that LocalBackend can search, plus questions drawn from the chunk text
+- HashingEncoder: deterministic bag-of-words query/text encoder standing in
+  for CLIP, so questions actually retrieve the chunks they came from
+- write_pdfs: synthetic PDFs with text and images for the pdf_parser benchmark
+
+    python benchmarks/synthetic_corpus.py --out data/runs/synthetic --docs 20 --pages 50
+"""
+
+import os
+import io
+import zlib
+import random
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+from bench_utils import ROOT  # noqa: F401  (puts the repo root on sys.path)
+from chunk_records import chunk_file_name, make_chunk_id, write_chunks
+from embedding_store import EmbeddingStore
+from lexical_index import INDEX_DIR_NAME, update_index
+
+VOCAB = (
+    "power supply fuse terminal wire connector relay sensor filter pump valve "
+    "pressure temperature motor controller display error code reset cover panel "
+    "cartridge cable voltage current calibration diagnostic firmware warranty "
+    "install remove replace inspect clean tighten check disconnect connect "
+    "red black green blue front rear left right upper lower main auxiliary "
+    "unit module assembly bracket screw bolt gasket seal bearing belt fan"
+).split()
+
+DIM = 512
+
+
+class HashingEncoder:
+    """
+    Signed feature hashing of words into `dim` buckets, L2-normalised.
+    Has the embed_texts interface of EmbeddingEngine (see embedder.set_engine).
+    """
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            h = zlib.crc32(word.strip(".,;:?!").encode("utf-8"))
+            v[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(t).tolist() for t in texts]
+
+    def texts(self, texts: List[str], mode: str = None) -> np.ndarray:
+        return np.array([self._vector(t) for t in texts], dtype=np.float32)
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCAB) for _ in range(words)).capitalize() + "."
+
+
+def build_corpus(
+    run_dir: str,
+    docs: int = 10,
+    pages: int = 20,
+    chunks_per_page: int = 4,
+    images_per_page: int = 1,
+    questions: int = 200,
+    seed: int = 0
+) -> List[str]:
+    """
+    Write chunks and embedding stores under run_dir; returns sample questions
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    encoder = HashingEncoder()
+
+    chunk_folder = os.path.join(run_dir, "chunks")
+    embeddings = os.path.join(run_dir, "embeddings")
+    os.makedirs(chunk_folder, exist_ok=True)
+    os.makedirs(embeddings, exist_ok=True)
+
+    text_store = EmbeddingStore(os.path.join(embeddings, "clip_text_store"), dim=DIM)
+    image_store = EmbeddingStore(os.path.join(embeddings, "clip_image_store"), dim=DIM)
+    sample = []
+
+    for d in range(docs):
+        doc = f"manual_{d:03d}"
+        records: List[Dict] = []
+
+        for page in range(1, pages + 1):
+            for n in range(1, chunks_per_page + 1):
+                text = " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(3, 8)))
+                records.append({
+                    "chunk_id": make_chunk_id(doc, page, n),
+                    "source_document": doc,
+                    "page": page,
+                    "char_start": 0,
+                    "char_end": len(text),
+                    "token_count": len(text.split()),
+                    "text": text,
+                })
+
+        write_chunks(os.path.join(chunk_folder, chunk_file_name(doc, "jsonl")), records)
+        text_store.append(
+            encoder.texts([r["text"] for r in records]),
+            [{"chunk_id": r["chunk_id"], "source_document": doc} for r in records]
+        )
+        sample.extend(r["text"] for r in rng.sample(records, min(len(records), 5)))
+
+        n_images = pages * images_per_page
+        if n_images:
+            vectors = np_rng.standard_normal((n_images, DIM)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            image_store.append(vectors, [
+                {"image_file": f"{doc}_page{1 + i // images_per_page}_{1 + i % images_per_page}.png"}
+                for i in range(n_images)
+            ])
+
+    update_index(chunk_folder, os.path.join(run_dir, INDEX_DIR_NAME))
+
+    # Questions: a few words from a chunk, reworded, so searches hit real chunks
+    out = []
+    for i in range(questions):
+        words = rng.choice(sample).rstrip(".").split()
+        start = rng.randint(0, max(0, len(words) - 8))
+        out.append(f"How do I {' '.join(words[start:start + 8]).lower()}? ({i})")
+    return out
+
+
+def _png(rng: random.Random, size: int = 64) -> bytes:
+    from PIL import Image
+
+    image = Image.new("RGB", (size, size), tuple(rng.randint(0, 255) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def write_pdfs(folder: str, docs: int = 2, pages: int = 50, images_per_page: int = 1, seed: int = 0) -> int:
+    """
+    Synthetic PDFs for pdf_parser; returns the total page count
+    """
+    import fitz
+
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    for d in range(docs):
+        pdf = fitz.open()
+        for _ in range(pages):
+            page = pdf.new_page()
+            text = "\n".join(_sentence(rng, rng.randint(8, 16)) for _ in range(30))
+            page.insert_textbox(fitz.Rect(40, 40, 560, 620), text, fontsize=9)
+            for i in range(images_per_page):
+                rect = fitz.Rect(40 + 80 * i, 660, 104 + 80 * i, 724)
+                page.insert_image(rect, stream=_png(rng))
+        pdf.save(os.path.join(folder, f"synthetic_{d:03d}.pdf"))
+        pdf.close()
+
+    return docs * pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a synthetic run directory for the local backend")
+    parser.add_argument("--out", default=os.path.join("data", "runs", "synthetic"))
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--chunks-per-page", type=int, default=4)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    args = parser.parse_args()
+
+    build_corpus(args.out, args.docs, args.pages, args.chunks_per_page, args.images_per_page)
+    print(f"✔ Synthetic corpus → {args.out} ({args.docs * args.pages * args.chunks_per_page} chunks)")
+
+
+if __name__ == "__main__":
+    main()
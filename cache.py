@@ -1,20 +1,392 @@
+"""
+cache.py
+
+Purpose:
+- Size-bounded LRU + TTL caches for the query path (embeddings, retrieval
+  results, LLM completions, reranker scores, translations)
+- Thread-safe; concurrent misses for the same key are computed once
+  (single-flight) and every waiter gets that result
+- Per-cache hit / miss / eviction counters via stats()
+- Optional shared second level so several uvicorn workers share hits:
+
+    CACHE_BACKEND=memory   in-process only (default)
+    CACHE_BACKEND=sqlite   plus a SQLite file (CACHE_SQLITE_PATH)
+    CACHE_BACKEND=redis    plus a Redis-compatible server (CACHE_REDIS_URL,
+                           needs the optional `redis` package)
+
+Values written to the shared level are pickled; only point it at storage
+this deployment owns.
+"""
+
+import os
 import time
+import pickle
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger("Cache")
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))  # seconds (5 minutes = 300 seconds)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | sqlite | redis
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", os.path.join("data", "cache.sqlite3"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+_MISSING = object()
+
+
+# -------- SHARED BACKENDS --------
+def _shared_key(namespace: str, key: Hashable) -> str:
+    return namespace + ":" + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+class SQLiteBackend:
+    """
+    Shared cache level in one SQLite file (WAL mode, one connection per thread)
+    """
+
+    PURGE_EVERY = 500  # writes between expired-row sweeps
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else _MISSING
+
+    def set(self, key: str, value: Any, ttl: float):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time() + ttl)
+            )
+
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+    def clear(self, prefix: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE key LIKE ?", (prefix + "%",))
+
+
+class RedisBackend:
+    """
+    Shared cache level in a Redis-compatible server; expiry is left to the server
+    """
+
+    def __init__(self, url: str = CACHE_REDIS_URL):
+        import redis  # optional dependency
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Any:
+        value = self._client.get(key)
+        return pickle.loads(value) if value is not None else _MISSING
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._client.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), px=int(ttl * 1000))
+
+    def clear(self, prefix: str):
+        for key in self._client.scan_iter(match=prefix + "*"):
+            self._client.delete(key)
+
+
+def make_shared_backend(kind: str = CACHE_BACKEND):
+    """
+    Shared level selected by CACHE_BACKEND; None (in-process only) if it cannot be set up
+    """
+    if kind == "memory":
+        return None
+
+    try:
+        if kind == "sqlite":
+            return SQLiteBackend()
+        if kind == "redis":
+            return RedisBackend()
+    except Exception:
+        logger.warning("Shared cache backend '%s' unavailable, using in-process cache only", kind, exc_info=True)
+        return None
+
+    raise ValueError(f"Unknown CACHE_BACKEND '{kind}'")
+
+
+# -------- CACHE --------
+class _Flight:
+    """
+    One in-progress computation that concurrent callers wait on
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after `ttl` seconds
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl: float = CACHE_TTL,
+        shared=None
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
 
-CACHE_TTL = 300 #seconds (5 minutes = 300 seconds)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._async_flights: Dict[Hashable, asyncio.Task] = {}
 
-retrieval_cache = {}
-llm_cache = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
 
-def _is_valid(entry):
-    return (time.time() - entry["time"]) < CACHE_TTL
+    # -------- LOCAL LEVEL --------
+    def _get_local(self, key):
+        # Caller holds the lock
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
 
+        expires, value = entry
+        if expires <= time.time():
+            del self._data[key]
+            self.expired += 1
+            return _MISSING
+
+        self._data.move_to_end(key)
+        return value
+
+    def _set_local(self, key, value, expires):
+        # Caller holds the lock
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    # -------- SHARED LEVEL --------
+    def _get_shared(self, key):
+        if self.shared is None:
+            return _MISSING
+        try:
+            return self.shared.get(_shared_key(self.name, key))
+        except Exception:
+            logger.warning("Shared cache read failed (%s)", self.name, exc_info=True)
+            return _MISSING
+
+    def _set_shared(self, key, value):
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(_shared_key(self.name, key), value, self.ttl)
+        except Exception:
+            logger.warning("Shared cache write failed (%s)", self.name, exc_info=True)
+
+    # -------- PUBLIC API --------
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._get_local(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+        return self._shared_result(key, self._get_shared(key), default)
+
+    def _shared_result(self, key, value, default):
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+
+            self.shared_hits += 1
+            self._set_local(key, value, time.time() + self.ttl)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._set_local(key, value, time.time() + self.ttl)
+        self._set_shared(key, value)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        """
+        get for the event loop: the shared level (SQLite / Redis I/O) is read
+        on the default executor
+        """
+        with self._lock:
+            value = self._get_local(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+        value = _MISSING
+        if self.shared is not None:
+            value = await asyncio.get_running_loop().run_in_executor(None, self._get_shared, key)
+        return self._shared_result(key, value, default)
+
+    def aset(self, key: Hashable, value: Any):
+        """
+        set for the event loop: stored locally at once, written to the shared
+        level in the background (write errors are logged by _set_shared)
+        """
+        with self._lock:
+            self._set_local(key, value, time.time() + self.ttl)
+        if self.shared is not None:
+            asyncio.get_running_loop().run_in_executor(None, self._set_shared, key, value)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Cached value for `key`, computing it once if missing. Concurrent
+        callers for the same key wait for the first caller's result.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.set(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def aget_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        get_or_compute for coroutines; single-flight within the running event
+        loop. The computation runs as its own task, so a caller that is
+        cancelled (client disconnect) only stops waiting: the others still get
+        the result, and it is still cached.
+        """
+        value = await self.aget(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._async_flights.get(key)
+        if task is None:
+            async def run():
+                result = await compute()
+                self.aset(key, result)
+                return result
+
+            task = self._async_flights[key] = asyncio.ensure_future(run())
+
+            def finished(t):
+                del self._async_flights[key]
+                # Mark retrieved so a failure nobody awaited does not log a warning
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(finished)
+
+        return await asyncio.shield(task)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.shared is not None:
+            self.shared.clear(self.name + ":")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "inflight": len(self._flights) + len(self._async_flights),
+            }
+
+
+# -------- PROCESS-WIDE CACHES --------
+_shared = make_shared_backend()
+
+embedding_cache = TTLCache("embedding", ttl=int(os.getenv("EMBEDDING_CACHE_TTL", "3600")), shared=_shared)
+retrieval_cache = TTLCache("retrieval", shared=_shared)
+llm_cache = TTLCache("llm", shared=_shared)
+rerank_cache = TTLCache(
+    "rerank",
+    max_entries=int(os.getenv("RERANK_CACHE_SIZE", "8192")),
+    ttl=int(os.getenv("RERANK_CACHE_TTL", "3600")),
+    shared=_shared
+)
+translation_cache = TTLCache(
+    "translation",
+    max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "4096")),
+    ttl=int(os.getenv("TRANSLATION_CACHE_TTL", "86400")),
+    shared=_shared
+)
+
+CACHES = {c.name: c for c in (embedding_cache, retrieval_cache, llm_cache, rerank_cache, translation_cache)}
+
+
+def cache_stats() -> Dict:
+    return {name: c.stats() for name, c in CACHES.items()}
+
+
+# Backwards-compatible helpers
 def get_from_cache(cache, key):
-    if key in cache and _is_valid(cache[key]):
-        return cache[key]["value"]
-    return None
+    return cache.get(key)
+
 
 def set_cache(cache, key, value):
-    cache[key] = {
-        "value": value,
-        "time": time.time()
-    }
\ No newline at end of file
+    cache.set(key, value)
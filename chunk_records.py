@@ -0,0 +1,127 @@
+"""
+chunk_records.py
+
+Purpose:
+- One chunk record format shared by text_chunker, metadata_and_linking and the embedding stages
+- Written once by the chunker, streamed (optionally column-projected) by later stages
+
+Record fields:
+
+    chunk_id         "<source_document>:<page>:<n>"  (n = position of the chunk on its page)
+    source_document  PDF name without extension
+    page             page number from [PAGE_BREAK_n]
+    char_start       offset of the chunk in the cleaned page text
+    char_end         end offset (exclusive) in the cleaned page text
+    token_count      tokens as counted by the chunker
+    text             chunk text
+
+Files are JSONL by default (<doc>_chunks.jsonl). With CHUNK_FORMAT=parquet and
+pyarrow installed they are Parquet (<doc>_chunks.parquet), which lets readers
+skip the text column entirely.
+"""
+
+import os
+import json
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from ingest_manifest import atomic_write
+
+CHUNK_FORMAT = os.getenv("CHUNK_FORMAT", "jsonl")   # jsonl | parquet
+
+FIELDS = ["chunk_id", "source_document", "page", "char_start", "char_end", "token_count", "text"]
+SUFFIXES = {"jsonl": "_chunks.jsonl", "parquet": "_chunks.parquet"}
+
+PARQUET_BATCH_ROWS = 4096   # rows per read batch and per written row group
+
+TEXT_FIELDS = {"chunk_id", "source_document", "text"}
+
+
+def make_chunk_id(source_document: str, page: int, n: int) -> str:
+    return f"{source_document}:{page}:{n}"
+
+
+def chunk_file_name(source_document: str, fmt: str = CHUNK_FORMAT) -> str:
+    return source_document + SUFFIXES[fmt]
+
+
+def list_chunk_files(folder: str) -> List[str]:
+    """
+    Chunk files in a folder, sorted for a deterministic read order
+    """
+    return sorted(
+        os.path.join(folder, f)
+        for f in os.listdir(folder)
+        if f.endswith(tuple(SUFFIXES.values()))
+    )
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet chunk files need pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _parquet_schema(pa):
+    return pa.schema([(f, pa.string() if f in TEXT_FIELDS else pa.int64()) for f in FIELDS])
+
+
+# -------- WRITE --------
+def write_chunks(path: str, records: Iterable[Dict]) -> int:
+    """
+    Write chunk records; the format follows the file suffix. Returns the row
+    count. Records are streamed (Parquet: one row group per
+    PARQUET_BATCH_ROWS records). The file is replaced, never rewritten in
+    place (it may be hard-linked into earlier runs).
+    """
+    if path.endswith(".parquet"):
+        pa = _require_pyarrow()
+        schema = _parquet_schema(pa)
+        records = iter(records)
+        n = 0
+        with atomic_write(path) as tmp, pa.parquet.ParquetWriter(tmp, schema) as writer:
+            while True:
+                rows = list(islice(records, PARQUET_BATCH_ROWS))
+                if not rows:
+                    break
+                writer.write_table(pa.table({f: [r[f] for r in rows] for f in FIELDS}, schema=schema))
+                n += len(rows)
+        return n
+
+    n = 0
+    with atomic_write(path) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n")
+            n += 1
+    return n
+
+
+# -------- READ --------
+def iter_chunks(path: str, columns: Optional[List[str]] = None) -> Iterator[Dict]:
+    """
+    Stream chunk records, keeping only `columns` if given
+    """
+    if path.endswith(".parquet"):
+        pa = _require_pyarrow()
+        for batch in pa.parquet.ParquetFile(path).iter_batches(
+            batch_size=PARQUET_BATCH_ROWS, columns=columns
+        ):
+            yield from batch.to_pylist()
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if columns is not None:
+                record = {c: record[c] for c in columns}
+            yield record
+
+
+def iter_folder(folder: str, columns: Optional[List[str]] = None) -> Iterator[Dict]:
+    for path in list_chunk_files(folder):
+        yield from iter_chunks(path, columns)
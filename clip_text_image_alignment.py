@@ -1,64 +1,66 @@
 import os
-import json
-import torch
-from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
-from run_config import PATHS
+from embedding_store import EmbeddingStore, EMBED_STORE_DTYPE
+from ingest_manifest import IngestManifest, embed_incremental, file_hash, text_hash
+from run_config import PATHS, ensure_run_dirs
+from chunk_records import iter_folder
 
 CHUNK_FOLDER = PATHS["chunks"]
 IMAGE_FOLDER = PATHS["extracted_images"]
 OUTPUT_FOLDER = PATHS["embeddings"]
 
-TEXT_OUT = os.path.join(OUTPUT_FOLDER, "clip_text_embeddings.json")
-IMAGE_OUT = os.path.join(OUTPUT_FOLDER, "clip_image_embeddings.json")
+TEXT_OUT = os.path.join(OUTPUT_FOLDER, "clip_text_store")
+IMAGE_OUT = os.path.join(OUTPUT_FOLDER, "clip_image_store")
 
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
 
-text_embeddings = []
+def run():
+    ensure_run_dirs()
 
-for file in os.listdir(CHUNK_FOLDER):
-    if file.endswith("_chunks.txt"):
-        chunks = open(os.path.join(CHUNK_FOLDER, file), encoding="utf-8").read().split("--- CHUNK")[1:]
+    # CLIP (torch / transformers) is only imported when the stage actually runs
+    from embedding_engine import EmbeddingEngine
 
-        for i, ch in enumerate(chunks):
-            parts = ch.split("\n", 1)
-            if len(parts) < 2:
-                continue
+    engine = EmbeddingEngine()
+    manifest = IngestManifest()
 
-            text = parts[1].strip()
-            if not text:
-                continue
+    text_records = []
+    texts = []
 
-            inputs = processor(text=[text], return_tensors="pt", truncation=True)
-            with torch.no_grad():
-                emb = model.get_text_features(**inputs)
-                emb = emb / emb.norm(dim=-1, keepdim=True)
-
-            text_embeddings.append({
-                "source_file": file,
-                "chunk_id": i + 1,
-                "embedding": emb[0].tolist()
-            })
-
-json.dump(text_embeddings, open(TEXT_OUT, "w"), indent=4)
-
-image_embeddings = []
-
-for img in os.listdir(IMAGE_FOLDER):
-    if img.lower().endswith((".png", ".jpg", ".jpeg")):
-        image = Image.open(os.path.join(IMAGE_FOLDER, img)).convert("RGB")
-        inputs = processor(images=image, return_tensors="pt")
-
-        with torch.no_grad():
-            emb = model.get_image_features(**inputs)
-            emb = emb / emb.norm(dim=-1, keepdim=True)
-
-        image_embeddings.append({
-            "image_file": img,
-            "embedding": emb[0].tolist()
+    for record in iter_folder(CHUNK_FOLDER, columns=["chunk_id", "source_document", "text"]):
+        text_records.append({
+            "chunk_id": record["chunk_id"],
+            "source_document": record["source_document"]
         })
-
-json.dump(image_embeddings, open(IMAGE_OUT, "w"), indent=4)
-
-print("✔ CLIP embeddings generated")
+        texts.append(record["text"])
+
+    # Only chunks whose text was never embedded before go through the model
+    if texts:
+        text_store = EmbeddingStore(TEXT_OUT, dim=engine.dim, dtype=EMBED_STORE_DTYPE)
+        embed_incremental(
+            manifest, "text_embedding", text_store,
+            keys=[text_hash(t) for t in texts],
+            records=text_records,
+            compute=lambda idx: engine.texts([texts[i] for i in idx])
+        )
+
+    image_files = [
+        img for img in os.listdir(IMAGE_FOLDER)
+        if img.lower().endswith((".png", ".jpg", ".jpeg"))
+    ]
+    image_paths = [os.path.join(IMAGE_FOLDER, img) for img in image_files]
+
+    if image_files:
+        image_store = EmbeddingStore(IMAGE_OUT, dim=engine.dim, dtype=EMBED_STORE_DTYPE)
+        embed_incremental(
+            manifest, "image_embedding", image_store,
+            keys=[file_hash(p) for p in image_paths],
+            records=[{"image_file": img} for img in image_files],
+            compute=lambda idx: engine.images([image_paths[i] for i in idx])
+        )
+
+    manifest.save()
+    manifest.write_summary()
+
+    print("✔ CLIP embeddings generated")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,179 @@
+"""
+context_packer.py
+
+Purpose:
+- Turn retrieved items into the prompt context under a budget in model
+  tokens (CONTEXT_MAX_TOKENS), not characters
+- Drop near-duplicate chunks: Jaccard similarity of word shingles at or
+  above CONTEXT_DEDUP_THRESHOLD against an item already kept
+- Order by relevance (norm_score, else score, else retrieval order) and fill
+  the budget greedily with whole chunks; an item that does not fit is
+  skipped so smaller, less relevant ones can still use the remaining room
+- Report what was packed (tokens used, items kept / dropped) per request
+
+Tokens are counted with the tokenizer named by CONTEXT_TOKENIZER:
+
+    auto      the Hugging Face tokenizer in CONTEXT_TOKENIZER_MODEL (the
+              Llama 3.1 tokenizer of the default Groq model), falling back
+              to "estimate" if it cannot be loaded
+    estimate  ~4 characters per token, no dependencies
+    <name>    any Hugging Face tokenizer name
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ContextPacker")
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "900"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CONTEXT_SHINGLE_WORDS = int(os.getenv("CONTEXT_SHINGLE_WORDS", "3"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "auto")   # auto | estimate | <hf tokenizer name>
+CONTEXT_TOKENIZER_MODEL = os.getenv("CONTEXT_TOKENIZER_MODEL", "unsloth/Meta-Llama-3.1-8B-Instruct")
+
+SEPARATOR = "\n\n"
+CHARS_PER_TOKEN = 4
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+# -------- TOKEN COUNTING --------
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+_counter: Optional[Callable[[str], int]] = None
+_counter_lock = threading.Lock()
+
+
+def _load_counter(name: str) -> Callable[[str], int]:
+    if name == "estimate":
+        return estimate_tokens
+
+    model = CONTEXT_TOKENIZER_MODEL if name == "auto" else name
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model)
+    except Exception:
+        if name != "auto":
+            raise
+        logger.warning("Tokenizer '%s' unavailable, estimating context tokens", model, exc_info=True)
+        return estimate_tokens
+
+    def count(text):
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    return count
+
+
+def get_token_counter() -> Callable[[str], int]:
+    """
+    Token counter for CONTEXT_TOKENIZER, loaded once per process
+    """
+    global _counter
+
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = _load_counter(CONTEXT_TOKENIZER)
+
+    return _counter
+
+
+# -------- DEDUPLICATION --------
+def shingles(text: str, size: int = CONTEXT_SHINGLE_WORDS) -> frozenset:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# -------- PACKING --------
+def _relevance(item: Any) -> Tuple[int, float]:
+    if isinstance(item, dict):
+        for key in ("norm_score", "score"):
+            if item.get(key) is not None:
+                return 1, float(item[key])
+    return 0, 0.0
+
+
+def _leading_sentences(text: str, budget: int, count_tokens: Callable[[str], int]) -> str:
+    """
+    Longest run of leading sentences within budget ("" if not even the first fits)
+    """
+    kept = ""
+    for sentence in _SENTENCE_END.split(text):
+        candidate = f"{kept} {sentence}" if kept else sentence
+        if count_tokens(candidate) > budget:
+            break
+        kept = candidate
+    return kept
+
+
+def pack_context(
+    results: List[Any],
+    extract_text: Callable[[Any], str],
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+    count_tokens: Optional[Callable[[str], int]] = None
+) -> Tuple[str, Dict]:
+    """
+    (context, report) for retrieved items; report has tokens, budget, items,
+    packed, duplicates and over_budget counts
+    """
+    count_tokens = count_tokens or get_token_counter()
+    separator_tokens = count_tokens(SEPARATOR)
+
+    # Stable sort: items without scores keep their retrieval order
+    ranked = sorted(results, key=_relevance, reverse=True)
+
+    parts, kept_shingles = [], []
+    used, duplicates, over_budget = 0, 0, 0
+
+    for item in ranked:
+        text = extract_text(item)
+        if not text:
+            continue
+
+        item_shingles = shingles(text)
+        if any(jaccard(item_shingles, s) >= dedup_threshold for s in kept_shingles):
+            duplicates += 1
+            continue
+
+        cost = count_tokens(text) + (separator_tokens if parts else 0)
+        if used + cost > max_tokens:
+            over_budget += 1
+            continue
+
+        parts.append(text)
+        kept_shingles.append(item_shingles)
+        used += cost
+
+    # Nothing fit whole: use as many leading sentences of the best item as fit
+    if not parts and over_budget:
+        best = next(t for t in map(extract_text, ranked) if t)
+        head = _leading_sentences(best, max_tokens, count_tokens)
+        if head:
+            parts.append(head)
+            used = count_tokens(head)
+
+    report = {
+        "tokens": used,
+        "budget": max_tokens,
+        "items": len(results),
+        "packed": len(parts),
+        "duplicates": duplicates,
+        "over_budget": over_budget,
+    }
+    return SEPARATOR.join(parts), report
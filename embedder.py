@@ -0,0 +1,48 @@
+"""
+embedder.py
+
+Query-side text embedding for retrieval. Uses the same CLIP model as the
+ingestion embedding stage so queries and stored vectors share one space.
+The model is loaded on first use, not at import.
+"""
+
+import threading
+from typing import List
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from embedding_engine import EmbeddingEngine
+                _engine = EmbeddingEngine(batch_size=32)
+
+    return _engine
+
+
+def set_engine(engine):
+    """
+    Install a query encoder explicitly (benchmarks, tests); any object with
+    embed_texts(texts) -> list of L2-normalised vectors works
+    """
+    global _engine
+    _engine = engine
+
+
+def embed_query(query: str) -> List[float]:
+    """
+    L2-normalised CLIP text embedding of a single query
+    """
+    return get_engine().embed_texts([query])[0]
+
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Batched version of embed_query
+    """
+    return get_engine().embed_texts(list(queries))
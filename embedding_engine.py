@@ -0,0 +1,167 @@
+"""
+embedding_engine.py
+
+Purpose:
+- Load the CLIP model once and share it across text and image embedding
+- Embed in batches instead of one item per forward pass
+- Sort texts by length so each batch carries as little padding as possible
+- Optional bf16 autocast / int8 dynamic quantization for CPU inference
+
+Used by clip_text_image_alignment.py and image_text_matching.py.
+"""
+
+import os
+from typing import List, Optional
+
+import torch
+from PIL import Image
+from transformers import CLIPProcessor, CLIPModel
+
+# Configuration
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_DEVICE = os.getenv("EMBED_DEVICE", "auto")          # auto | cpu | cuda
+EMBED_PRECISION = os.getenv("EMBED_PRECISION", "fp32")    # fp32 | bf16 | int8
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS", "0"))  # 0 = torch default
+EMBED_MODE = os.getenv("EMBED_MODE", "batched")           # batched | per_item
+
+
+def _resolve_device(device: str) -> str:
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+class EmbeddingEngine:
+    """
+    Batched CLIP text/image embedder.
+
+    Embeddings are L2-normalised float32 tensors returned as Python lists,
+    in the same order as the inputs.
+    """
+
+    def __init__(
+        self,
+        model_name: str = CLIP_MODEL_NAME,
+        batch_size: int = EMBED_BATCH_SIZE,
+        device: str = EMBED_DEVICE,
+        precision: str = EMBED_PRECISION,
+        num_threads: int = EMBED_NUM_THREADS,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.device = _resolve_device(device)
+        self.precision = precision
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        model = CLIPModel.from_pretrained(model_name).eval()
+
+        if precision == "int8":
+            if self.device != "cpu":
+                raise ValueError("int8 dynamic quantization is only supported on CPU")
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+        self.model = model.to(self.device)
+        self.dim = self.model.config.projection_dim
+
+    def _autocast(self):
+        """
+        bf16 autocast on CPU / CUDA, no-op otherwise
+        """
+        # autocast takes the device type ("cuda"), not a device string ("cuda:0")
+        device_type = torch.device(self.device).type
+        if self.precision == "bf16":
+            return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+        return torch.autocast(device_type=device_type, enabled=False)
+
+    @staticmethod
+    def _normalize(emb: torch.Tensor) -> torch.Tensor:
+        emb = emb.float()
+        return emb / emb.norm(dim=-1, keepdim=True)
+
+    # -------- TEXT --------
+    def _encode_texts(self, texts: List[str]) -> torch.Tensor:
+        inputs = self.processor(
+            text=texts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True
+        ).to(self.device)
+
+        with torch.inference_mode(), self._autocast():
+            emb = self.model.get_text_features(**inputs)
+
+        return self._normalize(emb).cpu()
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in length-sorted batches, returned in input order
+        """
+        if not texts:
+            return []
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: List[Optional[List[float]]] = [None] * len(texts)
+
+        for start in range(0, len(order), self.batch_size):
+            batch_idx = order[start:start + self.batch_size]
+            emb = self._encode_texts([texts[i] for i in batch_idx])
+
+            for row, i in enumerate(batch_idx):
+                out[i] = emb[row].tolist()
+
+        return out
+
+    def embed_texts_per_item(self, texts: List[str]) -> List[List[float]]:
+        """
+        Original one-text-per-forward-pass path, kept for comparison
+        """
+        return [self._encode_texts([t])[0].tolist() for t in texts]
+
+    # -------- IMAGES --------
+    def _encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        inputs = self.processor(images=images, return_tensors="pt").to(self.device)
+
+        with torch.inference_mode(), self._autocast():
+            emb = self.model.get_image_features(**inputs)
+
+        return self._normalize(emb).cpu()
+
+    def embed_images(self, image_paths: List[str]) -> List[List[float]]:
+        """
+        Embed images in batches; only one batch of decoded images is held in memory
+        """
+        out = []
+
+        for start in range(0, len(image_paths), self.batch_size):
+            batch = [
+                Image.open(p).convert("RGB")
+                for p in image_paths[start:start + self.batch_size]
+            ]
+            out.extend(self._encode_images(batch).tolist())
+
+        return out
+
+    def embed_images_per_item(self, image_paths: List[str]) -> List[List[float]]:
+        """
+        Original one-image-per-forward-pass path, kept for comparison
+        """
+        return [
+            self._encode_images([Image.open(p).convert("RGB")])[0].tolist()
+            for p in image_paths
+        ]
+
+    # -------- DISPATCH --------
+    def texts(self, texts: List[str], mode: str = EMBED_MODE) -> List[List[float]]:
+        if mode == "per_item":
+            return self.embed_texts_per_item(texts)
+        return self.embed_texts(texts)
+
+    def images(self, image_paths: List[str], mode: str = EMBED_MODE) -> List[List[float]]:
+        if mode == "per_item":
+            return self.embed_images_per_item(image_paths)
+        return self.embed_images(image_paths)
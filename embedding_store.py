@@ -0,0 +1,187 @@
+"""
+embedding_store.py
+
+Purpose:
+- Store embeddings as one contiguous float32 (or float16) matrix on disk
+- Open it with np.memmap so readers only touch the rows they need
+- Keep a compact JSONL sidecar mapping each row to chunk_id / source_document / image_file
+  (and, for pipeline stores, the content_hash it was embedded for)
+- Append rows without rewriting what is already stored
+- Convert the old clip_*_embeddings.json outputs
+
+On-disk layout of a store directory:
+
+    vectors.bin   raw row-major matrix, no header
+    index.jsonl   one JSON record per row
+    meta.json     {"dim", "dtype", "count", "index_bytes"}
+
+meta.json is written last on every append, so a crash mid-append leaves
+the previous state intact; the stray bytes are truncated on the next append.
+"""
+
+import os
+import json
+import argparse
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+VECTORS_FILE = "vectors.bin"
+INDEX_FILE = "index.jsonl"
+META_FILE = "meta.json"
+
+SUPPORTED_DTYPES = ("float32", "float16")
+EMBED_STORE_DTYPE = os.getenv("EMBED_STORE_DTYPE", "float32")
+
+
+class EmbeddingStore:
+    """
+    Append-only, memory-mappable embedding matrix with a row index
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None, dtype: str = "float32"):
+        self.path = path
+        self._vectors_path = os.path.join(path, VECTORS_FILE)
+        self._index_path = os.path.join(path, INDEX_FILE)
+        self._meta_path = os.path.join(path, META_FILE)
+        self._records: Optional[List[Dict]] = None
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            if dim is not None and dim != self.meta["dim"]:
+                raise ValueError(
+                    f"Store {path} has dim={self.meta['dim']}, got dim={dim}"
+                )
+        else:
+            if dim is None:
+                raise FileNotFoundError(f"No embedding store at {path} (pass dim to create one)")
+            if dtype not in SUPPORTED_DTYPES:
+                raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}")
+
+            os.makedirs(path, exist_ok=True)
+            self.meta = {"dim": dim, "dtype": dtype, "count": 0, "index_bytes": 0}
+            self._write_meta()
+
+    # -------- PROPERTIES --------
+    @property
+    def dim(self) -> int:
+        return self.meta["dim"]
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.meta["dtype"])
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def _write_meta(self):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path)
+
+    # -------- WRITE --------
+    def append(self, vectors, records: Iterable[Dict]):
+        """
+        Append rows and their index records
+        """
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        records = list(records)
+
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected dim={self.dim}, got {vectors.shape[1]}")
+        if len(records) != vectors.shape[0]:
+            raise ValueError("vectors and records must have the same length")
+        if not records:
+            return
+
+        row_bytes = self.dim * self.dtype.itemsize
+
+        mode = "r+b" if os.path.exists(self._vectors_path) else "wb"
+        with open(self._vectors_path, mode) as f:
+            f.seek(len(self) * row_bytes)
+            f.write(np.ascontiguousarray(vectors).tobytes())
+            f.truncate()
+
+        encoded = "".join(
+            json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for r in records
+        ).encode("utf-8")
+
+        mode = "r+b" if os.path.exists(self._index_path) else "wb"
+        with open(self._index_path, mode) as f:
+            f.seek(self.meta["index_bytes"])
+            f.write(encoded)
+            f.truncate()
+
+        self.meta["count"] += len(records)
+        self.meta["index_bytes"] += len(encoded)
+        self._write_meta()
+
+        if self._records is not None:
+            self._records.extend(records)
+
+    # -------- READ --------
+    def vectors(self) -> np.ndarray:
+        """
+        Read-only memory-mapped (count, dim) matrix
+        """
+        if len(self) == 0:
+            return np.empty((0, self.dim), dtype=self.dtype)
+
+        return np.memmap(
+            self._vectors_path,
+            dtype=self.dtype,
+            mode="r",
+            shape=(len(self), self.dim)
+        )
+
+    def records(self) -> List[Dict]:
+        """
+        Row index records, in row order
+        """
+        if self._records is None:
+            self._records = []
+            if len(self):
+                with open(self._index_path, "rb") as f:
+                    data = f.read(self.meta["index_bytes"])
+                self._records = [json.loads(line) for line in data.splitlines()]
+        return self._records
+
+
+# -------- CONVERSION --------
+def convert_json(json_path: str, store_path: str, dtype: str = "float32") -> EmbeddingStore:
+    """
+    Convert a clip_*_embeddings.json file into an embedding store
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    if not items:
+        raise ValueError(f"{json_path} contains no embeddings")
+
+    dim = len(items[0]["embedding"])
+    store = EmbeddingStore(store_path, dim=dim, dtype=dtype)
+
+    vectors = np.array([item["embedding"] for item in items], dtype=dtype)
+    records = [
+        {k: v for k, v in item.items() if k != "embedding"}
+        for item in items
+    ]
+    store.append(vectors, records)
+
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSON embeddings to an embedding store")
+    parser.add_argument("json_path")
+    parser.add_argument("store_path")
+    parser.add_argument("--dtype", default="float32", choices=SUPPORTED_DTYPES)
+    args = parser.parse_args()
+
+    store = convert_json(args.json_path, args.store_path, args.dtype)
+    print(f"✔ Converted {len(store)} embeddings → {args.store_path}")
@@ -1,8 +1,9 @@
+import json
 import streamlit as st
 import requests
 
 # Backend API URL
-API_URL = "http://127.0.0.1:8000/ask"
+STREAM_API_URL = "http://127.0.0.1:8000/ask/stream"
 
 st.set_page_config(
     page_title="JW Infotech Multimodal RAG",
@@ -19,25 +20,52 @@ question = st.text_input(
     placeholder="e.g. Explain the wiring diagram"
 )
 
+
+def show_sources(sources):
+    with st.expander(f"Sources ({len(sources)})"):
+        for src in sources:
+            if src.get("image_path"):
+                st.write(f"🖼️ {src['image_path']}")
+            else:
+                st.write(src.get("text", ""))
+
+
 # Ask button
 if st.button("Ask AI"):
     if not question.strip():
         st.warning("Please enter a question.")
     else:
-        with st.spinner("Thinking..."):
-            try:
-                response = requests.post(
-                    API_URL,
-                    json={"question": question},
-                    timeout=60
-                )
-
-                if response.status_code == 200:
-                    answer = response.json()["answer"]
-                    st.success("Answer:")
-                    st.write(answer)
-                else:
+        try:
+            # (connect timeout, read timeout between streamed lines)
+            with requests.post(
+                STREAM_API_URL,
+                json={"question": question},
+                stream=True,
+                timeout=(5, 60)
+            ) as response:
+
+                if response.status_code != 200:
                     st.error(f"Backend error: {response.status_code}")
+                else:
+                    st.success("Answer:")
+                    placeholder = st.empty()
+                    placeholder.write("Thinking...")
+                    answer = ""
+
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line:
+                            continue
+                        event = json.loads(line)
+
+                        if event["type"] == "sources":
+                            show_sources(event["sources"])
+                        elif event["type"] == "token":
+                            answer += event["text"]
+                            placeholder.markdown(answer + "▌")
+                        elif event["type"] == "error":
+                            st.error(f"Backend error: {event.get('detail')}")
+
+                    placeholder.markdown(answer)
 
-            except Exception as e:
-                st.error(f"Connection failed: {e}")
+        except Exception as e:
+            st.error(f"Connection failed: {e}")
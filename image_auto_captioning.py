@@ -1,53 +1,260 @@
+"""
+image_auto_captioning.py
+
+Purpose:
+- Caption the run's extracted images with BLIP
+- Generate in batches with bounded, configurable decoding
+  (CAPTION_MAX_NEW_TOKENS, CAPTION_NUM_BEAMS)
+- Load and decode images on a background thread while the model runs
+- Append captions to captions/image_captions.jsonl batch by batch; a rerun
+  skips images already in the file, so an interrupted run resumes
+- Cache captions in the ingest manifest by image content hash (+ model and
+  decoding settings): identical images are captioned once, in this run or
+  any earlier one
+
+Output lines: {"image_file", "caption", "content_hash"}
+"""
+
 import os
 import json
-from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
+import queue
+import threading
+from collections import defaultdict
+from typing import Dict, Iterator, List, Set, Tuple
+
+from run_config import PATHS, ensure_run_dirs
+from ingest_manifest import IngestManifest, file_hash, text_hash
 
 # -----------------------------
 # PATH CONFIGURATION
 # -----------------------------
-IMAGE_FOLDER = "data/extracted_images"
-OUTPUT_FOLDER = "data/captions"
+IMAGE_FOLDER = PATHS["extracted_images"]
+OUTPUT_FOLDER = PATHS["captions"]
+
+CAPTION_OUTPUT = os.path.join(OUTPUT_FOLDER, "image_captions.jsonl")
 
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+# -----------------------------
+# CAPTIONING CONFIGURATION
+# -----------------------------
+BLIP_MODEL_NAME = os.getenv("CAPTION_MODEL_NAME", "Salesforce/blip-image-captioning-base")
+CAPTION_BATCH_SIZE = int(os.getenv("CAPTION_BATCH_SIZE", "8"))
+CAPTION_MAX_NEW_TOKENS = int(os.getenv("CAPTION_MAX_NEW_TOKENS", "30"))
+CAPTION_NUM_BEAMS = int(os.getenv("CAPTION_NUM_BEAMS", "1"))
+CAPTION_PREFETCH_BATCHES = int(os.getenv("CAPTION_PREFETCH_BATCHES", "2"))
+CAPTION_DEVICE = os.getenv("CAPTION_DEVICE", "auto")  # auto | cpu | cuda
 
-CAPTION_OUTPUT = os.path.join(OUTPUT_FOLDER, "image_captions.json")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
 
 # -----------------------------
-# LOAD BLIP MODEL
+# LOAD BLIP MODEL (on first use)
 # -----------------------------
-processor = BlipProcessor.from_pretrained(
-    "Salesforce/blip-image-captioning-base"
-)
-model = BlipForConditionalGeneration.from_pretrained(
-    "Salesforce/blip-image-captioning-base"
-)
+_blip = None
+_blip_lock = threading.Lock()
+
+
+def get_blip():
+    """
+    (processor, model, device), loaded once per process on first call
+    """
+    global _blip
+
+    if _blip is None:
+        with _blip_lock:
+            if _blip is None:
+                import torch
+                from transformers import BlipProcessor, BlipForConditionalGeneration
+
+                device = CAPTION_DEVICE
+                if device == "auto":
+                    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+                processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+                model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME).eval().to(device)
+                _blip = (processor, model, device)
+
+    return _blip
+
+
+def caption_settings() -> str:
+    """
+    Everything that changes the caption text; part of the cache key
+    """
+    return f"{BLIP_MODEL_NAME}:{CAPTION_MAX_NEW_TOKENS}:{CAPTION_NUM_BEAMS}"
+
+
+def caption_images(images) -> List[str]:
+    """
+    One batched generate() over PIL images
+    """
+    import torch
+
+    processor, model, device = get_blip()
+    inputs = processor(images=images, return_tensors="pt").to(device)
+
+    with torch.inference_mode():
+        output = model.generate(
+            **inputs,
+            max_new_tokens=CAPTION_MAX_NEW_TOKENS,
+            num_beams=CAPTION_NUM_BEAMS,
+        )
+
+    return [c.strip() for c in processor.batch_decode(output, skip_special_tokens=True)]
+
+
+# -----------------------------
+# PREFETCHING LOADER
+# -----------------------------
+def prefetch_batches(
+    items: List[Tuple[str, str]],
+    batch_size: int = CAPTION_BATCH_SIZE,
+    prefetch: int = CAPTION_PREFETCH_BATCHES
+) -> Iterator[List[Tuple[str, object]]]:
+    """
+    Batches of (key, RGB image) for (key, path) items, decoded on a
+    background thread at most `prefetch` batches ahead of the consumer
+    """
+    from PIL import Image
+
+    batches = queue.Queue(maxsize=max(1, prefetch))
+    done = object()
+    stop = threading.Event()
+
+    def load():
+        try:
+            for start in range(0, len(items), batch_size):
+                if stop.is_set():
+                    return
+                batch = []
+                for key, path in items[start:start + batch_size]:
+                    with Image.open(path) as image:
+                        batch.append((key, image.convert("RGB")))
+                batches.put(batch)
+        except BaseException as e:
+            batches.put(e)
+        finally:
+            batches.put(done)
+
+    thread = threading.Thread(target=load, name="caption-prefetch", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+    finally:
+        # Consumer stopped early: let the loader exit instead of blocking on put()
+        stop.set()
+        while thread.is_alive():
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                thread.join(0.05)
+
+
+# -----------------------------
+# RESUMABLE OUTPUT
+# -----------------------------
+def load_done(path: str) -> Set[str]:
+    """
+    Image files already captioned in the output; repairs a torn last line
+    left by a crash so appends start on a clean line
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+
+    for line in data[:end].splitlines():
+        if line.strip():
+            done.add(json.loads(line)["image_file"])
+
+    return done
+
+
+def _append(out, records: List[Dict]):
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+    os.fsync(out.fileno())
+
 
 # -----------------------------
 # GENERATE CAPTIONS
 # -----------------------------
-captions = []
+def run(image_folder=IMAGE_FOLDER, output_path=CAPTION_OUTPUT):
+    ensure_run_dirs()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-for image_file in os.listdir(IMAGE_FOLDER):
-    if image_file.lower().endswith((".png", ".jpg", ".jpeg")):
-        image_path = os.path.join(IMAGE_FOLDER, image_file)
-        image = Image.open(image_path).convert("RGB")
+    manifest = IngestManifest()
+    settings = caption_settings()
+    done = load_done(output_path)
 
-        inputs = processor(image, return_tensors="pt")
-        output = model.generate(**inputs)
+    image_files = sorted(
+        f for f in os.listdir(image_folder)
+        if f.lower().endswith(IMAGE_EXTS) and f not in done
+    )
+    if done:
+        print(f"↺ Resuming: {len(done)} images already captioned")
 
-        caption = processor.decode(
-            output[0],
-            skip_special_tokens=True
-        )
+    # Identical images (same bytes, same settings) share one key and one generate()
+    by_key = defaultdict(list)
+    for image_file in image_files:
+        content = file_hash(os.path.join(image_folder, image_file))
+        by_key[text_hash(f"{content}:{settings}")].append((image_file, content))
+
+    def records(key, caption):
+        return [
+            {"image_file": image_file, "caption": caption, "content_hash": content}
+            for image_file, content in by_key[key]
+        ]
+
+    pending = []
+
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            # Captions from earlier runs (or other names of the same image)
+            reused = []
+            for key, files in by_key.items():
+                cached = manifest.lookup("caption", key)
+                if cached is None:
+                    pending.append((key, os.path.join(image_folder, files[0][0])))
+                    manifest.mark("caption", reused=True, n=len(files) - 1)
+                else:
+                    reused.extend(records(key, cached["caption"]))
+                    manifest.mark("caption", reused=True, n=len(files))
+            _append(out, reused)
+
+            captioned = 0
+            for batch in prefetch_batches(pending):
+                captions = caption_images([image for _, image in batch])
+
+                lines = []
+                for (key, _), caption in zip(batch, captions):
+                    manifest.record("caption", key, {"caption": caption})
+                    lines.extend(records(key, caption))
+                _append(out, lines)
+
+                manifest.mark("caption", reused=False, n=len(batch))
+                captioned += len(batch)
+                print(f"  captioned {captioned}/{len(pending)}")
+    finally:
+        # Keep the cache for whatever finished, even if the run was interrupted
+        manifest.save()
 
-        captions.append({
-            "image_file": image_file,
-            "caption": caption
-        })
+    manifest.write_summary()
+    print(f"✔ Image captions → {output_path} ({len(image_files)} new, {len(pending)} generated)")
 
-# Save captions
-with open(CAPTION_OUTPUT, "w", encoding="utf-8") as f:
-    json.dump(captions, f, indent=4)
 
-print("Image auto-captions generated successfully.")
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,245 @@
+"""
+ingest_manifest.py
+
+Purpose:
+- Persistent manifest (data/manifest.json) shared by every pipeline run
+- Key every artifact by the content hash of its input (PDF, page, image, chunk text)
+- Let each stage reuse artifacts from earlier runs when the input is unchanged
+- Report per-stage reused / recomputed counts in the run's run_summary.json
+
+Reused files are hard-linked between runs, so artifacts must never be
+rewritten in place (that would change every run sharing the inode): stages
+write them through atomic_write, which replaces the file with a new one.
+
+Stages and their keys:
+
+    pdf              sha256 of the PDF file        -> text file + extracted images
+    page             sha256 of the page text        -> page number in its PDF
+                                                       (reporting only: unchanged vs changed pages)
+    image            sha256 of the raw image bytes  -> extracted image file
+    chunks           sha256 of the extracted text   -> chunk file
+                     (+ chunker settings)
+    text_embedding   sha256 of the chunk text       -> (store path, row)
+    image_embedding  sha256 of the image file       -> (store path, row)
+    caption          sha256 of the image file       -> {"caption": text}
+                     (+ caption model and decoding settings)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from run_config import BASE_RUN_DIR, RUN_ID
+from embedding_store import EmbeddingStore
+
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST", os.path.join("data", "manifest.json"))
+SUMMARY_FILE = "run_summary.json"
+
+_HASH_BLOCK = 1 << 20
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def bytes_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return bytes_hash(text.encode("utf-8"))
+
+
+@contextmanager
+def atomic_write(path: str):
+    """
+    Yield a temporary path to write instead of `path`; on success it replaces
+    `path` as a new file, so a hard-linked earlier artifact is left untouched
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    Hard-link an earlier run's artifact into this run, copying across
+    filesystems. The link shares the inode: write over it with atomic_write only.
+    """
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _artifact_paths(artifact: Any) -> List[str]:
+    """
+    File paths referenced by an artifact, used to check it still exists
+    """
+    if isinstance(artifact, str):
+        return [artifact]
+    if isinstance(artifact, dict):
+        paths = []
+        for key in ("path", "text_file", "chunk_file", "store"):
+            if key in artifact:
+                paths.append(artifact[key])
+        for p in artifact.get("images", []):
+            paths.append(p)
+        return paths
+    return []
+
+
+class IngestManifest:
+    """
+    Content-hash keyed artifact registry with per-stage reuse counters
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        self.counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"reused": 0, "recomputed": 0})
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for stage, items in json.load(f).items():
+                    self.entries[stage] = items
+
+    # -------- LOOKUP / RECORD --------
+    def lookup(self, stage: str, key: str) -> Optional[Any]:
+        """
+        Return the stored artifact if all of its files still exist, else None
+        """
+        artifact = self.entries[stage].get(key)
+        if artifact is None:
+            return None
+        if not all(os.path.exists(p) for p in _artifact_paths(artifact)):
+            return None
+        return artifact
+
+    def record(self, stage: str, key: str, artifact: Any):
+        self.entries[stage][key] = artifact
+
+    def mark(self, stage: str, reused: bool, n: int = 1):
+        self.counts[stage]["reused" if reused else "recomputed"] += n
+
+    # -------- PERSISTENCE --------
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        return {stage: dict(c) for stage, c in self.counts.items()}
+
+    def write_summary(self):
+        """
+        Merge this process's counters into the run's run_summary.json and print them
+        """
+        summary_path = os.path.join(BASE_RUN_DIR, SUMMARY_FILE)
+        merged = {"run_id": RUN_ID, "stages": {}}
+
+        if os.path.exists(summary_path):
+            with open(summary_path, "r", encoding="utf-8") as f:
+                merged = json.load(f)
+
+        merged["stages"].update(self.summary())
+
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=4)
+
+        for stage, c in self.summary().items():
+            print(f"↺ {stage}: reused={c['reused']} recomputed={c['recomputed']}")
+
+
+# -------- EMBEDDING REUSE --------
+# Row record field holding the manifest key the row was embedded for
+ROW_KEY_FIELD = "content_hash"
+
+
+def _row_id(record: Dict) -> str:
+    return json.dumps({k: v for k, v in record.items() if k != ROW_KEY_FIELD}, sort_keys=True)
+
+
+def embed_incremental(
+    manifest: IngestManifest,
+    stage: str,
+    store,
+    keys: List[str],
+    records: List[Dict],
+    compute: Callable[[List[int]], List[List[float]]],
+):
+    """
+    Append one row per key to `store`, copying vectors recorded in earlier runs
+    and calling compute(indices) only for keys that have never been embedded.
+
+    Each row's record also stores its key, so rows the store already holds
+    (same record, same key: the stage run again with the same
+    PIPELINE_RUN_ID) are kept as they are instead of being appended again.
+    """
+    if not keys:
+        return
+
+    present = {(r.get(ROW_KEY_FIELD), _row_id(r)): row for row, r in enumerate(store.records())}
+
+    todo = []
+    for i, (key, record) in enumerate(zip(keys, records)):
+        row = present.get((key, _row_id(record)))
+        if row is None:
+            todo.append(i)
+        else:
+            manifest.record(stage, key, {"store": store.path, "row": row})
+
+    manifest.mark(stage, reused=True, n=len(keys) - len(todo))
+
+    vectors: List[Any] = [None] * len(todo)
+    missing = []
+    open_stores = {}
+
+    for j, i in enumerate(todo):
+        artifact = manifest.lookup(stage, keys[i])
+        if artifact is None:
+            missing.append(j)
+            continue
+
+        src = open_stores.get(artifact["store"])
+        if src is None:
+            src = open_stores[artifact["store"]] = EmbeddingStore(artifact["store"]).vectors()
+        if artifact["row"] >= len(src):
+            missing.append(j)
+            continue
+
+        vectors[j] = src[artifact["row"]]
+
+    manifest.mark(stage, reused=True, n=len(todo) - len(missing))
+    manifest.mark(stage, reused=False, n=len(missing))
+
+    if missing:
+        for j, vec in zip(missing, compute([todo[j] for j in missing])):
+            vectors[j] = vec
+
+    if not todo:
+        return
+
+    start = len(store)
+    store.append(vectors, [dict(records[i], **{ROW_KEY_FIELD: keys[i]}) for i in todo])
+
+    for offset, i in enumerate(todo):
+        manifest.record(stage, keys[i], {"store": store.path, "row": start + offset})
@@ -0,0 +1,364 @@
+"""
+language_utils.py
+
+Purpose:
+- normalize_question(question) -> (English question, language code) and
+  translate_answer(answer, language) for rag_pipeline
+- Fast local language detection: Unicode script ranges for non-Latin
+  scripts, stopword counts for Latin ones, optionally a fastText language-ID
+  model (FASTTEXT_LID_MODEL) for Latin text that is not clearly English
+- English short-circuits: no translation call at all, in either direction
+- Translations are cached (cache.translation_cache, bounded LRU + TTL) by
+  (text hash, source, target language), so repeated questions and repeated
+  answers (fallback / degraded messages, answer-cache hits) cost nothing
+- Batch API (normalize_questions, translate_answers, translate_batch): cache
+  misses are translated in one call per language pair
+
+Translation backend (TRANSLATION_BACKEND):
+
+    llm      the configured LLM provider (llm_providers.get_llm)
+    marian   local Helsinki-NLP opus-mt models via transformers, one batched
+             generate() per language pair
+    none     no translation; questions are searched as asked
+
+Translation failures are logged and the text is returned untranslated, so
+they never fail a request.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from cache import translation_cache
+
+logger = logging.getLogger("LanguageUtils")
+
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "llm")    # llm | marian | none
+FASTTEXT_LID_MODEL = os.getenv("FASTTEXT_LID_MODEL")             # path to lid.176.ftz, optional
+MARIAN_MODEL_PATTERN = os.getenv("MARIAN_MODEL_PATTERN", "Helsinki-NLP/opus-mt-{src}-{tgt}")
+MARIAN_MAX_MODELS = int(os.getenv("MARIAN_MAX_MODELS", "4"))
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "4"))
+# Deadline for one llm-backend translation call, no retries; keep it within
+# the pipeline's translation stage timeout (RAG_TRANSLATION_TIMEOUT)
+TRANSLATION_TIMEOUT = float(os.getenv("TRANSLATION_TIMEOUT", os.getenv("RAG_TRANSLATION_TIMEOUT", "10")))
+
+ENGLISH = "en"
+
+LANGUAGE_NAMES = {
+    "en": "English", "hi": "Hindi", "bn": "Bengali", "ta": "Tamil", "te": "Telugu",
+    "kn": "Kannada", "ml": "Malayalam", "gu": "Gujarati", "pa": "Punjabi", "mr": "Marathi",
+    "ar": "Arabic", "ru": "Russian", "el": "Greek", "he": "Hebrew", "th": "Thai",
+    "ja": "Japanese", "ko": "Korean", "zh": "Chinese", "es": "Spanish", "fr": "French",
+    "de": "German", "pt": "Portuguese", "it": "Italian", "nl": "Dutch",
+}
+
+# -------- DETECTION --------
+# (first code point, last code point, language); kana is checked before CJK
+# ideographs so Japanese is not reported as Chinese
+_SCRIPTS = [
+    (0x3040, 0x30FF, "ja"), (0xAC00, 0xD7AF, "ko"), (0x4E00, 0x9FFF, "zh"),
+    (0x0900, 0x097F, "hi"), (0x0980, 0x09FF, "bn"), (0x0A00, 0x0A7F, "pa"),
+    (0x0A80, 0x0AFF, "gu"), (0x0B80, 0x0BFF, "ta"), (0x0C00, 0x0C7F, "te"),
+    (0x0C80, 0x0CFF, "kn"), (0x0D00, 0x0D7F, "ml"), (0x0600, 0x06FF, "ar"),
+    (0x0400, 0x04FF, "ru"), (0x0370, 0x03FF, "el"), (0x0590, 0x05FF, "he"),
+    (0x0E00, 0x0E7F, "th"),
+]
+
+_STOPWORDS = {
+    "en": "the a an and or of to in on for is are was be it this that with how what why when where "
+          "do does can i my you your which should not from at by".split(),
+    "es": "el la los las de del y que en un una es por para con como se no cuando donde qué cómo".split(),
+    "fr": "le la les de des du et que en un une est pour avec comment quand où ne pas je dans".split(),
+    "de": "der die das und ist nicht ein eine zu mit wie wann wo ich den dem im für auf".split(),
+    "pt": "o a os as de do da e que em um uma é para com como quando onde não se".split(),
+    "it": "il lo la gli le di e che un una è per con come quando dove non si del".split(),
+    "nl": "de het een en van is niet met hoe wanneer waar ik op voor te".split(),
+}
+_STOPWORDS = {lang: frozenset(words) for lang, words in _STOPWORDS.items()}
+
+_WORD = re.compile(r"[^\W\d_]+")
+MIN_STOPWORD_HITS = 2
+
+_fasttext = None
+_fasttext_lock = threading.Lock()
+
+
+def _script_language(text: str) -> Optional[str]:
+    """
+    Language of the dominant non-Latin script, if non-Latin letters make up
+    at least a third of the letters
+    """
+    counts = Counter()
+    letters = 0
+    for ch in text:
+        if not ch.isalpha():
+            continue
+        letters += 1
+        code = ord(ch)
+        if code < 0x0370:
+            continue
+        for first, last, lang in _SCRIPTS:
+            if first <= code <= last:
+                counts[lang] += 1
+                break
+
+    if not counts or sum(counts.values()) * 3 < letters:
+        return None
+    if counts["ja"]:
+        return "ja"
+    return counts.most_common(1)[0][0]
+
+
+def _fasttext_language(text: str) -> Optional[str]:
+    global _fasttext
+
+    if not FASTTEXT_LID_MODEL:
+        return None
+    if _fasttext is None:
+        with _fasttext_lock:
+            if _fasttext is None:
+                import fasttext
+                _fasttext = fasttext.load_model(FASTTEXT_LID_MODEL)
+
+    labels, _ = _fasttext.predict(text.replace("\n", " "))
+    return labels[0].replace("__label__", "") if labels else None
+
+
+def detect_language(text: str) -> str:
+    """
+    ISO 639-1 code; text without clear evidence (part numbers, short
+    keyword queries) counts as English
+    """
+    script = _script_language(text)
+    if script:
+        return script
+
+    words = _WORD.findall(text.lower())
+    if not words:
+        return ENGLISH
+
+    hits = {lang: sum(w in stopwords for w in words) for lang, stopwords in _STOPWORDS.items()}
+    best = max(hits, key=hits.get)
+
+    # Fast path: at least as much English evidence as anything else, or too
+    # little of any language to go on (a stray "e" in "E-203 error fix")
+    if hits[ENGLISH] >= hits[best] or hits[best] < MIN_STOPWORD_HITS:
+        return ENGLISH
+
+    try:
+        detected = _fasttext_language(text)
+    except Exception:
+        logger.warning("fastText language ID failed, using stopword counts", exc_info=True)
+        detected = None
+
+    return detected or best
+
+
+def is_english(lang: Optional[str]) -> bool:
+    return lang in (None, "", ENGLISH)
+
+
+# -------- TRANSLATION BACKENDS --------
+Translator = Callable[[List[str], str, str], List[str]]
+
+_pool = ThreadPoolExecutor(max_workers=TRANSLATION_WORKERS, thread_name_prefix="translate")
+
+
+def _llm_translate(texts: List[str], source: str, target: str) -> List[str]:
+    """
+    One prompt per text, sent concurrently (providers that batch, batch them).
+    The whole call, queueing included, has TRANSLATION_TIMEOUT seconds and
+    no retries, instead of the provider's own timeout and retry policy.
+    """
+    from llm_providers import get_llm
+
+    llm = get_llm()
+    if llm is None:
+        raise RuntimeError("No LLM provider available for translation")
+
+    source_name = LANGUAGE_NAMES.get(source, source)
+    target_name = LANGUAGE_NAMES.get(target, target)
+
+    deadline = time.perf_counter() + TRANSLATION_TIMEOUT
+
+    def one(text):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise TimeoutError(f"Translation deadline of {TRANSLATION_TIMEOUT}s exceeded")
+        prompt = (
+            f"Translate the following {source_name} text to {target_name}. "
+            f"Keep part numbers, error codes and model names unchanged. "
+            f"Reply with the translation only.\n\n{text}"
+        )
+        return llm.complete(prompt, timeout=remaining, retries=0)
+
+    return list(_pool.map(one, texts))
+
+
+_marian = OrderedDict()
+_marian_lock = threading.Lock()
+
+
+def _marian_model(source: str, target: str):
+    name = MARIAN_MODEL_PATTERN.format(src=source, tgt=target)
+    with _marian_lock:
+        if name in _marian:
+            _marian.move_to_end(name)
+            return _marian[name]
+
+        from transformers import MarianMTModel, MarianTokenizer
+        loaded = (MarianTokenizer.from_pretrained(name), MarianMTModel.from_pretrained(name).eval())
+
+        _marian[name] = loaded
+        while len(_marian) > MARIAN_MAX_MODELS:
+            _marian.popitem(last=False)
+        return loaded
+
+
+def _marian_translate(texts: List[str], source: str, target: str) -> List[str]:
+    import torch
+
+    tokenizer, model = _marian_model(source, target)
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+    with torch.inference_mode():
+        output = model.generate(**inputs)
+    return tokenizer.batch_decode(output, skip_special_tokens=True)
+
+
+def _no_translate(texts: List[str], source: str, target: str) -> List[str]:
+    return list(texts)
+
+
+BACKENDS = {"llm": _llm_translate, "marian": _marian_translate, "none": _no_translate}
+
+_translator: Optional[Translator] = None
+
+
+def get_translator() -> Translator:
+    if _translator is not None:
+        return _translator
+    if TRANSLATION_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown TRANSLATION_BACKEND '{TRANSLATION_BACKEND}'")
+    return BACKENDS[TRANSLATION_BACKEND]
+
+
+def set_translator(translator: Optional[Translator]):
+    """
+    Install a translator(texts, source, target) explicitly (benchmarks,
+    tests); None restores TRANSLATION_BACKEND
+    """
+    global _translator
+    _translator = translator
+
+
+# -------- CACHED TRANSLATION --------
+def _cache_key(text: str, source: str, target: str) -> Tuple[str, str, str]:
+    return (hashlib.sha1(text.encode("utf-8")).hexdigest(), source, target)
+
+
+def translate_batch(texts: List[str], target: str, source: Optional[str] = None) -> List[str]:
+    """
+    Translate texts to target; cached texts are reused, the rest go to the
+    backend in one call per source language. Failed texts come back unchanged.
+    """
+    out = list(texts)
+    missing = {}   # source -> [positions]
+
+    for i, text in enumerate(texts):
+        src = source or detect_language(text)
+        if not text.strip() or src == target:
+            continue
+        cached = translation_cache.get(_cache_key(text, src, target))
+        if cached is None:
+            missing.setdefault(src, []).append(i)
+        else:
+            out[i] = cached
+
+    for src, positions in missing.items():
+        # Identical texts are translated once
+        unique = list(dict.fromkeys(texts[i] for i in positions))
+        try:
+            translated = dict(zip(unique, get_translator()(unique, src, target)))
+        except Exception:
+            logger.warning("Translation %s -> %s failed, keeping original text", src, target, exc_info=True)
+            continue
+
+        for text, result in translated.items():
+            translation_cache.set(_cache_key(text, src, target), result)
+        for i in positions:
+            out[i] = translated[texts[i]]
+
+    return out
+
+
+def translate(text: str, target: str, source: Optional[str] = None) -> str:
+    return translate_batch([text], target, source)[0]
+
+
+# -------- PIPELINE API --------
+def _clean(question: str) -> str:
+    return " ".join((question or "").split())
+
+
+def normalize_questions(questions: List[str]) -> List[Tuple[str, str]]:
+    """
+    Batch normalize_question: non-English questions are translated to
+    English in one call per language
+    """
+    cleaned = [_clean(q) for q in questions]
+    langs = [detect_language(q) for q in cleaned]
+
+    by_lang = {}
+    for i, lang in enumerate(langs):
+        if not is_english(lang):
+            by_lang.setdefault(lang, []).append(i)
+
+    normalized = list(cleaned)
+    for lang, positions in by_lang.items():
+        for i, text in zip(positions, translate_batch([cleaned[i] for i in positions], ENGLISH, lang)):
+            normalized[i] = text
+
+    return list(zip(normalized, langs))
+
+
+def normalize_question(question: str) -> Tuple[str, str]:
+    """
+    (question in English, detected language); English questions are only
+    whitespace-normalised
+    """
+    cleaned = _clean(question)
+    lang = detect_language(cleaned)
+    if is_english(lang):
+        return cleaned, ENGLISH
+    return translate(cleaned, ENGLISH, lang), lang
+
+
+def translate_answers(answers: List[str], langs: List[Optional[str]]) -> List[str]:
+    """
+    Batch translate_answer: one call per target language
+    """
+    out = list(answers)
+    by_lang = {}
+    for i, lang in enumerate(langs):
+        if not is_english(lang) and answers[i]:
+            by_lang.setdefault(lang, []).append(i)
+
+    for lang, positions in by_lang.items():
+        for i, text in zip(positions, translate_batch([answers[i] for i in positions], lang, ENGLISH)):
+            out[i] = text
+    return out
+
+
+def translate_answer(answer: str, lang: Optional[str]) -> str:
+    """
+    English answer in the asker's language (no-op for English)
+    """
+    if is_english(lang) or not answer:
+        return answer
+    return translate(answer, lang, ENGLISH)
@@ -0,0 +1,483 @@
+"""
+lexical_index.py
+
+Purpose:
+- BM25 inverted index over the chunk text, for the exact terms CLIP-style
+  embeddings match poorly (part numbers, error codes, model IDs)
+- Built incrementally at ingest (metadata_and_linking): only new or changed
+  chunk files are tokenized, each batch becoming a new immutable segment.
+  The index lives outside the run directories (data/lexical_index, or
+  LEXICAL_INDEX_DIR), so each run only indexes what changed since the last
+- Segments are flat numpy arrays opened with mmap at query time, so a search
+  only touches the postings of its query terms
+- The process-wide index is reopened when index.json changes; segments
+  already open stay readable after an update deletes their directory, since
+  every file (text.bin included) is mapped when the segment is opened
+- retriever fuses the BM25 hits with the vector hits by reciprocal-rank fusion
+
+On-disk layout of an index directory:
+
+    index.json                 {"segments": [...], "sources": {chunk file: {"hash", "segment"}}, "next"}
+    seg_<n>/meta.json          {"terms": [...sorted], "chunk_ids": [...], "sources": [...]}
+    seg_<n>/offsets.npy        int64 (terms + 1,)  start of each term's postings
+    seg_<n>/postings.npy       int32 doc ids, grouped by term
+    seg_<n>/freqs.npy          uint16 term frequencies, aligned with postings
+    seg_<n>/doc_lens.npy       int32 tokens per doc
+    seg_<n>/doc_source.npy     int32 position of each doc's chunk file in "sources"
+    seg_<n>/text.bin           utf-8 chunk texts back to back
+    seg_<n>/text_offsets.npy   int64 (docs + 1,)
+
+index.json is written last, so a crash mid-build leaves the previous index
+intact. A changed chunk file is re-indexed into the new segment and its docs
+in older segments are masked out; past LEXICAL_MAX_SEGMENTS segments the
+live docs are merged into one.
+"""
+
+import os
+import re
+import json
+import math
+import shutil
+import argparse
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+INDEX_DIR_NAME = "lexical_index"
+INDEX_FILE = "index.json"
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR")
+DEFAULT_INDEX_DIR = os.path.join("data", INDEX_DIR_NAME)
+LEXICAL_MAX_SEGMENTS = int(os.getenv("LEXICAL_MAX_SEGMENTS", "8"))
+
+# BM25 parameters
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_MAX_TF = np.iinfo(np.uint16).max
+
+# -------- TOKENIZER --------
+# Codes like "E-203", "PN 4471/B" or "v2.1" are kept whole (separators dropped,
+# so "E-203" and "E203" match) as well as split into their parts
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in into is it its "
+    "me my of on or so that the then there this to was what when where which "
+    "why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        parts = _PART.findall(match.group())
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+        tokens.extend(p for p in parts if p not in STOPWORDS)
+    return tokens
+
+
+# -------- SEGMENTS --------
+def _write_segment(path: str, docs: Iterable[Tuple[str, int, str]], sources: List[str]) -> int:
+    """
+    Write one segment from (chunk_id, source position, text); returns the doc count
+    """
+    os.makedirs(path, exist_ok=True)
+
+    postings = defaultdict(list)
+    chunk_ids, doc_source, doc_lens, text_offsets = [], [], [], [0]
+
+    with open(os.path.join(path, "text.bin"), "wb") as text_file:
+        for doc, (chunk_id, source, text) in enumerate(docs):
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                postings[term].append((doc, min(tf, _MAX_TF)))
+
+            encoded = text.encode("utf-8")
+            text_file.write(encoded)
+            text_offsets.append(text_offsets[-1] + len(encoded))
+
+            chunk_ids.append(chunk_id)
+            doc_source.append(source)
+            doc_lens.append(sum(counts.values()))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+
+    flat = [p for t in terms for p in postings[t]]
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "postings.npy"), np.array([d for d, _ in flat], dtype=np.int32))
+    np.save(os.path.join(path, "freqs.npy"), np.array([f for _, f in flat], dtype=np.uint16))
+    np.save(os.path.join(path, "doc_lens.npy"), np.array(doc_lens, dtype=np.int32))
+    np.save(os.path.join(path, "doc_source.npy"), np.array(doc_source, dtype=np.int32))
+    np.save(os.path.join(path, "text_offsets.npy"), np.array(text_offsets, dtype=np.int64))
+
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"terms": terms, "chunk_ids": chunk_ids, "sources": sources}, f, separators=(",", ":"))
+
+    return len(chunk_ids)
+
+
+class _Segment:
+    """
+    Read-only, memory-mapped view of one segment
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.term_ids = {t: i for i, t in enumerate(meta["terms"])}
+        self.chunk_ids = meta["chunk_ids"]
+        self.sources = meta["sources"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.offsets = load("offsets.npy")
+        self.postings = load("postings.npy")
+        self.freqs = load("freqs.npy")
+        self.doc_lens = np.asarray(load("doc_lens.npy"), dtype=np.float32)
+        self.doc_source = load("doc_source.npy")
+        self.text_offsets = load("text_offsets.npy")
+        self.live = np.ones(len(self.chunk_ids), dtype=bool)
+
+        # Mapped now, not reopened by path per hit: a merge may delete this
+        # directory while the segment is still being searched
+        text_path = os.path.join(path, "text.bin")
+        if os.path.getsize(text_path):
+            self.text_data = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self.text_data = np.zeros(0, dtype=np.uint8)
+
+    def postings_for(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        i = self.term_ids.get(term)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.postings[start:end], self.freqs[start:end]
+
+    def text(self, doc: int) -> str:
+        start, end = int(self.text_offsets[doc]), int(self.text_offsets[doc + 1])
+        return self.text_data[start:end].tobytes().decode("utf-8")
+
+    def docs(self, live_only: bool = True):
+        for doc, chunk_id in enumerate(self.chunk_ids):
+            if self.live[doc] or not live_only:
+                yield chunk_id, self.sources[self.doc_source[doc]], self.text(doc)
+
+
+def _read_state(index_dir: str) -> Dict:
+    path = os.path.join(index_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {"segments": [], "sources": {}, "next": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _index_stamp(index_dir: str) -> Optional[int]:
+    try:
+        return os.stat(os.path.join(index_dir, INDEX_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _write_state(index_dir: str, state: Dict):
+    path = os.path.join(index_dir, INDEX_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _apply_liveness(segments: Dict[str, _Segment], state: Dict):
+    """
+    A doc is live only if its chunk file still points at the doc's segment
+    """
+    for name, segment in segments.items():
+        live_sources = [
+            i for i, source in enumerate(segment.sources)
+            if state["sources"].get(source, {}).get("segment") == name
+        ]
+        segment.live = np.isin(np.asarray(segment.doc_source), live_sources)
+
+
+# -------- BUILD --------
+def update_index(chunk_folder: str, index_dir: str) -> Dict[str, int]:
+    """
+    Bring the index in line with the chunk files in chunk_folder, indexing
+    only files whose content changed; returns reused / indexed / removed counts
+    """
+    from chunk_records import list_chunk_files, iter_chunks
+    from ingest_manifest import file_hash
+
+    os.makedirs(index_dir, exist_ok=True)
+    state = _read_state(index_dir)
+
+    files = {os.path.basename(p): p for p in list_chunk_files(chunk_folder)}
+    hashes = {name: file_hash(path) for name, path in files.items()}
+
+    changed = sorted(n for n in files if state["sources"].get(n, {}).get("hash") != hashes[n])
+    removed = [n for n in state["sources"] if n not in files]
+    counts = {"reused": len(files) - len(changed), "indexed": len(changed), "removed": len(removed)}
+
+    if not changed and not removed:
+        return counts
+
+    for name in removed:
+        del state["sources"][name]
+
+    if changed:
+        segment = f"seg_{state['next']:05d}"
+        state["next"] += 1
+
+        docs = (
+            (r["chunk_id"], position, r["text"])
+            for position, name in enumerate(changed)
+            for r in iter_chunks(files[name], columns=["chunk_id", "text"])
+        )
+        if _write_segment(os.path.join(index_dir, segment), docs, changed):
+            state["segments"].append(segment)
+            for name in changed:
+                state["sources"][name] = {"hash": hashes[name], "segment": segment}
+        else:
+            shutil.rmtree(os.path.join(index_dir, segment), ignore_errors=True)
+            for name in changed:
+                state["sources"][name] = {"hash": hashes[name], "segment": None}
+
+    # Segments no chunk file points at any more hold only dead docs
+    referenced = {s["segment"] for s in state["sources"].values()}
+    dropped = [s for s in state["segments"] if s not in referenced]
+    state["segments"] = [s for s in state["segments"] if s in referenced]
+
+    if len(state["segments"]) > LEXICAL_MAX_SEGMENTS:
+        dropped.extend(_merge_segments(index_dir, state))
+
+    _write_state(index_dir, state)
+
+    for name in dropped:
+        shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+    return counts
+
+
+def _merge_segments(index_dir: str, state: Dict) -> List[str]:
+    """
+    Rewrite all live docs as one segment; returns the replaced segment names
+    """
+    segments = {name: _Segment(os.path.join(index_dir, name)) for name in state["segments"]}
+    _apply_liveness(segments, state)
+
+    merged = f"seg_{state['next']:05d}"
+    state["next"] += 1
+
+    sources = sorted(state["sources"])
+    positions = {s: i for i, s in enumerate(sources)}
+    docs = (
+        (chunk_id, positions[source], text)
+        for segment in segments.values()
+        for chunk_id, source, text in segment.docs()
+    )
+    _write_segment(os.path.join(index_dir, merged), docs, sources)
+
+    for entry in state["sources"].values():
+        if entry["segment"] is not None:
+            entry["segment"] = merged
+
+    replaced = state["segments"]
+    state["segments"] = [merged]
+    return replaced
+
+
+# -------- SEARCH --------
+class LexicalIndex:
+    """
+    BM25 search over all live docs of an index directory
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.stamp = _index_stamp(index_dir)
+        state = _read_state(index_dir)
+
+        self.segments = {
+            name: _Segment(os.path.join(index_dir, name))
+            for name in state["segments"]
+        }
+        _apply_liveness(self.segments, state)
+
+        self.num_docs = sum(int(s.live.sum()) for s in self.segments.values())
+        total_len = sum(float(s.doc_lens[s.live].sum()) for s in self.segments.values())
+        self.avg_len = total_len / self.num_docs if self.num_docs else 0.0
+
+    def version(self) -> str:
+        return f"lexical:{self.index_dir}:{self.stamp}"
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+        """
+        Best BM25 matches: {"chunk_id", "text", "bm25"}, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.num_docs:
+            return []
+
+        # Per-term postings in every segment, restricted to live docs
+        postings = {t: [] for t in terms}
+        for segment in self.segments.values():
+            for term in terms:
+                hit = segment.postings_for(term)
+                if hit is None:
+                    continue
+                docs, freqs = hit
+                keep = segment.live[docs]
+                if keep.any():
+                    postings[term].append((segment, docs[keep], freqs[keep]))
+
+        scores = {}
+        for term, hits in postings.items():
+            df = sum(len(docs) for _, docs, _ in hits)
+            if not df:
+                continue
+            idf = math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+            for segment, docs, freqs in hits:
+                if segment.path not in scores:
+                    scores[segment.path] = np.zeros(len(segment.chunk_ids), dtype=np.float32)
+                tf = freqs.astype(np.float32)
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * segment.doc_lens[docs] / self.avg_len)
+                scores[segment.path][docs] += idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+        candidates = []
+        for segment in self.segments.values():
+            segment_scores = scores.get(segment.path)
+            if segment_scores is None:
+                continue
+            matched = np.flatnonzero(segment_scores)
+            if len(matched) > top_k:
+                matched = matched[np.argpartition(-segment_scores[matched], top_k - 1)[:top_k]]
+            candidates.extend((float(segment_scores[d]), segment, int(d)) for d in matched)
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [
+            {"chunk_id": segment.chunk_ids[doc], "text": segment.text(doc), "bm25": score}
+            for score, segment, doc in candidates[:top_k]
+        ]
+
+    def stats(self) -> Dict:
+        return {
+            "index_dir": self.index_dir,
+            "segments": len(self.segments),
+            "docs": self.num_docs,
+            "avg_doc_tokens": round(self.avg_len, 1),
+        }
+
+
+# -------- PROCESS-WIDE INDEX --------
+_index: Optional[LexicalIndex] = None
+_index_dir: Optional[str] = None
+_resolved = False
+_pinned = False
+_index_lock = threading.Lock()
+
+
+def _latest_index_dir(base: str = os.path.join("data", "runs")) -> Optional[str]:
+    if not os.path.isdir(base):
+        return None
+    runs = sorted(
+        (d for d in os.listdir(base) if os.path.exists(os.path.join(base, d, INDEX_DIR_NAME, INDEX_FILE))),
+        reverse=True
+    )
+    return os.path.join(base, runs[0], INDEX_DIR_NAME) if runs else None
+
+
+def ingest_index_dir() -> str:
+    """
+    Where ingest keeps the index: one directory shared by every run
+    """
+    return LEXICAL_INDEX_DIR or DEFAULT_INDEX_DIR
+
+
+def resolve_index_dir() -> str:
+    """
+    LEXICAL_INDEX_DIR, else an index inside the local search backend's run
+    (synthetic corpora), else the shared ingest index, else the latest run
+    with an index of its own (built before the index moved out of the runs)
+    """
+    if LEXICAL_INDEX_DIR:
+        return LEXICAL_INDEX_DIR
+
+    from search_backends import active_backend
+
+    run_dir = getattr(active_backend(), "run_dir", None)
+    if run_dir and os.path.exists(os.path.join(run_dir, INDEX_DIR_NAME, INDEX_FILE)):
+        return os.path.join(run_dir, INDEX_DIR_NAME)
+
+    if os.path.exists(os.path.join(DEFAULT_INDEX_DIR, INDEX_FILE)):
+        return DEFAULT_INDEX_DIR
+
+    # Nothing built yet: watch the shared location for the first ingest
+    return _latest_index_dir() or DEFAULT_INDEX_DIR
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """
+    Process-wide index, opened on first use and reopened when its index.json
+    changes (a new ingest); None when no index was built
+    """
+    global _index, _index_dir, _resolved
+
+    if not _resolved:
+        with _index_lock:
+            if not _resolved:
+                _index_dir = resolve_index_dir()
+                _resolved = True
+
+    if _pinned or not _index_dir:
+        return _index
+
+    stamp = _index_stamp(_index_dir)
+    current = _index.stamp if _index is not None else None
+    if stamp != current:
+        with _index_lock:
+            if _index is None or _index.stamp != stamp:
+                _index = LexicalIndex(_index_dir) if stamp is not None else None
+
+    return _index
+
+
+def loaded_index() -> Optional[LexicalIndex]:
+    """
+    The index if it has been opened, without opening it (version, health)
+    """
+    return _index
+
+
+def set_lexical_index(index: Optional[LexicalIndex]):
+    """
+    Install an index explicitly (benchmarks, tests); None disables BM25
+    """
+    global _index, _resolved, _pinned
+    _index, _resolved, _pinned = index, True, True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query a BM25 index over chunk files")
+    parser.add_argument("index_dir")
+    parser.add_argument("--chunks", help="chunk folder to index (incremental)")
+    parser.add_argument("--query")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.chunks:
+        counts = update_index(args.chunks, args.index_dir)
+        print(f"✔ Lexical index → {args.index_dir} ({counts})")
+
+    if args.query:
+        for hit in LexicalIndex(args.index_dir).search(args.query, args.top_k):
+            print(f"{hit['bm25']:.3f}  {hit['chunk_id']}  {hit['text'][:100]}")
@@ -0,0 +1,678 @@
+"""
+llm_providers.py
+
+Purpose:
+- One completion interface (complete / acomplete / astream) over several
+  LLM backends, selected by LLM_PROVIDER:
+
+    groq       Groq chat completions (GROQ_API_KEY, GROQ_MODEL)
+    llamacpp   a local OpenAI-compatible server, e.g. llama.cpp's llama-server
+               with a GGUF model (LLAMACPP_URL, LLAMACPP_MODEL)
+    local      a small transformers model on CPU (LOCAL_LLM_MODEL)
+
+- Per-provider timeout (<PROVIDER>_TIMEOUT) and retries with exponential
+  backoff and full jitter (LLM_RETRIES); client errors (4xx other than
+  408/429) are not retried, and a stream is only retried before its first token.
+  complete() can override both for one call (translation runs under a
+  tighter stage deadline, with no retries).
+- Hedging: when the primary has not answered (or, streaming, has not sent a
+  first token) within its recent p95 latency, the same prompt also goes to
+  LLM_HEDGE_PROVIDER and the first answer wins; a failed primary fails over
+- Batching: the local transformers provider collects prompts that arrive
+  within LOCAL_LLM_BATCH_WAIT_MS into one generate() call of up to
+  LOCAL_LLM_BATCH_SIZE prompts. llama-server batches concurrent requests on
+  its own (--parallel, continuous batching), so that provider just sends them
+  concurrently; Groq is a remote API with no batch endpoint.
+
+Clients and models are created on first use; get_llm() returns None when no
+configured provider is usable (e.g. groq without GROQ_API_KEY and no hedge).
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+from typing import AsyncIterator, Dict, List, Optional
+
+from search_backends import LatencyTracker
+from metrics import LLM_REQUESTS, LLM_HEDGES
+
+logger = logging.getLogger("LLMProviders")
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")           # groq | llamacpp | local
+LLM_HEDGE_PROVIDER = os.getenv("LLM_HEDGE_PROVIDER", "")   # "" = no hedging
+
+LLM_TEMPERATURE = 0.2
+LLM_MAX_TOKENS = 500
+
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))           # extra attempts after the first
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.25"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "4"))
+
+# Hedge after the primary's p<LLM_HEDGE_PERCENTILE> latency, once it has
+# LLM_HEDGE_MIN_SAMPLES calls; before that after LLM_HEDGE_DELAY seconds
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "3"))
+
+# Groq
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "20"))
+
+# llama.cpp server (or any OpenAI-compatible endpoint)
+LLAMACPP_URL = os.getenv("LLAMACPP_URL", "http://127.0.0.1:8080")
+LLAMACPP_MODEL = os.getenv("LLAMACPP_MODEL", "local-gguf")
+LLAMACPP_TIMEOUT = float(os.getenv("LLAMACPP_TIMEOUT", "60"))
+
+# Local transformers model
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+LOCAL_LLM_MAX_TOKENS = int(os.getenv("LOCAL_LLM_MAX_TOKENS", "256"))
+LOCAL_LLM_BATCH_SIZE = int(os.getenv("LOCAL_LLM_BATCH_SIZE", "4"))
+LOCAL_LLM_BATCH_WAIT_MS = float(os.getenv("LOCAL_LLM_BATCH_WAIT_MS", "20"))
+LOCAL_LLM_TIMEOUT = float(os.getenv("LOCAL_LLM_TIMEOUT", "120"))
+
+# Sync hedging runs both attempts here; a losing call finishes in the background
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    return status is None or status in (408, 429) or status >= 500
+
+
+def _backoff(attempt: int) -> float:
+    """
+    Full jitter: uniform in [0, min(max, base * 2^attempt)]
+    """
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+def _outcome(error: Exception) -> str:
+    return "timeout" if isinstance(error, (TimeoutError, asyncio.TimeoutError, FutureTimeout)) else "error"
+
+
+# -------- PROVIDER INTERFACE --------
+class LLMProvider:
+    """
+    Subclasses implement one attempt (_complete, and optionally _acomplete /
+    _astream); the public methods add timeouts, retries and latency tracking
+    """
+
+    name = "base"
+    model = ""
+
+    def __init__(self, timeout: float, retries: int = LLM_RETRIES):
+        self.timeout = timeout
+        self.retries = retries
+        self.latency = LatencyTracker()       # full completions
+        self.first_token = LatencyTracker()   # streams: time to first token
+
+    def available(self) -> bool:
+        return True
+
+    def warmup(self):
+        pass
+
+    # -------- ONE ATTEMPT --------
+    def _complete(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """
+        timeout, if given, replaces self.timeout for this call
+        """
+        raise NotImplementedError
+
+    async def _acomplete(self, prompt: str) -> str:
+        return await asyncio.to_thread(self._complete, prompt)
+
+    async def _astream(self, prompt: str) -> AsyncIterator[str]:
+        yield await self._acomplete(prompt)
+
+    # -------- WITH RETRIES --------
+    def _failed(self, error: Exception, attempt: int, retries: Optional[int] = None) -> bool:
+        """
+        Count the failure; True if another attempt should be made
+        """
+        retries = self.retries if retries is None else retries
+        LLM_REQUESTS.inc(provider=self.name, outcome=_outcome(error))
+        if attempt >= retries or not _retryable(error):
+            return False
+        logger.warning("%s call failed (attempt %d/%d): %s", self.name, attempt + 1, retries + 1, error)
+        return True
+
+    def complete(self, prompt: str, timeout: Optional[float] = None, retries: Optional[int] = None) -> str:
+        """
+        timeout (per attempt) and retries override the provider's own for
+        this call
+        """
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                result = self._complete(prompt, timeout)
+            except Exception as e:
+                if not self._failed(e, attempt, retries):
+                    raise
+                time.sleep(_backoff(attempt))
+                continue
+
+            self.latency.record(time.perf_counter() - started)
+            LLM_REQUESTS.inc(provider=self.name, outcome="ok")
+            return result
+
+    async def acomplete(self, prompt: str) -> str:
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(self._acomplete(prompt), self.timeout)
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+                continue
+
+            self.latency.record(time.perf_counter() - started)
+            LLM_REQUESTS.inc(provider=self.name, outcome="ok")
+            return result
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Token deltas; each chunk must arrive within the provider timeout
+        """
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            stream = self._astream(prompt)
+            sent = False
+            try:
+                while True:
+                    try:
+                        delta = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    if not sent:
+                        self.first_token.record(time.perf_counter() - started)
+                        sent = True
+                    yield delta
+            except Exception as e:
+                if sent or not self._failed(e, attempt):
+                    if sent:
+                        LLM_REQUESTS.inc(provider=self.name, outcome=_outcome(e))
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+                continue
+            finally:
+                await stream.aclose()
+
+            self.latency.record(time.perf_counter() - started)
+            LLM_REQUESTS.inc(provider=self.name, outcome="ok")
+            return
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "latency": self.latency.summary(),
+            "first_token": self.first_token.summary(),
+        }
+
+
+# -------- GROQ --------
+class GroqProvider(LLMProvider):
+    name = "groq"
+
+    def __init__(self):
+        super().__init__(GROQ_TIMEOUT)
+        self.model = GROQ_MODEL
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def available(self):
+        return bool(GROQ_API_KEY)
+
+    def client(self, kind: str):
+        if kind not in self._clients:
+            with self._lock:
+                if kind not in self._clients:
+                    from groq import Groq, AsyncGroq
+                    cls = AsyncGroq if kind == "async" else Groq
+                    # Retries are done here (with jitter and hedging), not in the SDK
+                    self._clients[kind] = cls(api_key=GROQ_API_KEY, max_retries=0, timeout=self.timeout)
+        return self._clients[kind]
+
+    def warmup(self):
+        self.client("sync")
+        self.client("async")
+
+    def _request(self, prompt: str, **extra) -> Dict:
+        return dict(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=LLM_TEMPERATURE,
+            max_tokens=LLM_MAX_TOKENS,
+            **extra
+        )
+
+    def _complete(self, prompt, timeout=None):
+        response = self.client("sync").chat.completions.create(**self._request(prompt), timeout=timeout or self.timeout)
+        return response.choices[0].message.content.strip()
+
+    async def _acomplete(self, prompt):
+        response = await self.client("async").chat.completions.create(**self._request(prompt))
+        return response.choices[0].message.content.strip()
+
+    async def _astream(self, prompt):
+        stream = await self.client("async").chat.completions.create(**self._request(prompt, stream=True))
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+
+# -------- LLAMA.CPP SERVER --------
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    /v1/chat/completions over HTTP, as served by llama.cpp's llama-server
+    (and vLLM, Ollama, ...); streaming uses server-sent events
+    """
+
+    name = "llamacpp"
+
+    def __init__(self, url: str = LLAMACPP_URL, model: str = LLAMACPP_MODEL, timeout: float = LLAMACPP_TIMEOUT):
+        super().__init__(timeout)
+        self.url = url.rstrip("/") + "/v1/chat/completions"
+        self.model = model
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, kind: str):
+        if kind not in self._clients:
+            with self._lock:
+                if kind not in self._clients:
+                    import httpx
+                    cls = httpx.AsyncClient if kind == "async" else httpx.Client
+                    self._clients[kind] = cls(timeout=self.timeout)
+        return self._clients[kind]
+
+    def warmup(self):
+        self.client("sync")
+        self.client("async")
+
+    def _payload(self, prompt: str, stream: bool = False) -> Dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": LLM_TEMPERATURE,
+            "max_tokens": LLM_MAX_TOKENS,
+            "stream": stream,
+        }
+
+    def _complete(self, prompt, timeout=None):
+        response = self.client("sync").post(self.url, json=self._payload(prompt), timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    async def _acomplete(self, prompt):
+        response = await self.client("async").post(self.url, json=self._payload(prompt))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    async def _astream(self, prompt):
+        async with self.client("async").stream("POST", self.url, json=self._payload(prompt, stream=True)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+# -------- LOCAL TRANSFORMERS MODEL --------
+class TransformersProvider(LLMProvider):
+    """
+    Small causal LM on CPU. Prompts queued within LOCAL_LLM_BATCH_WAIT_MS of
+    each other are left-padded into one generate() call on a worker thread.
+    Streaming yields the whole completion as one delta.
+    """
+
+    name = "local"
+
+    def __init__(self, model: str = LOCAL_LLM_MODEL, timeout: float = LOCAL_LLM_TIMEOUT):
+        super().__init__(timeout)
+        self.model = model
+        self._loaded = None
+        self._load_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self.batches = 0
+        self.batched_prompts = 0
+
+    def _load(self):
+        if self._loaded is None:
+            with self._load_lock:
+                if self._loaded is None:
+                    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+                    tokenizer = AutoTokenizer.from_pretrained(self.model, padding_side="left")
+                    if tokenizer.pad_token is None:
+                        tokenizer.pad_token = tokenizer.eos_token
+                    model = AutoModelForCausalLM.from_pretrained(self.model).eval()
+                    self._loaded = (tokenizer, model)
+        return self._loaded
+
+    def warmup(self):
+        self._load()
+
+    def _submit(self, prompt: str) -> Future:
+        if self._worker is None:
+            with self._load_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._serve, name="local-llm", daemon=True)
+                    self._worker.start()
+
+        future = Future()
+        self._queue.put((prompt, future))
+        return future
+
+    def _complete(self, prompt, timeout=None):
+        future = self._submit(prompt)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    async def _acomplete(self, prompt):
+        return await asyncio.wrap_future(self._submit(prompt))
+
+    def _serve(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + LOCAL_LLM_BATCH_WAIT_MS / 1000
+            while len(batch) < LOCAL_LLM_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Callers that timed out meanwhile have cancelled their futures
+            batch = [(p, f) for p, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                outputs = self._generate([p for p, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), text in zip(batch, outputs):
+                future.set_result(text)
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        import torch
+
+        tokenizer, model = self._load()
+        if tokenizer.chat_template:
+            prompts = [
+                tokenizer.apply_chat_template([{"role": "user", "content": p}], tokenize=False, add_generation_prompt=True)
+                for p in prompts
+            ]
+
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            output = model.generate(
+                **inputs,
+                max_new_tokens=LOCAL_LLM_MAX_TOKENS,
+                do_sample=LLM_TEMPERATURE > 0,
+                temperature=LLM_TEMPERATURE,
+                pad_token_id=tokenizer.pad_token_id,
+            )
+
+        self.batches += 1
+        self.batched_prompts += len(prompts)
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        return [t.strip() for t in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+    def stats(self):
+        stats = super().stats()
+        stats["batches"] = self.batches
+        stats["mean_batch_size"] = round(self.batched_prompts / self.batches, 2) if self.batches else None
+        return stats
+
+
+PROVIDERS = {
+    "groq": GroqProvider,
+    "llamacpp": OpenAICompatibleProvider,
+    "local": TransformersProvider,
+}
+
+
+def make_provider(name: str) -> LLMProvider:
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{name}' (expected one of {sorted(PROVIDERS)})")
+    return PROVIDERS[name]()
+
+
+# -------- HEDGING --------
+def hedge_delay(tracker: LatencyTracker) -> float:
+    """
+    Seconds to wait for the primary before also asking the hedge provider
+    """
+    seconds = tracker.percentile(LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES)
+    return LLM_HEDGE_DELAY if seconds is None else seconds
+
+
+async def _first_success(tasks: List[asyncio.Task]):
+    """
+    Result of the first task to succeed; the others are cancelled
+    """
+    pending, error = set(tasks), None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class HedgedLLM:
+    """
+    Primary provider, plus an optional hedge provider used when the primary
+    is slower than its p95 or fails
+    """
+
+    def __init__(self, primary: LLMProvider, hedge: Optional[LLMProvider] = None):
+        self.primary = primary
+        self.hedge = hedge
+
+    @property
+    def name(self) -> str:
+        return f"{self.primary.name}:{self.primary.model}" + (f" (hedge {self.hedge.name})" if self.hedge else "")
+
+    @property
+    def model_key(self) -> str:
+        """
+        Cache key part for answers; hedge answers are cached under the primary's key
+        """
+        return f"{self.primary.name}:{self.primary.model}"
+
+    def providers(self) -> List[LLMProvider]:
+        return [self.primary] + ([self.hedge] if self.hedge else [])
+
+    def warmup(self):
+        for provider in self.providers():
+            provider.warmup()
+
+    def complete(self, prompt: str, timeout: Optional[float] = None, retries: Optional[int] = None) -> str:
+        """
+        With a timeout, the hedge only gets what is left of it, so the call as
+        a whole stays within timeout (retries aside)
+        """
+        if self.hedge is None:
+            return self.primary.complete(prompt, timeout, retries)
+
+        started = time.perf_counter()
+
+        def left():
+            return None if timeout is None else max(timeout - (time.perf_counter() - started), 0.001)
+
+        first = _hedge_pool.submit(self.primary.complete, prompt, timeout, retries)
+        try:
+            return first.result(timeout=hedge_delay(self.primary.latency))
+        except FutureTimeout:
+            LLM_HEDGES.inc(reason="slow")
+        except Exception:
+            logger.warning("%s failed, failing over to %s", self.primary.name, self.hedge.name)
+            LLM_HEDGES.inc(reason="failover")
+            return self.hedge.complete(prompt, left(), retries)
+
+        second = _hedge_pool.submit(self.hedge.complete, prompt, left(), retries)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def acomplete(self, prompt: str) -> str:
+        if self.hedge is None:
+            return await self.primary.acomplete(prompt)
+
+        first = asyncio.ensure_future(self.primary.acomplete(prompt))
+        done, _ = await asyncio.wait({first}, timeout=hedge_delay(self.primary.latency))
+        if done:
+            if first.exception() is None:
+                return first.result()
+            logger.warning("%s failed, failing over to %s", self.primary.name, self.hedge.name)
+            LLM_HEDGES.inc(reason="failover")
+            return await self.hedge.acomplete(prompt)
+
+        LLM_HEDGES.inc(reason="slow")
+        second = asyncio.ensure_future(self.hedge.acomplete(prompt))
+        return await _first_success([first, second])
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Hedged on time to first token: the stream that sends a token first is
+        followed to the end, the other one is closed
+        """
+        if self.hedge is None:
+            async for delta in self.primary.astream(prompt):
+                yield delta
+            return
+
+        streams = {}
+
+        def start(provider):
+            stream = provider.astream(prompt)
+            streams[asyncio.ensure_future(stream.__anext__())] = stream
+
+        start(self.primary)
+        hedged = False
+        done, _ = await asyncio.wait(set(streams), timeout=hedge_delay(self.primary.first_token))
+        if not done:
+            LLM_HEDGES.inc(reason="slow")
+            start(self.hedge)
+            hedged = True
+
+        winner, first_delta, error = None, None, None
+        try:
+            while streams and winner is None:
+                done, _ = await asyncio.wait(set(streams), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stream = streams.pop(task)
+                    exc = task.exception()
+                    if exc is None or isinstance(exc, StopAsyncIteration):
+                        winner, first_delta = stream, None if exc else task.result()
+                        break
+
+                    error = exc
+                    await stream.aclose()
+                    if not hedged:
+                        logger.warning("%s stream failed, failing over to %s", self.primary.name, self.hedge.name)
+                        LLM_HEDGES.inc(reason="failover")
+                        start(self.hedge)
+                        hedged = True
+        finally:
+            # Loser: cancel its pending first chunk, then close the stream
+            for task, stream in streams.items():
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+                await stream.aclose()
+
+        if winner is None:
+            raise error
+
+        if first_delta is not None:
+            yield first_delta
+        async for delta in winner:
+            yield delta
+
+    def stats(self) -> Dict:
+        return {provider.name: provider.stats() for provider in self.providers()}
+
+
+# -------- PROCESS-WIDE LLM --------
+_llm: Optional[HedgedLLM] = None
+_resolved = False
+_llm_lock = threading.Lock()
+
+
+def get_llm() -> Optional[HedgedLLM]:
+    """
+    LLM_PROVIDER (with LLM_HEDGE_PROVIDER as hedge), created on first use;
+    if the primary is unusable the hedge provider serves alone. None when
+    neither is usable.
+    """
+    global _llm, _resolved
+
+    if not _resolved:
+        with _llm_lock:
+            if not _resolved:
+                names = [LLM_PROVIDER] + ([LLM_HEDGE_PROVIDER] if LLM_HEDGE_PROVIDER and LLM_HEDGE_PROVIDER != LLM_PROVIDER else [])
+                usable = [p for p in map(make_provider, names) if p.available()]
+                if usable:
+                    _llm = HedgedLLM(usable[0], usable[1] if len(usable) > 1 else None)
+                    logger.info("LLM: %s", _llm.name)
+                else:
+                    logger.warning("No usable LLM provider (%s)", ", ".join(names))
+                _resolved = True
+
+    return _llm
+
+
+def set_llm(llm: Optional[HedgedLLM]):
+    """
+    Install providers explicitly (benchmarks, tests); None disables the LLM
+    """
+    global _llm, _resolved
+    _llm, _resolved = llm, True
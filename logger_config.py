@@ -1,5 +1,6 @@
 import logging
 import sys
+from metrics import RequestIdFilter
 
 def setup_logger():
     """
@@ -16,8 +17,10 @@ def setup_logger():
 
     # Stream to stdout (important)
     handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | id=%(request_id)s | %(message)s")
     handler.setFormatter(formatter)
+    # Current request ID (set by the API middleware) on every line
+    handler.addFilter(RequestIdFilter())
     logger.addHandler(handler)
 
     # Prevent double output via root logger
@@ -1,95 +1,205 @@
 import os
+import re
 import json
+from collections import defaultdict
+from itertools import zip_longest
 from datetime import datetime
-
-CHUNK_FOLDER = "data/chunks"
-IMAGE_FOLDER = "data/extracted_images"
-METADATA_FOLDER = "data/metadata"
-
-os.makedirs(METADATA_FOLDER, exist_ok=True)
-
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-TEXT_METADATA_FILE = os.path.join(
-    METADATA_FOLDER, f"text_metadata_{timestamp}.json"
-)
-IMAGE_LINK_FILE = os.path.join(
-    METADATA_FOLDER, f"image_text_links_{timestamp}.json"
-)
-
-# -----------------------------
-# STEP 1: Generate Text Metadata
-# -----------------------------
-text_metadata = []
-global_chunk_id = 1
-
-for file in os.listdir(CHUNK_FOLDER):
-    if not file.endswith("_chunks.txt"):
-        continue
-
-    source_doc = file.replace("_chunks.txt", "")
-    file_path = os.path.join(CHUNK_FOLDER, file)
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    current_chunk = []
-
-    for line in lines:
-        if line.startswith("--- CHUNK"):
-            if current_chunk:
-                chunk_text = " ".join(current_chunk).strip()
-                if chunk_text:
-                    text_metadata.append({
-                        "chunk_id": global_chunk_id,
-                        "source_document": source_doc,
-                        "chunk_text": chunk_text,
-                        "token_count": len(chunk_text.split())
-                    })
-                    global_chunk_id += 1
-                current_chunk = []
-        else:
-            current_chunk.append(line.strip())
-
-    # Last chunk
-    if current_chunk:
-        chunk_text = " ".join(current_chunk).strip()
-        if chunk_text:
-            text_metadata.append({
-                "chunk_id": global_chunk_id,
-                "source_document": source_doc,
-                "chunk_text": chunk_text,
-                "token_count": len(chunk_text.split())
-            })
-            global_chunk_id += 1
-
-with open(TEXT_METADATA_FILE, "w", encoding="utf-8") as f:
-    json.dump(text_metadata, f, indent=4)
-
-print(f"Text metadata created → {TEXT_METADATA_FILE}")
-
-# -----------------------------
-# STEP 2: Link Images to Text
-# -----------------------------
-image_links = []
-
-for image in os.listdir(IMAGE_FOLDER):
-    if image.lower().endswith((".png", ".jpg", ".jpeg")):
-        source_doc = image.split("_page")[0]
-
-        linked_chunks = [
-            item["chunk_id"]
-            for item in text_metadata
-            if item["source_document"] == source_doc
-        ]
-
-        image_links.append({
+from run_config import PATHS, ensure_run_dirs
+from chunk_records import iter_folder
+from lexical_index import update_index, ingest_index_dir
+
+CHUNK_FOLDER = PATHS["chunks"]
+IMAGE_FOLDER = PATHS["extracted_images"]
+METADATA_FOLDER = PATHS["metadata"]
+EMBEDDING_FOLDER = PATHS["embeddings"]
+LEXICAL_INDEX_FOLDER = ingest_index_dir()   # shared by all runs, like the ingest manifest
+
+# Linking configuration
+LINK_PAGE_WINDOW = int(os.getenv("LINK_PAGE_WINDOW", "1"))     # pages either side of the image page
+LINK_MAX_CHUNKS = int(os.getenv("LINK_MAX_CHUNKS", "5"))
+LINK_RANK_BY_CLIP = os.getenv("LINK_RANK_BY_CLIP", "0") == "1"
+
+# <source_document>_page<n>_<i>.<ext>, as written by pdf_parser
+IMAGE_NAME = re.compile(r"^(?P<doc>.+)_page(?P<page>\d+)_\d+\.\w+$")
+
+# image_pages_<source_document>.json: every page an image appears on
+IMAGE_PAGES_FILE = re.compile(r"^image_pages_.+\.json$")
+
+
+def parse_image_name(image_file):
+    """
+    (source_document, page) encoded in an extracted image filename, or None
+    """
+    m = IMAGE_NAME.match(image_file)
+    if not m:
+        return None
+    return m.group("doc"), int(m.group("page"))
+
+
+def load_image_pages(metadata_folder=METADATA_FOLDER):
+    """
+    Image filename -> all pages it appears on, from pdf_parser's
+    image_pages_*.json files; images not listed only have their filename page
+    """
+    image_pages = {}
+    for name in os.listdir(metadata_folder):
+        if IMAGE_PAGES_FILE.match(name):
+            with open(os.path.join(metadata_folder, name), "r", encoding="utf-8") as f:
+                image_pages.update(json.load(f))
+    return image_pages
+
+
+def build_page_index(text_metadata):
+    """
+    source_document -> page -> [chunk_id], built in one pass over the chunks
+    """
+    index = defaultdict(lambda: defaultdict(list))
+    for item in text_metadata:
+        index[item["source_document"]][item["page"]].append(item["chunk_id"])
+    return index
+
+
+def candidate_chunks(page_index, source_doc, pages, window=LINK_PAGE_WINDOW):
+    """
+    Chunks on the image's pages first, then on pages further away up to
+    `window`. At each distance the pages take turns, so an image repeated on
+    many pages is not linked to the first page alone.
+    """
+    chunks_by_page = page_index.get(source_doc, {})
+    linked, seen = [], set()
+
+    for distance in range(window + 1):
+        per_page = []
+        for page in pages:
+            nearby = (page,) if distance == 0 else (page - distance, page + distance)
+            per_page.append([c for p in nearby for c in chunks_by_page.get(p, [])])
+
+        for group in zip_longest(*per_page):
+            for chunk_id in group:
+                if chunk_id is not None and chunk_id not in seen:
+                    seen.add(chunk_id)
+                    linked.append(chunk_id)
+
+    return linked
+
+
+def load_clip_scorer(embedding_folder=EMBEDDING_FOLDER):
+    """
+    score(image_file, chunk_ids) -> cosine similarities from the embedding
+    stores, or None when the stores have not been generated
+    """
+    from embedding_store import EmbeddingStore
+
+    try:
+        text_store = EmbeddingStore(os.path.join(embedding_folder, "clip_text_store"))
+        image_store = EmbeddingStore(os.path.join(embedding_folder, "clip_image_store"))
+    except FileNotFoundError:
+        return None
+
+    text_vectors = text_store.vectors()
+    image_vectors = image_store.vectors()
+    text_rows = {r["chunk_id"]: i for i, r in enumerate(text_store.records())}
+    image_rows = {r["image_file"]: i for i, r in enumerate(image_store.records())}
+
+    def score(image_file, chunk_ids):
+        image_row = image_rows.get(image_file)
+        if image_row is None:
+            return None
+        rows = [text_rows.get(c) for c in chunk_ids]
+        if None in rows:
+            return None
+        return (text_vectors[rows] @ image_vectors[image_row]).tolist()
+
+    return score
+
+
+def link_images(image_files, page_index, scorer=None, max_chunks=LINK_MAX_CHUNKS, image_pages=None):
+    image_links = []
+    image_pages = image_pages or {}
+
+    for image in image_files:
+        parsed = parse_image_name(image)
+        if parsed is None:
+            continue
+        source_doc, page = parsed
+        pages = image_pages.get(image) or [page]
+
+        linked_chunks = candidate_chunks(page_index, source_doc, pages)
+        link = {
             "image_file": image,
             "source_document": source_doc,
-            "linked_chunks": linked_chunks
-        })
-
-with open(IMAGE_LINK_FILE, "w", encoding="utf-8") as f:
-    json.dump(image_links, f, indent=4)
-
-print(f"Image–text linking created → {IMAGE_LINK_FILE}")
+            "page": page,
+            "pages": pages
+        }
+
+        scores = scorer(image, linked_chunks) if scorer and linked_chunks else None
+        if scores is not None:
+            ranked = sorted(zip(linked_chunks, scores), key=lambda x: x[1], reverse=True)[:max_chunks]
+            link["linked_chunks"] = [c for c, _ in ranked]
+            link["scores"] = [round(s, 4) for _, s in ranked]
+        else:
+            link["linked_chunks"] = linked_chunks[:max_chunks]
+
+        image_links.append(link)
+
+    return image_links
+
+
+def run():
+    ensure_run_dirs()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    text_metadata_file = os.path.join(
+        METADATA_FOLDER, f"text_metadata_{timestamp}.json"
+    )
+    image_link_file = os.path.join(
+        METADATA_FOLDER, f"image_text_links_{timestamp}.json"
+    )
+
+    # -----------------------------
+    # STEP 1: Generate Text Metadata
+    # -----------------------------
+    # Chunk IDs, pages and token counts come straight from the chunker's records
+    text_metadata = [
+        {
+            "chunk_id": record["chunk_id"],
+            "source_document": record["source_document"],
+            "page": record["page"],
+            "chunk_text": record["text"],
+            "token_count": record["token_count"]
+        }
+        for record in iter_folder(CHUNK_FOLDER)
+    ]
+
+    with open(text_metadata_file, "w", encoding="utf-8") as f:
+        json.dump(text_metadata, f, indent=4)
+
+    print(f"Text metadata created → {text_metadata_file}")
+
+    # -----------------------------
+    # STEP 2: Link Images to Text
+    # -----------------------------
+    page_index = build_page_index(text_metadata)
+    scorer = load_clip_scorer() if LINK_RANK_BY_CLIP else None
+
+    image_files = [
+        image for image in os.listdir(IMAGE_FOLDER)
+        if image.lower().endswith((".png", ".jpg", ".jpeg"))
+    ]
+    image_links = link_images(image_files, page_index, scorer, image_pages=load_image_pages())
+
+    with open(image_link_file, "w", encoding="utf-8") as f:
+        json.dump(image_links, f, separators=(",", ":"))
+
+    print(f"Image–text linking created → {image_link_file}")
+
+    # -----------------------------
+    # STEP 3: Update BM25 Index
+    # -----------------------------
+    # Only chunk files that changed since the last update are tokenized
+    counts = update_index(CHUNK_FOLDER, LEXICAL_INDEX_FOLDER)
+    print(f"Lexical index updated → {LEXICAL_INDEX_FOLDER} ({counts})")
+
+
+if __name__ == "__main__":
+    run()
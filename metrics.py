@@ -0,0 +1,239 @@
+"""
+metrics.py
+
+Purpose:
+- Minimal in-process metrics (counters, histograms) rendered in the
+  Prometheus text exposition format for the API's /metrics endpoint
+- span(stage): times one pipeline stage into the rag_stage_seconds
+  histogram and logs it
+- Request ID propagation: the API middleware sets a contextvar and
+  RequestIdFilter stamps it on every log record, so stage logs from the
+  pipeline (including its worker threads) can be tied to one request
+
+No dependency on prometheus_client; everything is thread-safe and cheap
+enough to leave on in production.
+"""
+
+import time
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("Metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# -------- REQUEST ID --------
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default="-")
+
+
+def get_request_id() -> str:
+    return request_id_var.get()
+
+
+def set_request_id(request_id: str):
+    """
+    Set the current request ID; returns the token for request_id_var.reset
+    """
+    return request_id_var.set(request_id)
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Adds `request_id` to every record so formatters can use %(request_id)s
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def add_request_id_filter(logger_: logging.Logger):
+    for handler in logger_.handlers:
+        if not any(isinstance(f, RequestIdFilter) for f in handler.filters):
+            handler.addFilter(RequestIdFilter())
+
+
+# -------- METRIC TYPES --------
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict]:
+        """
+        label values -> {"buckets", "counts", "sum", "count"} (counts not cumulative)
+        """
+        with self._lock:
+            return {
+                key: {"buckets": self.buckets, "counts": list(counts), "sum": total, "count": count}
+                for key, (counts, total, count) in self._series.items()
+            }
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# -------- REGISTRY --------
+_metrics: List = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def counter(name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    metric = Counter(name, help_text, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    metric = Histogram(name, help_text, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]):
+    """
+    fn() -> [(name, type, help, labels, value), ...], evaluated on every
+    scrape; used to export stats other modules already keep (cache, pool)
+    """
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    for fn in _collectors:
+        try:
+            samples = list(fn())
+        except Exception:
+            logger.warning("Metrics collector failed", exc_info=True)
+            continue
+
+        described = set()
+        for name, kind, help_text, labels, value in samples:
+            if name not in described:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+            lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+# -------- PIPELINE METRICS --------
+STAGE_SECONDS = histogram("rag_stage_seconds", "Latency of one RAG pipeline stage", ("stage",))
+STAGE_ERRORS = counter("rag_stage_errors_total", "Pipeline stages that raised", ("stage",))
+CACHE_LOOKUPS = counter("rag_cache_lookups_total", "Pipeline cache lookups", ("cache", "result"))
+FALLBACKS = counter("rag_fallback_answers_total", "Answers not generated by the LLM", ("reason",))
+LLM_ERRORS = counter("rag_llm_errors_total", "Failed LLM calls", ("kind",))
+LLM_REQUESTS = counter("rag_llm_provider_requests_total", "LLM provider attempts", ("provider", "outcome"))
+LLM_HEDGES = counter("rag_llm_hedges_total", "Prompts also sent to the hedge provider", ("reason",))
+HTTP_REQUESTS = counter("http_requests_total", "HTTP requests", ("method", "path", "status"))
+HTTP_SECONDS = histogram("http_request_seconds", "HTTP request latency", ("method", "path"))
+CONTEXT_TOKENS = histogram(
+    "rag_context_tokens", "Prompt context size in model tokens", buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 4096)
+)
+RERANK_RANK_SHIFT = histogram(
+    "rag_rerank_rank_shift", "Mean rank change of the hits kept by the reranker", buckets=(0, 0.5, 1, 2, 3, 5, 10, 20)
+)
+RERANK_SKIPPED = counter("rag_rerank_skipped_total", "Requests answered in retrieval order", ("reason",))
+CONTEXT_DROPPED = counter("rag_context_dropped_total", "Retrieved items left out of the context", ("reason",))
+
+
+@contextmanager
+def span(stage: str, log: Optional[logging.Logger] = None):
+    """
+    Time a pipeline stage into rag_stage_seconds{stage=...} and log its
+    duration (the request ID is added by RequestIdFilter)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        (log or logger).info("[STAGE] stage=%s duration=%.4fs", stage, elapsed)
@@ -0,0 +1,105 @@
+"""
+milvus_config.py
+
+Purpose:
+- Single source of truth for the Milvus connection, collection names,
+  embedding dimension, metric and ANN index parameters
+- Named index profiles so milvus_setup.py (index build) and retriever.py
+  (search) always agree on metric and search params
+
+Select a profile with MILVUS_INDEX_PROFILE (default IVF_FLAT). The search
+knob of the active profile (nprobe / ef) can be overridden with
+MILVUS_SEARCH_PARAM; use benchmarks/ann_tuning.py to pick its value.
+"""
+
+import os
+
+MILVUS_HOST = os.getenv("MILVUS_HOST", "localhost")
+MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
+
+TEXT_COLLECTION_NAME = "text_chunks_collection"
+IMAGE_COLLECTION_NAME = "image_embeddings_collection"
+
+# One-row collection holding the index version milvus_loader writes after
+# every load (search_backends.MilvusBackend.version reads it)
+VERSION_COLLECTION_NAME = "rag_index_version"
+VERSION_ROW_ID = 0
+
+# CLIP ViT-B/32 projection size; must match the embedding stores
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+
+# Embeddings are L2-normalised, so COSINE (higher = more similar) is used everywhere
+METRIC_TYPE = "COSINE"
+
+INDEX_PROFILES = {
+    # Exact search, used as ground truth by the tuning harness
+    "FLAT": {
+        "index_type": "FLAT",
+        "index_params": {},
+        "search_params": {},
+        "search_knob": None,
+    },
+    "IVF_FLAT": {
+        "index_type": "IVF_FLAT",
+        "index_params": {"nlist": 128},
+        "search_params": {"nprobe": 10},
+        "search_knob": "nprobe",
+    },
+    "IVF_SQ8": {
+        "index_type": "IVF_SQ8",
+        "index_params": {"nlist": 128},
+        "search_params": {"nprobe": 16},
+        "search_knob": "nprobe",
+    },
+    "HNSW": {
+        "index_type": "HNSW",
+        "index_params": {"M": 16, "efConstruction": 200},
+        "search_params": {"ef": 64},
+        "search_knob": "ef",
+    },
+}
+
+INDEX_PROFILE = os.getenv("MILVUS_INDEX_PROFILE", "IVF_FLAT")
+
+
+def get_profile(name=None):
+    name = name or INDEX_PROFILE
+    if name not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile '{name}', choose from {list(INDEX_PROFILES)}")
+    return INDEX_PROFILES[name]
+
+
+def index_params(name=None):
+    """
+    Parameters for Collection.create_index
+    """
+    profile = get_profile(name)
+    return {
+        "metric_type": METRIC_TYPE,
+        "index_type": profile["index_type"],
+        "params": dict(profile["index_params"]),
+    }
+
+
+def search_params(name=None, knob_value=None):
+    """
+    Parameters for Collection.search; knob_value overrides nprobe / ef
+    """
+    profile = get_profile(name)
+    params = dict(profile["search_params"])
+
+    if knob_value is None and os.getenv("MILVUS_SEARCH_PARAM"):
+        knob_value = int(os.getenv("MILVUS_SEARCH_PARAM"))
+    if knob_value is not None and profile["search_knob"]:
+        params[profile["search_knob"]] = knob_value
+
+    return {"metric_type": METRIC_TYPE, "params": params}
+
+
+def similarity(distance):
+    """
+    Convert a Milvus hit distance into a higher-is-better score for METRIC_TYPE
+    """
+    if METRIC_TYPE in ("COSINE", "IP"):
+        return distance
+    return -distance
@@ -0,0 +1,255 @@
+"""
+milvus_loader.py
+
+Purpose:
+- Stream vectors from the CLIP embedding stores into the Milvus collections
+  that retriever.py searches
+- Insert in batches of configurable size, flush once at the end
+- Rows are keyed by chunk_id (text) and image_path (images): each batch
+  first deletes the rows with its keys, so reloading a run, or resuming one,
+  never duplicates vectors
+- After a store is loaded, rows of its source documents that are no longer
+  in the store (earlier runs, removed chunks) are deleted
+- Keep a checkpoint so an interrupted load resumes where it stopped
+- After a load that changed rows, write a new index version marker
+  (milvus_setup.write_index_version), so the API's caches are invalidated
+  even when a re-ingest replaced rows without changing the row counts
+- Report rows per second
+
+Usage:
+
+    python milvus_loader.py [--batch-size 1000] [--run-dir data/runs/<run_id>] [--restart]
+
+Without --run-dir the loader uses the run named by PIPELINE_RUN_ID, else the
+latest run under data/runs that has embedding stores.
+"""
+
+import os
+import json
+import time
+import argparse
+
+from run_config import BASE_RUN_DIR
+from embedding_store import EmbeddingStore
+from chunk_records import iter_folder
+from metadata_and_linking import parse_image_name
+from search_backends import latest_run_dir
+import milvus_setup
+
+LOAD_BATCH_SIZE = int(os.getenv("MILVUS_LOAD_BATCH_SIZE", "1000"))
+CHECKPOINT_FILE = "milvus_load_checkpoint.json"
+
+# Row key per collection (the primary key is auto_id, so uniqueness is ours to keep)
+KEY_FIELDS = {
+    milvus_setup.TEXT_COLLECTION_NAME: "chunk_id",
+    milvus_setup.IMAGE_COLLECTION_NAME: "image_path",
+}
+
+
+# -------- CHECKPOINT --------
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=4)
+    os.replace(tmp, path)
+
+
+# -------- ROW BUILDERS --------
+def truncate_utf8(text, max_bytes):
+    """
+    Cut text to at most max_bytes of UTF-8 (VARCHAR max_length counts bytes)
+    """
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore")
+
+
+def text_rows(store, chunk_folder):
+    """
+    Column builder for text_chunks_collection: (embedding, text, chunk_id, source)
+    """
+    chunk_text = {
+        r["chunk_id"]: r["text"]
+        for r in iter_folder(chunk_folder, columns=["chunk_id", "text"])
+    }
+    records = store.records()
+
+    def build(start, end):
+        batch = records[start:end]
+        return [
+            [truncate_utf8(chunk_text.get(r["chunk_id"], ""), milvus_setup.TEXT_MAX_LENGTH) for r in batch],
+            [r["chunk_id"] for r in batch],
+            [r["source_document"] for r in batch],
+        ]
+
+    return build
+
+
+def image_rows(store, image_folder):
+    """
+    Column builder for image_embeddings_collection: (embedding, image_path, source)
+    """
+    records = store.records()
+
+    def build(start, end):
+        batch = records[start:end]
+        return [
+            [os.path.join(image_folder, r["image_file"]) for r in batch],
+            [(parse_image_name(r["image_file"]) or ("",))[0] for r in batch],
+        ]
+
+    return build
+
+
+# -------- LOADER --------
+def _in(values):
+    # Milvus expression list literal; JSON quoting escapes quotes and backslashes
+    return json.dumps(list(values))
+
+
+def _columns_by_field(collection, columns):
+    names = [f.name for f in collection.schema.fields if f.name not in ("id", "embedding")]
+    return dict(zip(names, columns))
+
+
+def prune_stale_rows(collection, store, build_columns, batch_size):
+    """
+    Delete rows of the store's source documents whose keys are not in the
+    store any more; returns the number of documents pruned
+    """
+    key_field = KEY_FIELDS[collection.name]
+
+    keys_by_source = {}
+    for start in range(0, len(store), batch_size):
+        fields = _columns_by_field(collection, build_columns(start, min(start + batch_size, len(store))))
+        for key, source in zip(fields[key_field], fields["source"]):
+            keys_by_source.setdefault(source, []).append(key)
+
+    for source, keys in keys_by_source.items():
+        collection.delete(f"source == {json.dumps(source)} and {key_field} not in {_in(keys)}")
+
+    return len(keys_by_source)
+
+
+def load_store(collection, store, build_columns, checkpoint, checkpoint_path, batch_size):
+    """
+    Insert store rows [checkpoint, len(store)) in batches, replacing rows
+    with the same keys; returns rows inserted
+    """
+    name = collection.name
+    key_field = KEY_FIELDS[name]
+    start_row = checkpoint.get(name, 0)
+    total = len(store)
+
+    if start_row >= total:
+        print(f"✔ {name}: nothing to load ({total} rows already loaded)")
+        return 0
+
+    if start_row:
+        print(f"↺ {name}: resuming at row {start_row}/{total}")
+
+    vectors = store.vectors()
+    started = time.perf_counter()
+
+    for start in range(start_row, total, batch_size):
+        end = min(start + batch_size, total)
+
+        columns = build_columns(start, end)
+
+        # Delete-then-insert acts as an upsert on the key
+        collection.delete(f"{key_field} in {_in(_columns_by_field(collection, columns)[key_field])}")
+        collection.insert([vectors[start:end].astype("float32").tolist()] + columns)
+
+        checkpoint[name] = end
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - started
+        print(f"  {name}: {end}/{total} rows ({(end - start_row) / elapsed:.0f} rows/s)")
+
+    documents = prune_stale_rows(collection, store, build_columns, batch_size)
+
+    # One flush per collection instead of one per batch
+    collection.flush()
+
+    inserted = total - start_row
+    elapsed = time.perf_counter() - started
+    print(f"✔ {name}: loaded {inserted} rows in {elapsed:.1f}s ({inserted / elapsed:.0f} rows/s), "
+          f"stale rows pruned for {documents} documents")
+
+    return inserted
+
+
+def resolve_run_dir(run_dir=None):
+    """
+    --run-dir, else the PIPELINE_RUN_ID run, else the latest run with
+    embedding stores (a fresh run directory would have none)
+    """
+    if run_dir:
+        return run_dir
+    if os.getenv("PIPELINE_RUN_ID"):
+        return BASE_RUN_DIR
+
+    latest = latest_run_dir()
+    if latest is None:
+        raise FileNotFoundError("No run with embedding stores under data/runs; pass --run-dir")
+    return latest
+
+
+def run(run_dir=None, batch_size=LOAD_BATCH_SIZE, restart=False):
+    run_dir = resolve_run_dir(run_dir)
+    embedding_folder = os.path.join(run_dir, "embeddings")
+    chunk_folder = os.path.join(run_dir, "chunks")
+    image_folder = os.path.join(run_dir, "extracted_images")
+    print(f"Loading run {run_dir}")
+
+    stores = ("clip_text_store", "clip_image_store")
+    if not any(os.path.exists(os.path.join(embedding_folder, d, "meta.json")) for d in stores):
+        raise FileNotFoundError(f"No embedding stores in {embedding_folder}")
+
+    checkpoint_path = os.path.join(embedding_folder, CHECKPOINT_FILE)
+    checkpoint = {} if restart else load_checkpoint(checkpoint_path)
+
+    milvus_setup.connect()
+
+    jobs = [
+        ("clip_text_store", milvus_setup.TEXT_COLLECTION_NAME, milvus_setup.text_schema(),
+         lambda store: text_rows(store, chunk_folder)),
+        ("clip_image_store", milvus_setup.IMAGE_COLLECTION_NAME, milvus_setup.image_schema(),
+         lambda store: image_rows(store, image_folder)),
+    ]
+
+    loaded = 0
+    for store_dir, name, schema, builder in jobs:
+        try:
+            store = EmbeddingStore(os.path.join(embedding_folder, store_dir))
+        except FileNotFoundError:
+            print(f"⚠ {store_dir} not found in {embedding_folder}, skipping {name}")
+            continue
+
+        collection = milvus_setup.ensure_collection(name, schema)
+        dim = next(f.params["dim"] for f in collection.schema.fields if f.name == "embedding")
+        if dim != store.dim:
+            raise ValueError(f"{name} expects dim={dim} but {store_dir} has dim={store.dim}")
+
+        loaded += load_store(collection, store, builder(store), checkpoint, checkpoint_path, batch_size)
+
+    if loaded:
+        milvus_setup.write_index_version(f"load-{time.time_ns()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load CLIP embeddings into Milvus")
+    parser.add_argument("--run-dir", default=None, help="data/runs/<run_id> to load (default: PIPELINE_RUN_ID, else the latest run)")
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and load from row 0")
+    args = parser.parse_args()
+
+    run(args.run_dir, args.batch_size, args.restart)
@@ -0,0 +1,396 @@
+"""
+milvus_pool.py
+
+Purpose:
+- Fixed-size pool of Milvus connections (one pymilvus alias / gRPC channel
+  each) shared by the API's worker threads
+- Broken connections are dropped and re-established on the next lease;
+  connection failures and timeouts are retried with exponential backoff and
+  jitter, other errors (bad requests) are raised at once
+- Each call, retries included, fits in MILVUS_CALL_BUDGET seconds (default:
+  the pipeline's retrieval timeout), so no worker keeps retrying after the
+  caller has given up
+- A circuit breaker stops calling Milvus after repeated failures so requests
+  fail fast (CircuitOpenError) and the pipeline answers in degraded mode,
+  then lets one trial call through after MILVUS_BREAKER_RESET seconds
+- Pool utilisation counters via stats() for sizing MILVUS_POOL_SIZE
+
+pymilvus is imported on the first connection, not at import time.
+"""
+
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from milvus_config import MILVUS_HOST, MILVUS_PORT
+
+logger = logging.getLogger("MilvusPool")
+
+MILVUS_POOL_SIZE = int(os.getenv("MILVUS_POOL_SIZE", "4"))
+MILVUS_POOL_TIMEOUT = float(os.getenv("MILVUS_POOL_TIMEOUT", "2"))        # wait for a free connection
+MILVUS_CONNECT_TIMEOUT = float(os.getenv("MILVUS_CONNECT_TIMEOUT", "3"))
+MILVUS_RETRY_ATTEMPTS = int(os.getenv("MILVUS_RETRY_ATTEMPTS", "3"))
+MILVUS_BACKOFF_BASE = float(os.getenv("MILVUS_BACKOFF_BASE", "0.2"))
+MILVUS_BACKOFF_MAX = float(os.getenv("MILVUS_BACKOFF_MAX", "2"))
+MILVUS_BREAKER_FAILURES = int(os.getenv("MILVUS_BREAKER_FAILURES", "5"))
+MILVUS_BREAKER_RESET = float(os.getenv("MILVUS_BREAKER_RESET", "30"))
+MILVUS_CALL_BUDGET = float(os.getenv("MILVUS_CALL_BUDGET", os.getenv("RAG_RETRIEVAL_TIMEOUT", "5")))
+
+# Exception class names (pymilvus), pymilvus error codes (2 = CONNECT_FAILED)
+# and gRPC status names that mean the connection itself is broken, and those
+# that mean the call ran out of time. Status text is matched case-insensitively.
+_CONNECTION_ERRORS = {"MilvusUnavailableException", "ConnectionNotExistException", "ConnectError"}
+_CONNECTION_CODES = {2}
+_CONNECTION_STATUS = ("UNAVAILABLE",)
+_TIMEOUT_STATUS = ("DEADLINE_EXCEEDED",)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling Milvus while the circuit breaker is open
+    """
+
+
+class PoolTimeoutError(TimeoutError):
+    """
+    No pooled connection became free within MILVUS_POOL_TIMEOUT
+    """
+
+
+class MilvusConnectError(ConnectionError):
+    """
+    Opening a pooled connection failed (the cause is chained)
+    """
+
+
+# -------- CIRCUIT BREAKER --------
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failed calls;
+    open -> half_open after `reset_timeout` seconds, admitting one trial call;
+    the trial's outcome closes or re-opens the circuit
+    """
+
+    def __init__(self, failure_threshold: int = MILVUS_BREAKER_FAILURES, reset_timeout: float = MILVUS_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+
+            if self._state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = "half_open"
+
+            # half_open: a single trial call at a time
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != "closed":
+                logger.info("Milvus circuit closed")
+            self._state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        End a half-open trial that never reached Milvus, without a verdict
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    logger.warning("Milvus circuit opened after %d failures", self._failures)
+                    self.opened += 1
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+
+def error_kind(error: Exception) -> str:
+    """
+    "connection", "timeout" or "request" (the server answered, the call was wrong)
+    """
+    if isinstance(error, ConnectionError) or any(c.__name__ in _CONNECTION_ERRORS for c in type(error).__mro__):
+        return "connection"
+    if isinstance(error, TimeoutError):
+        return "timeout"
+
+    # grpc.RpcError exposes code(); pymilvus errors carry an int code and the
+    # status in the message
+    code = getattr(error, "code", None)
+    code = code() if callable(code) else code
+    if isinstance(code, int) and code in _CONNECTION_CODES:
+        return "connection"
+
+    status = f"{code} {error}".upper()
+    if any(s in status for s in _CONNECTION_STATUS):
+        return "connection"
+    if any(s in status for s in _TIMEOUT_STATUS):
+        return "timeout"
+    return "request"
+
+
+# -------- POOL --------
+class _Slot:
+    def __init__(self, alias: str):
+        self.alias = alias
+        self.connected = False
+        self.collections = {}
+        self.deadline = None   # monotonic deadline of the current run() call
+
+    def remaining(self, cap: float) -> float:
+        """
+        Seconds left for a server call, at most cap (use as its timeout)
+        """
+        if self.deadline is None:
+            return cap
+        return max(0.001, min(cap, self.deadline - time.monotonic()))
+
+
+class MilvusPool:
+    def __init__(
+        self,
+        host: str = MILVUS_HOST,
+        port: str = MILVUS_PORT,
+        size: int = MILVUS_POOL_SIZE,
+        acquire_timeout: float = MILVUS_POOL_TIMEOUT,
+        attempts: int = MILVUS_RETRY_ATTEMPTS,
+        budget: float = MILVUS_CALL_BUDGET,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.attempts = attempts
+        self.budget = budget
+        self.breaker = breaker or CircuitBreaker()
+
+        self._idle = queue.LifoQueue()
+        for i in range(size):
+            self._idle.put(_Slot(f"rag_pool_{i}"))
+
+        self._loaded = set()
+        self._lock = threading.Lock()
+
+        self.in_use = 0
+        self.max_in_use = 0
+        self.leases = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.failures = 0
+        self.rejected = 0
+
+    # -------- CONNECTIONS --------
+    def _connect(self, slot: _Slot):
+        """
+        Open the slot's connection; any failure is a MilvusConnectError, so
+        run() retries it and counts it towards the breaker
+        """
+        try:
+            from pymilvus import connections
+
+            connections.connect(
+                alias=slot.alias, host=self.host, port=self.port, timeout=slot.remaining(MILVUS_CONNECT_TIMEOUT)
+            )
+        except Exception as e:
+            raise MilvusConnectError(f"Could not connect to Milvus at {self.host}:{self.port}: {e}") from e
+        slot.connected = True
+        slot.collections.clear()
+
+        with self._lock:
+            self.connects += 1
+
+    def _disconnect(self, slot: _Slot):
+        slot.connected = False
+        slot.collections.clear()
+        try:
+            from pymilvus import connections
+            connections.disconnect(slot.alias)
+        except Exception:
+            logger.debug("Disconnect of %s failed", slot.alias, exc_info=True)
+
+    def collection(self, slot: _Slot, name: str):
+        """
+        Collection handle bound to the slot's connection; loaded once per process
+        """
+        collection = slot.collections.get(name)
+        if collection is None:
+            from pymilvus import Collection
+
+            collection = Collection(name, using=slot.alias)
+            with self._lock:
+                loaded = name in self._loaded
+            if not loaded:
+                collection.load()
+                with self._lock:
+                    self._loaded.add(name)
+            slot.collections[name] = collection
+
+        return collection
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None, deadline: Optional[float] = None):
+        """
+        Borrow a connection slot, waiting at most timeout (default
+        acquire_timeout) seconds; deadline bounds the connect and is handed
+        to the caller as slot.deadline
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        try:
+            slot = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                slot = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.timeouts += 1
+                raise PoolTimeoutError(f"No Milvus connection free after {timeout:.2f}s")
+            finally:
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self.waits += 1
+                    self.wait_seconds += waited
+                    self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        with self._lock:
+            self.leases += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+        try:
+            slot.deadline = deadline
+            if not slot.connected:
+                self._connect(slot)
+            yield slot
+        finally:
+            slot.deadline = None
+            with self._lock:
+                self.in_use -= 1
+            self._idle.put(slot)
+
+    def run(self, fn: Callable[[_Slot], object], attempts: Optional[int] = None, budget: Optional[float] = None):
+        """
+        fn(slot) on a pooled connection within budget seconds (default
+        MILVUS_CALL_BUDGET), retrying connection failures and timeouts with
+        backoff; fn should pass slot.remaining(timeout) as its server timeout.
+        Raises CircuitOpenError while the breaker is open.
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError("Milvus unavailable (circuit open)")
+
+        attempts = attempts or self.attempts
+        deadline = time.monotonic() + (self.budget if budget is None else budget)
+        last_error = None
+
+        for attempt in range(attempts):
+            try:
+                wait = min(self.acquire_timeout, max(deadline - time.monotonic(), 0.001))
+                with self.lease(wait, deadline) as slot:
+                    try:
+                        result = fn(slot)
+                    except Exception as e:
+                        if error_kind(e) == "connection":
+                            # Drop the connection; the next lease of this slot
+                            # reconnects and re-issues load() (the server may have restarted)
+                            self._disconnect(slot)
+                            with self._lock:
+                                self._loaded.clear()
+                        raise
+                self.breaker.record_success()
+                return result
+            except PoolTimeoutError:
+                # Saturation, not a Milvus failure: do not trip the breaker
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                last_error = e
+                with self._lock:
+                    self.failures += 1
+
+                if error_kind(e) == "request":
+                    # The server answered; retrying the same request cannot help
+                    self.breaker.release_trial()
+                    raise
+                logger.warning("Milvus call failed (attempt %d/%d): %s", attempt + 1, attempts, e)
+
+            if attempt + 1 < attempts:
+                delay = min(MILVUS_BACKOFF_MAX, MILVUS_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                if time.monotonic() + delay >= deadline:
+                    logger.warning("Milvus call budget exhausted after %d attempts", attempt + 1)
+                    break
+                time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error
+
+    def ping(self) -> bool:
+        """
+        True if the server answers a version request (single attempt)
+        """
+        def server_version(slot):
+            from pymilvus import utility
+            return utility.get_server_version(using=slot.alias)
+
+        try:
+            self.run(server_version, attempts=1)
+            return True
+        except Exception:
+            return False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "utilisation": round(self.in_use / self.size, 3) if self.size else 0.0,
+                "leases": self.leases,
+                "waits": self.waits,
+                "avg_wait_ms": round(1000 * self.wait_seconds / self.waits, 2) if self.waits else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 2),
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "breaker": self.breaker.state,
+                "breaker_opened": self.breaker.opened,
+            }
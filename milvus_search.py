@@ -1,16 +1,23 @@
+from embedder import embed_query
+from milvus_config import TEXT_COLLECTION_NAME, IMAGE_COLLECTION_NAME
+from search_backends import get_backend
+
+
 def search_text_and_images(query, top_k=3):
     """
-    Temporary mock search function.
-    Replace this with real Milvus search later.
+    Search text chunks and images through the configured search backend
+    (SEARCH_BACKEND=milvus|local).
     """
+    query_vector = embed_query(query)
+    backend = get_backend()
+
+    text_hits = backend.search(TEXT_COLLECTION_NAME, [query_vector], top_k, ["text"])[0]
+    image_hits = backend.search(IMAGE_COLLECTION_NAME, [query_vector], top_k, ["image_path"])[0]
 
     return [
-        {
-            "type": "text",
-            "content": "This is a sample retrieved manual section related to wiring diagrams."
-        },
-        {
-            "type": "image",
-            "image": "wiring_diagram_page3.png"
-        }
+        {"type": "text", "content": hit["text"], "score": hit["score"]}
+        for hit in text_hits
+    ] + [
+        {"type": "image", "image": hit["image_path"], "score": hit["score"]}
+        for hit in image_hits
     ]
@@ -3,11 +3,13 @@ milvus_setup.py
 
 Purpose:
 - Connect to Milvus
-- Create collection for text embeddings
-- Create ANN index
-- Load collection into memory
+- Create the text and image collections used by retriever.py
+- Create ANN index from the active profile in milvus_config.py
+- Load collections into memory
+- Write the index version marker (write_index_version, called by milvus_loader)
 
-This file is executed once during system setup.
+This file is executed once during system setup; milvus_loader.py imports
+its helpers to make sure the collections exist before loading vectors.
 """
 
 from pymilvus import (
@@ -19,85 +21,119 @@ from pymilvus import (
     utility
 )
 
-#Connect to Milvus
-connections.connect(
-    alias="default",
-    host="localhost",
-    port="19530"
+from milvus_config import (
+    MILVUS_HOST,
+    MILVUS_PORT,
+    TEXT_COLLECTION_NAME,
+    IMAGE_COLLECTION_NAME,
+    VERSION_COLLECTION_NAME,
+    VERSION_ROW_ID,
+    EMBEDDING_DIM,
+    INDEX_PROFILE,
+    index_params
 )
 
-print("Connected to Milvus successfully.")
+#Define Constants (connection, dim and index profile live in milvus_config.py)
+TEXT_MAX_LENGTH = 8192
+PATH_MAX_LENGTH = 1024
+VERSION_MAX_LENGTH = 64
 
 
-#Define Constants
-COLLECTION_NAME = "text_embeddings"
-EMBEDDING_DIM = 768  
+def connect(alias="default"):
+    connections.connect(
+        alias=alias,
+        host=MILVUS_HOST,
+        port=MILVUS_PORT
+    )
+    print("Connected to Milvus successfully.")
+
 
+#Collection Schemas
+def text_schema():
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM),
+        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=TEXT_MAX_LENGTH),
+        FieldSchema(name="chunk_id", dtype=DataType.VARCHAR, max_length=255),
+        FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=255)
+    ]
+    return CollectionSchema(fields=fields, description="Text chunk embeddings for RAG system")
 
-#Check if Collection Exists
-if utility.has_collection(COLLECTION_NAME):
-    print(f"Collection '{COLLECTION_NAME}' already exists.")
-    collection = Collection(COLLECTION_NAME)
-else:
-    print(f"Creating collection '{COLLECTION_NAME}'...")
 
-    #Define Collection Schema
+def image_schema():
     fields = [
-        FieldSchema(
-            name="id",
-            dtype=DataType.INT64,
-            is_primary=True,
-            auto_id=True
-        ),
-        FieldSchema(
-            name="embedding",
-            dtype=DataType.FLOAT_VECTOR,
-            dim=EMBEDDING_DIM
-        ),
-        FieldSchema(
-            name="content",
-            dtype=DataType.VARCHAR,
-            max_length=1000
-        ),
-        FieldSchema(
-            name="source",
-            dtype=DataType.VARCHAR,
-            max_length=255
-        )
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM),
+        FieldSchema(name="image_path", dtype=DataType.VARCHAR, max_length=PATH_MAX_LENGTH),
+        FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=255)
     ]
+    return CollectionSchema(fields=fields, description="Image embeddings for RAG system")
 
-    schema = CollectionSchema(
-        fields=fields,
-        description="Text embeddings for RAG system"
-    )
 
-    collection = Collection(
-        name=COLLECTION_NAME,
-        schema=schema
-    )
+def version_schema():
+    # Milvus needs a vector field in every collection; this one is never searched
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=2),
+        FieldSchema(name="version", dtype=DataType.VARCHAR, max_length=VERSION_MAX_LENGTH)
+    ]
+    return CollectionSchema(fields=fields, description="Index version marker for RAG caches")
+
+
+def ensure_collection(name, schema, profile=None):
+    """
+    Return the collection, creating it (with the profile's ANN index) if missing
+    """
+    #Check if Collection Exists
+    if utility.has_collection(name):
+        print(f"Collection '{name}' already exists.")
+        collection = Collection(name)
+    else:
+        print(f"Creating collection '{name}'...")
+        collection = Collection(name=name, schema=schema)
+        print("Collection created successfully.")
+
+    #Create Index (ANN)
+    if not collection.has_index():
+        print(f"Creating {profile or INDEX_PROFILE} index on embedding field...")
+
+        collection.create_index(
+            field_name="embedding",
+            index_params=index_params(profile)
+        )
 
-    print("Collection created successfully.")
+        print("Index created successfully.")
+    else:
+        print("Index already exists.")
 
+    return collection
 
-#Create Index (ANN)
-if not collection.has_index():
-    print("Creating index on embedding field...")
 
-    index_params = {
-        "metric_type": "COSINE",
-        "index_type": "IVF_FLAT",
-        "params": {"nlist": 128}
-    }
+def write_index_version(version):
+    """
+    Replace the index version marker; caches keyed by the index version are
+    invalidated once the API next reads it
+    """
+    collection = ensure_collection(VERSION_COLLECTION_NAME, version_schema(), profile="FLAT")
+    collection.delete(f"id in [{VERSION_ROW_ID}]")
+    collection.insert([[VERSION_ROW_ID], [[0.0, 0.0]], [str(version)[:VERSION_MAX_LENGTH]]])
+    collection.flush()
+    print(f"Index version set to {version}")
 
-    collection.create_index(
-        field_name="embedding",
-        index_params=index_params
-    )
 
-    print("Index created successfully.")
-else:
-    print("Index already exists.")
+def run():
+    connect()
+
+    for name, schema in (
+        (TEXT_COLLECTION_NAME, text_schema()),
+        (IMAGE_COLLECTION_NAME, image_schema()),
+    ):
+        collection = ensure_collection(name, schema)
+
+        #Loading the Collection
+        collection.load()
+        print(f"Collection '{name}' loaded into memory and ready for use.")
+
 
-#Loading the Collection
-collection.load()
-print("Collection loaded into memory and ready for use.")
+if __name__ == "__main__":
+    run()
@@ -1,39 +1,263 @@
 import fitz
 import os
+import json
 from PIL import Image
 import io
-from run_config import PATHS
+from concurrent.futures import ProcessPoolExecutor
+from run_config import PATHS, ensure_run_dirs
+from ingest_manifest import IngestManifest, file_hash, bytes_hash, text_hash, link_or_copy, atomic_write
 
 PDF_FOLDER = "data/manuals"
 OUTPUT_TEXT = PATHS["extracted_text"]
 OUTPUT_IMAGES = PATHS["extracted_images"]
+OUTPUT_METADATA = PATHS["metadata"]
 
+# Parallelism: PDF_WORKERS=1 keeps everything in-process
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
 
-def extract_from_pdf(pdf_path):
+# Image formats written byte-for-byte; anything else is converted to PNG
+DIRECT_WRITE_EXTS = ("png", "jpg", "jpeg")
+
+# Per-process worker state. Passed explicitly because spawned workers re-import
+# run_config and would otherwise resolve a different run directory.
+_known_images = {}
+_output_images = OUTPUT_IMAGES
+
+
+def _init_worker(known_images, output_images):
+    global _known_images, _output_images
+    _known_images = known_images
+    _output_images = output_images
+
+
+def plan_images(doc, pdf_name):
+    """
+    Assign every distinct image xref to the first page it appears on, and
+    list every page (1-based) it appears on. Repeated xrefs (logos, headers)
+    are extracted and stored only once.
+    """
+    owners = {}
+
+    for page_num, page in enumerate(doc):
+        for img_index, img in enumerate(page.get_images(full=True)):
+            xref = img[0]
+            if xref not in owners:
+                owners[xref] = (page_num, f"{pdf_name}_page{page_num+1}_{img_index+1}", [])
+            pages = owners[xref][2]
+            if not pages or pages[-1] != page_num + 1:
+                pages.append(page_num + 1)
+
+    return owners
+
+
+def _write_image(base, stem):
+    """
+    Write raw image bytes when the format is usable as-is, else convert once
+    """
+    if base["ext"].lower() in DIRECT_WRITE_EXTS:
+        out_path = os.path.join(_output_images, f"{stem}.{base['ext']}")
+        with atomic_write(out_path) as tmp, open(tmp, "wb") as f:
+            f.write(base["image"])
+        return out_path
+
+    out_path = os.path.join(_output_images, f"{stem}.png")
+    with atomic_write(out_path) as tmp:
+        Image.open(io.BytesIO(base["image"])).save(tmp, format="PNG")
+    return out_path
+
+
+def extract_page_range(pdf_path, page_start, page_end, images):
+    """
+    Extract text for pages [page_start, page_end) and the images owned by them.
+
+    images: list of (xref, stem, pages) whose first occurrence lies in this
+    range. Returns (page_start, page_texts, image_results) where each image
+    result is (out_path, image_hash, reused, pages).
+    """
     doc = fitz.open(pdf_path)
-    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
 
+    texts = [doc[n].get_text("text") for n in range(page_start, page_end)]
+
+    image_results = []
+    for xref, stem, pages in images:
+        base = doc.extract_image(xref)
+        image_key = bytes_hash(base["image"])
+        previous = _known_images.get(image_key)
+
+        # Same image bytes seen in an earlier run → link the stored file, skip writing
+        if previous is not None and os.path.exists(previous):
+            out_path = os.path.join(_output_images, stem + os.path.splitext(previous)[1])
+            link_or_copy(previous, out_path)
+            image_results.append((out_path, image_key, True, pages))
+        else:
+            image_results.append((_write_image(base, stem), image_key, False, pages))
+
+    doc.close()
+
+    return page_start, texts, image_results
+
+
+def plan_tasks(pdf_path, pdf_name):
+    """
+    Split one PDF into page-range tasks, each carrying the images it owns
+    """
+    doc = fitz.open(pdf_path)
+    page_count = doc.page_count
+    owners = plan_images(doc, pdf_name)
+    doc.close()
+
+    tasks = []
+    for start in range(0, page_count, PAGES_PER_TASK):
+        end = min(start + PAGES_PER_TASK, page_count)
+        owned = [
+            (xref, stem, pages)
+            for xref, (page_num, stem, pages) in owners.items()
+            if start <= page_num < end
+        ]
+        tasks.append((pdf_path, start, end, owned))
+
+    return tasks
+
+
+def image_pages_file(pdf_name):
+    return os.path.join(OUTPUT_METADATA, f"image_pages_{pdf_name}.json")
+
+
+def write_image_pages(pdf_name, image_pages):
+    """
+    Image filename -> every page it appears on, for metadata_and_linking
+    (the filename only carries the first page)
+    """
+    path = image_pages_file(pdf_name)
+    with atomic_write(path) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        json.dump(image_pages, f, separators=(",", ":"))
+    return path
+
+
+def write_document(pdf_name, results, manifest=None):
+    """
+    Write page text in [PAGE_BREAK_n] order, the pages of every image, and
+    record images in the manifest
+    """
     text_output_path = os.path.join(OUTPUT_TEXT, f"{pdf_name}.txt")
+    images = []
+    image_pages = {}
+
+    # Replaced, not rewritten: a reused run may share this file's inode
+    with atomic_write(text_output_path) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        for page_start, texts, image_results in sorted(results, key=lambda r: r[0]):
+            for offset, text in enumerate(texts):
+                page_num = page_start + offset
+                f.write(f"\n[PAGE_BREAK_{page_num + 1}]\n{text}\n")
 
-    with open(text_output_path, "w", encoding="utf-8") as f:
-        for page_num, page in enumerate(doc):
-            text = page.get_text("text")
-            f.write(f"\n[PAGE_BREAK_{page_num + 1}]\n{text}\n")
+                if manifest is not None:
+                    page_key = text_hash(text)
+                    manifest.mark("page", reused=page_key in manifest.entries["page"])
+                    manifest.record("page", page_key, {"pdf": pdf_name, "page": page_num + 1})
 
-            for img_index, img in enumerate(page.get_images(full=True)):
-                xref = img[0]
-                base = doc.extract_image(xref)
-                image = Image.open(io.BytesIO(base["image"]))
-                name = f"{pdf_name}_page{page_num+1}_{img_index+1}.{base['ext']}"
-                image.save(os.path.join(OUTPUT_IMAGES, name))
+            for out_path, image_key, reused, pages in image_results:
+                images.append(out_path)
+                image_pages[os.path.basename(out_path)] = pages
+                if manifest is not None:
+                    manifest.mark("image", reused=reused)
+                    manifest.record("image", image_key, out_path)
+
+    pages_file = write_image_pages(pdf_name, image_pages)
 
     print(f"✔ Parsed: {pdf_name}")
 
+    return {"name": pdf_name, "text_file": text_output_path, "images": images, "image_pages_file": pages_file}
+
+
+def extract_from_pdf(pdf_path, manifest=None):
+    """
+    Serial extraction of a single PDF (same output as the parallel path)
+    """
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    known_images = dict(manifest.entries["image"]) if manifest is not None else {}
+    _init_worker(known_images, OUTPUT_IMAGES)
+
+    results = [extract_page_range(*task) for task in plan_tasks(pdf_path, pdf_name)]
+    return write_document(pdf_name, results, manifest)
+
+
+def reuse_pdf_artifacts(artifact, pdf_name):
+    """
+    Link an earlier run's text and images into this run, renamed for pdf_name
+    """
+    text_file = os.path.join(OUTPUT_TEXT, f"{pdf_name}.txt")
+    link_or_copy(artifact["text_file"], text_file)
+
+    def renamed(path):
+        return pdf_name + os.path.basename(path)[len(artifact["name"]):]
+
+    images = []
+    for src in artifact["images"]:
+        dst = os.path.join(OUTPUT_IMAGES, renamed(src))
+        link_or_copy(src, dst)
+        images.append(dst)
+
+    reused = {"name": pdf_name, "text_file": text_file, "images": images}
+
+    # Artifacts from before image pages were recorded have none; linking then
+    # falls back to the page in the filename
+    pages_file = artifact.get("image_pages_file")
+    if pages_file and os.path.exists(pages_file):
+        with open(pages_file, "r", encoding="utf-8") as f:
+            image_pages = {renamed(name): pages for name, pages in json.load(f).items()}
+        reused["image_pages_file"] = write_image_pages(pdf_name, image_pages)
+
+    print(f"↺ Reused: {pdf_name}")
+
+    return reused
+
+
+def run(workers=PDF_WORKERS):
+    ensure_run_dirs()
+    manifest = IngestManifest()
+    pending = {}
 
-def run():
     for file in os.listdir(PDF_FOLDER):
         if file.lower().endswith(".pdf"):
-            extract_from_pdf(os.path.join(PDF_FOLDER, file))
+            pdf_path = os.path.join(PDF_FOLDER, file)
+            pdf_name = os.path.splitext(file)[0]
+            key = file_hash(pdf_path)
+
+            previous = manifest.lookup("pdf", key)
+            manifest.mark("pdf", reused=previous is not None)
+
+            if previous is not None:
+                manifest.record("pdf", key, reuse_pdf_artifacts(previous, pdf_name))
+            else:
+                pending[key] = (pdf_name, plan_tasks(pdf_path, pdf_name))
+
+    known_images = dict(manifest.entries["image"])
+
+    if workers <= 1:
+        _init_worker(known_images, OUTPUT_IMAGES)
+        for key, (pdf_name, tasks) in pending.items():
+            results = [extract_page_range(*task) for task in tasks]
+            manifest.record("pdf", key, write_document(pdf_name, results, manifest))
+    else:
+        # Page-range tasks from every document share one pool
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(known_images, OUTPUT_IMAGES)
+        ) as pool:
+            futures = {
+                key: [pool.submit(extract_page_range, *task) for task in tasks]
+                for key, (pdf_name, tasks) in pending.items()
+            }
+
+            for key, (pdf_name, _) in pending.items():
+                results = [fut.result() for fut in futures[key]]
+                manifest.record("pdf", key, write_document(pdf_name, results, manifest))
+
+    manifest.save()
+    manifest.write_summary()
 
 
 if __name__ == "__main__":
@@ -1,27 +1,73 @@
 import os
+import asyncio
+import time
 import logging
-import traceback
-from typing import List, Any
-from functools import lru_cache
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, AsyncIterator, Dict, Optional, Tuple
 
-from groq import Groq
-from retriever import retrieve_context
+from retriever import retrieve_context, cached_embed_query, search_vectors
+from lexical_index import get_lexical_index
+from semantic_cache import answer_cache, SEMANTIC_CACHE_ENABLED
+from cache import llm_cache
+from milvus_pool import CircuitOpenError
 from language_utils import normalize_question, translate_answer
+from context_packer import pack_context, get_token_counter
+from reranker import rerank, warmup as warmup_reranker, RERANK_ENABLED, RERANK_CANDIDATES
+from llm_providers import get_llm, LLM_TEMPERATURE, LLM_MAX_TOKENS
+from metrics import (
+    span, add_request_id_filter, STAGE_SECONDS, CACHE_LOOKUPS, FALLBACKS, LLM_ERRORS,
+    CONTEXT_TOKENS, CONTEXT_DROPPED
+)
 
 
-# Logger Configuration
+# Logger Configuration (request ID comes from the API middleware via metrics.request_id_var)
 logging.basicConfig(
     level=logging.INFO,  # Change to DEBUG for deeper tracing
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    format="%(asctime)s | %(levelname)s | %(name)s | id=%(request_id)s | %(message)s"
 )
+add_request_id_filter(logging.getLogger())
 logger = logging.getLogger("RAGPipeline")
 
-# Configuration
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
-MAX_CONTEXT_CHARS = 3500
+# Configuration (LLM backends, timeouts, retries and hedging: llm_providers.py)
+# Async path: blocking stages run on a bounded pool, each with its own timeout (seconds)
+BLOCKING_WORKERS = int(os.getenv("RAG_BLOCKING_WORKERS", "16"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RAG_RETRIEVAL_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("RAG_LLM_TIMEOUT", "30"))
+TRANSLATION_TIMEOUT = float(os.getenv("RAG_TRANSLATION_TIMEOUT", "10"))
+CONTEXT_TIMEOUT = float(os.getenv("RAG_CONTEXT_TIMEOUT", "2"))
+
+_blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="rag")
+
+def warmup() -> Dict[str, float]:
+    """
+    Load everything the first request would otherwise pay for: LLM clients
+    (or the local model), the CLIP query encoder, the search backend's
+    collections, the BM25 index, the context tokenizer and the reranker (which
+    also times one batch for its budget). Failures are logged, not raised, so
+    the API still starts with Milvus or the model down. Returns seconds spent
+    per step.
+    """
+    timings = {}
+
+    def step(name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            logger.warning("Warmup step '%s' failed", name, exc_info=True)
+        timings[name] = round(time.perf_counter() - started, 3)
 
-client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+    step("llm", lambda: get_llm() and get_llm().warmup())
+    step("query_encoder", lambda: cached_embed_query("warmup"))
+    step("search_backend", lambda: search_vectors([cached_embed_query("warmup")], top_k=1))
+    step("lexical_index", get_lexical_index)
+    step("context_tokenizer", get_token_counter)
+    if RERANK_ENABLED:
+        step("reranker", warmup_reranker)
+
+    logger.info("Warmup finished: %s", timings)
+    return timings
 
 # Helper Functions
 def _safe_extract_text(item: Any) -> str:
@@ -46,19 +92,42 @@ def _safe_extract_text(item: Any) -> str:
     return ""
 
 
-def _build_context(results: List[Any]) -> str:
+def _retrieve(question: str) -> List[Dict]:
     """
-    Build a clean context string with length control
+    retrieve_context, or with RERANK_ENABLED an over-fetch of
+    RERANK_CANDIDATES hits reordered by the cross-encoder (reranker.py)
     """
-    parts = []
+    if not RERANK_ENABLED:
+        return retrieve_context(question)
 
-    for item in results:
-        text = _safe_extract_text(item)
-        if text:
-            parts.append(text)
+    candidates = retrieve_context(question, top_k=RERANK_CANDIDATES)
+    with span("rerank"):
+        results, report = rerank(question, candidates)
+    logger.info(
+        "Reranked %d candidates in %.1f ms (%d cached, mean rank shift %.2f%s)",
+        report["candidates"], report["ms"], report["cached"], report["mean_rank_shift"],
+        f", skipped: {report['skipped']}" if report["skipped"] else ""
+    )
+    return results
 
-    context = "\n\n".join(parts)
-    return context[:MAX_CONTEXT_CHARS]
+
+def _build_context(results: List[Any]) -> str:
+    """
+    Most relevant whole chunks, near-duplicates removed, within the
+    CONTEXT_MAX_TOKENS budget (context_packer.py); tokens used are logged
+    and recorded in metrics
+    """
+    context, report = pack_context(results, _safe_extract_text)
+
+    CONTEXT_TOKENS.observe(report["tokens"])
+    CONTEXT_DROPPED.inc(report["duplicates"], reason="duplicate")
+    CONTEXT_DROPPED.inc(report["over_budget"], reason="over_budget")
+    logger.info(
+        "Context packed: %d/%d tokens, %d of %d items (%d duplicates, %d over budget)",
+        report["tokens"], report["budget"], report["packed"], report["items"],
+        report["duplicates"], report["over_budget"]
+    )
+    return context
 
 
 def _local_fallback_answer(context: str) -> str:
@@ -74,69 +143,416 @@ def _local_fallback_answer(context: str) -> str:
         "(LLM unavailable — showing retrieved context only.)"
     )
 
+# Returned without calling the LLM while the search backend's circuit is open
+DEGRADED_ANSWER = (
+    "Document search is temporarily unavailable, so I cannot answer from the "
+    "indexed documents right now. Please try again in a minute."
+)
+
+
+def _build_prompt(context: str, question: str) -> str:
+    return f"""
+You are an AI assistant.
+Answer ONLY using the provided context.
+If the answer is not present, say "I don't know".
+
+Context:
+{context}
+
+Question:
+{question}
+"""
+
+
+def _llm_key(prompt: str):
+    return (get_llm().model_key, LLM_TEMPERATURE, LLM_MAX_TOKENS, prompt)
+
+
+def _complete(prompt: str) -> str:
+    """
+    Blocking completion, cached (and de-duplicated) by prompt in llm_cache
+    """
+    return llm_cache.get_or_compute(_llm_key(prompt), lambda: get_llm().complete(prompt))
+
+
+async def _complete_async(prompt: str) -> str:
+    """
+    Async completion sharing llm_cache with _complete
+    """
+    async def call():
+        return await asyncio.wait_for(get_llm().acomplete(prompt), LLM_TIMEOUT)
+
+    return await llm_cache.aget_or_compute(_llm_key(prompt), call)
+
+
+# Answer cache (semantic_cache.py): keyed by the normalized question's
+# embedding, stores the English answer so each hit is translated for its caller
+def _cache_lookup(normalized_question: str) -> Tuple[Optional[List[float]], Optional[Dict]]:
+    """
+    (query vector, cached entry or None); the vector is None when caching is off
+    or the question could not be embedded
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
+
+    try:
+        vector = cached_embed_query(normalized_question)
+    except Exception:
+        logger.error("Query embedding for answer cache failed", exc_info=True)
+        return None, None
+
+    cached = answer_cache.get(vector, normalized_question)
+    CACHE_LOOKUPS.inc(cache="answer", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        logger.info("Answer cache hit")
+    return vector, cached
+
+
+def _cache_store(normalized_question: str, vector: Optional[List[float]], answer: str, results: List[Any]):
+    # Only LLM answers are cached, never the fallback
+    if vector is not None and answer:
+        answer_cache.put(
+            vector,
+            {"answer": answer, "sources": [_source_summary(r) for r in results]},
+            normalized_question
+        )
+
+
+def _normalize_sync(question: str) -> Tuple[str, str]:
+    """
+    normalize_question for the sync path; on failure the question is
+    answered as asked, in English
+    """
+    try:
+        with span("normalize_question", logger):
+            return normalize_question(question)
+    except Exception:
+        logger.error("Question normalization failed", exc_info=True)
+        return question, "en"
+
+
+def _translate_sync(answer: str, lang: str) -> str:
+    """
+    translate_answer for the sync path; on failure the English answer is returned
+    """
+    try:
+        with span("translate_answer", logger):
+            return translate_answer(answer, lang)
+    except Exception:
+        logger.error("Answer translation failed", exc_info=True)
+        return answer
+
+
 # Main RAG Pipeline
-@lru_cache(maxsize=128)
 def answer_question(question: str) -> str:
     """
     Production-ready RAG pipeline
 
     Features:
     - Multilingual support
-    - Performance caching
+    - Semantic answer caching
     - Structured logging
     - Safe fallbacks
-    - Context length control
+    - Token-budgeted, de-duplicated context
     """
 
     logger.info("Received question")
 
     # Language normalization
-    normalized_question, original_lang = normalize_question(question)
+    normalized_question, original_lang = _normalize_sync(question)
     logger.debug("Normalized question: %s", normalized_question)
 
+    with span("answer_cache_lookup", logger):
+        query_vector, cached = _cache_lookup(normalized_question)
+    if cached is not None:
+        return _translate_sync(cached["answer"], original_lang)
+
     # Retrieval
     try:
-        results = retrieve_context(normalized_question)
+        with span("retrieval", logger):
+            results = _retrieve(normalized_question)
         logger.info("Retrieved %d context items", len(results))
+    except CircuitOpenError:
+        logger.warning("Search backend unavailable (circuit open), answering in degraded mode")
+        FALLBACKS.inc(reason="degraded")
+        return _translate_sync(DEGRADED_ANSWER, original_lang)
     except Exception as e:
         logger.error("Retriever failed", exc_info=True)
         results = []
 
-    context = _build_context(results)
+    with span("context_build", logger):
+        context = _build_context(results)
+        prompt = _build_prompt(context, normalized_question)
 
-    prompt = f"""
-You are an AI assistant.
-Answer ONLY using the provided context.
-If the answer is not present, say "I don't know".
+    # LLM call
+    answer = None
+    if get_llm():
+        try:
+            logger.info("Calling LLM: %s", get_llm().name)
 
-Context:
-{context}
+            with span("llm", logger):
+                answer = _complete(prompt)
+            logger.info("LLM response generated successfully")
+            _cache_store(normalized_question, query_vector, answer, results)
+
+        except Exception:
+            logger.error("LLM call failed", exc_info=True)
+            LLM_ERRORS.inc(kind="error")
+
+    if answer is None:
+        # Safe fallback
+        logger.warning("Using fallback answer (LLM unavailable)")
+        FALLBACKS.inc(reason="llm_error" if get_llm() else "llm_unavailable")
+        answer = _local_fallback_answer(context)
+
+    return _translate_sync(answer, original_lang)
 
-Question:
-{normalized_question}
-"""
+
+async def _run_blocking(timeout: float, fn, *args):
+    """
+    Run a blocking stage on the bounded pool with a timeout. On timeout the
+    caller moves on; the worker thread finishes in the background.
+    """
+    loop = asyncio.get_running_loop()
+    # Copy the context so the request ID reaches logs written on the pool thread
+    ctx = contextvars.copy_context()
+    return await asyncio.wait_for(loop.run_in_executor(_blocking_pool, ctx.run, fn, *args), timeout)
+
+
+async def _run_stage(stage: str, timeout: float, fn, *args):
+    """
+    _run_blocking timed as one pipeline stage (metrics.span)
+    """
+    with span(stage, logger):
+        return await _run_blocking(timeout, fn, *args)
+
+
+async def _normalize_async(question: str) -> Tuple[str, str]:
+    """
+    normalize_question with a timeout; on timeout or failure the question is
+    answered as asked, in English
+    """
+    try:
+        return await _run_stage("normalize_question", TRANSLATION_TIMEOUT, normalize_question, question)
+    except asyncio.TimeoutError:
+        logger.error("Question normalization timed out after %.1fs", TRANSLATION_TIMEOUT)
+    except Exception:
+        logger.error("Question normalization failed", exc_info=True)
+    return question, "en"
+
+
+async def _translate_async(answer: str, lang: str) -> str:
+    """
+    translate_answer with a timeout; on timeout or failure the English answer
+    is returned rather than failing the request
+    """
+    try:
+        return await _run_stage("translate_answer", TRANSLATION_TIMEOUT, translate_answer, answer, lang)
+    except asyncio.TimeoutError:
+        logger.error("Answer translation timed out after %.1fs", TRANSLATION_TIMEOUT)
+    except Exception:
+        logger.error("Answer translation failed", exc_info=True)
+    return answer
+
+
+async def _context_async(results: List[Any], normalized_question: str) -> Tuple[str, str]:
+    """
+    (context, prompt) with the context packed on the blocking pool; on
+    timeout or failure the question goes to the LLM without context
+    """
+    context = ""
+    try:
+        context = await _run_stage("context_build", CONTEXT_TIMEOUT, _build_context, results)
+    except asyncio.TimeoutError:
+        logger.error("Context build timed out after %.1fs", CONTEXT_TIMEOUT)
+    except Exception:
+        logger.error("Context build failed", exc_info=True)
+    return context, _build_prompt(context, normalized_question)
+
+
+async def answer_question_async(question: str) -> str:
+    """
+    Non-blocking variant of answer_question for the API
+
+    - Retrieval / language steps run on a bounded thread pool
+    - LLM call goes through the async provider API (llm_providers.py)
+    - Every stage has its own timeout and degrades to the fallback answer
+    """
+
+    logger.info("Received question (async)")
+
+    normalized_question, original_lang = await _normalize_async(question)
+
+    try:
+        query_vector, cached = await _run_stage("answer_cache_lookup", RETRIEVAL_TIMEOUT, _cache_lookup, normalized_question)
+    except asyncio.TimeoutError:
+        query_vector, cached = None, None
+    if cached is not None:
+        return await _translate_async(cached["answer"], original_lang)
+
+    # Retrieval
+    try:
+        results = await _run_stage("retrieval", RETRIEVAL_TIMEOUT, _retrieve, normalized_question)
+        logger.info("Retrieved %d context items", len(results))
+    except asyncio.TimeoutError:
+        logger.error("Retriever timed out after %.1fs", RETRIEVAL_TIMEOUT)
+        results = []
+    except CircuitOpenError:
+        logger.warning("Search backend unavailable (circuit open), answering in degraded mode")
+        FALLBACKS.inc(reason="degraded")
+        return await _translate_async(DEGRADED_ANSWER, original_lang)
+    except Exception:
+        logger.error("Retriever failed", exc_info=True)
+        results = []
+
+    context, prompt = await _context_async(results, normalized_question)
 
     # LLM call
-    if client:
+    answer = None
+    if get_llm():
         try:
-            logger.info("Calling Groq model: %s", GROQ_MODEL)
-
-            response = client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=500,
-            )
+            logger.info("Calling LLM (async): %s", get_llm().name)
 
-            answer = response.choices[0].message.content.strip()
+            with span("llm", logger):
+                answer = await _complete_async(prompt)
             logger.info("LLM response generated successfully")
+            _cache_store(normalized_question, query_vector, answer, results)
+
+        except asyncio.TimeoutError:
+            logger.error("LLM call timed out after %.1fs", LLM_TIMEOUT)
+            LLM_ERRORS.inc(kind="timeout")
+        except Exception:
+            logger.error("LLM call failed", exc_info=True)
+            LLM_ERRORS.inc(kind="error")
+
+    if answer is None:
+        # Safe fallback
+        logger.warning("Using fallback answer (LLM unavailable)")
+        FALLBACKS.inc(reason="llm_error" if get_llm() else "llm_unavailable")
+        answer = _local_fallback_answer(context)
+
+    return await _translate_async(answer, original_lang)
+
+
+def _source_summary(item: Any) -> Dict:
+    """
+    Compact description of a retrieved item, sent to clients before the answer
+    """
+    if isinstance(item, dict):
+        summary = {"type": item.get("type", "text"), "score": item.get("score")}
+        if item.get("image_path"):
+            summary["image_path"] = item["image_path"]
+        else:
+            summary["text"] = _safe_extract_text(item)[:300]
+        return summary
+
+    return {"type": "text", "text": _safe_extract_text(item)[:300]}
+
+
+async def stream_answer(question: str) -> AsyncIterator[Dict]:
+    """
+    Streaming variant of answer_question_async. Yields events:
+
+        {"type": "sources", "sources": [...]}   as soon as retrieval finishes
+        {"type": "token", "text": "..."}        LLM tokens as they arrive
+        {"type": "done"}
+
+    Answers to non-English questions are translated as a whole, so they
+    arrive as a single token event after generation.
+    """
+
+    logger.info("Received question (stream)")
 
-            return translate_answer(answer, original_lang)
+    normalized_question, original_lang = await _normalize_async(question)
 
+    try:
+        query_vector, cached = await _run_stage("answer_cache_lookup", RETRIEVAL_TIMEOUT, _cache_lookup, normalized_question)
+    except asyncio.TimeoutError:
+        query_vector, cached = None, None
+    if cached is not None:
+        yield {"type": "sources", "sources": cached["sources"]}
+        translated = await _translate_async(cached["answer"], original_lang)
+        yield {"type": "token", "text": translated}
+        yield {"type": "done", "cached": True}
+        return
+
+    # Retrieval
+    try:
+        results = await _run_stage("retrieval", RETRIEVAL_TIMEOUT, _retrieve, normalized_question)
+        logger.info("Retrieved %d context items", len(results))
+    except asyncio.TimeoutError:
+        logger.error("Retriever timed out after %.1fs", RETRIEVAL_TIMEOUT)
+        results = []
+    except CircuitOpenError:
+        logger.warning("Search backend unavailable (circuit open), answering in degraded mode")
+        FALLBACKS.inc(reason="degraded")
+        translated = await _translate_async(DEGRADED_ANSWER, original_lang)
+        yield {"type": "sources", "sources": []}
+        yield {"type": "token", "text": translated}
+        yield {"type": "done", "degraded": True}
+        return
+    except Exception:
+        logger.error("Retriever failed", exc_info=True)
+        results = []
+
+    yield {"type": "sources", "sources": [_source_summary(r) for r in results]}
+
+    context, prompt = await _context_async(results, normalized_question)
+    stream_tokens = original_lang in (None, "", "en")
+
+    # LLM call
+    if get_llm():
+        parts = []
+        completed = False
+        stream = get_llm().astream(prompt)
+        try:
+            logger.info("Calling LLM (stream): %s", get_llm().name)
+            llm_started = time.perf_counter()
+            deadline = asyncio.get_running_loop().time() + LLM_TIMEOUT
+
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    delta = await asyncio.wait_for(stream.__anext__(), max(remaining, 0.001))
+                except StopAsyncIteration:
+                    break
+
+                if not parts:
+                    STAGE_SECONDS.observe(time.perf_counter() - llm_started, stage="llm_first_token")
+                parts.append(delta)
+                if stream_tokens:
+                    yield {"type": "token", "text": delta}
+
+            STAGE_SECONDS.observe(time.perf_counter() - llm_started, stage="llm")
+            logger.info("LLM stream completed successfully")
+            _cache_store(normalized_question, query_vector, "".join(parts).strip(), results)
+            completed = True
+
+        except asyncio.TimeoutError:
+            logger.error("LLM stream timed out after %.1fs", LLM_TIMEOUT)
+            LLM_ERRORS.inc(kind="timeout")
         except Exception:
-            logger.error("Groq LLM call failed", exc_info=True)
+            logger.error("LLM stream failed", exc_info=True)
+            LLM_ERRORS.inc(kind="error")
+        finally:
+            await stream.aclose()
+
+        if completed:
+            if not stream_tokens:
+                translated = await _translate_async("".join(parts).strip(), original_lang)
+                yield {"type": "token", "text": translated}
+            yield {"type": "done"}
+            return
+
+        # Tokens already sent cannot be taken back; finish the stream as-is
+        if parts and stream_tokens:
+            yield {"type": "done", "truncated": True}
+            return
 
     # Safe fallback
     logger.warning("Using fallback answer (LLM unavailable)")
+    FALLBACKS.inc(reason="llm_error" if get_llm() else "llm_unavailable")
     fallback = _local_fallback_answer(context)
-    return translate_answer(fallback, original_lang)
+    translated = await _translate_async(fallback, original_lang)
+    yield {"type": "token", "text": translated}
+    yield {"type": "done", "fallback": True}
@@ -0,0 +1,255 @@
+"""
+reranker.py
+
+Purpose:
+- Optional stage between retrieval and context packing (RERANK_ENABLED=1):
+  retrieval over-fetches RERANK_CANDIDATES hits, a small cross-encoder
+  rescores every text hit against the question, and the best RERANK_TOP_K
+  are kept
+- CPU inference in length-sorted batches, int8 dynamic quantization by
+  default (RERANK_PRECISION)
+- Per-request latency budget (RERANK_BUDGET_MS): a batch is only started if
+  it is expected to finish in time; otherwise reranking is skipped and the
+  retrieval order is used. Until the model is loaded and one batch has been
+  timed (warmup(), run by rag_pipeline.warmup or started in the background by
+  the first request) reranking is skipped as "cold".
+- (query, chunk) scores are cached (cache.rerank_cache), so repeated
+  questions only pay for chunks they have not seen
+- Rerank time (rag_stage_seconds{stage="rerank"}), how far ranks moved and
+  skips are exported to metrics
+
+Images are not rescored; they keep their retrieval order and scores.
+Reranked text hits keep norm_score on the retriever's calibrated scale, so
+the two modalities still compare.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from cache import rerank_cache
+from metrics import RERANK_RANK_SHIFT, RERANK_SKIPPED
+
+logger = logging.getLogger("Reranker")
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))   # retrieval depth when reranking
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))              # hits kept per modality
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # query + chunk tokens
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_PRECISION = os.getenv("RERANK_PRECISION", "int8")        # fp32 | int8
+RERANK_NUM_THREADS = int(os.getenv("RERANK_NUM_THREADS", "0"))  # 0 = torch default
+
+# -------- MODEL (loaded on first use) --------
+_model = None
+_model_lock = threading.Lock()
+
+# Smoothed seconds per batch, used to decide whether the next batch still fits
+_batch_seconds = None
+_BATCH_EMA = 0.2
+
+_warm_lock = threading.Lock()
+_warming = False
+
+
+def get_model():
+    """
+    (tokenizer, model), loaded once per process on first call
+    """
+    global _model
+
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import torch
+                from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+                if RERANK_NUM_THREADS > 0:
+                    torch.set_num_threads(RERANK_NUM_THREADS)
+
+                tokenizer = AutoTokenizer.from_pretrained(RERANK_MODEL_NAME)
+                model = AutoModelForSequenceClassification.from_pretrained(RERANK_MODEL_NAME).eval()
+                if RERANK_PRECISION == "int8":
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                _model = (tokenizer, model)
+
+    return _model
+
+
+def score_pairs(query: str, texts: List[str]) -> List[float]:
+    """
+    Cross-encoder relevance logits for (query, text) pairs, one forward pass
+    """
+    import torch
+
+    tokenizer, model = get_model()
+    inputs = tokenizer(
+        [query] * len(texts),
+        texts,
+        return_tensors="pt",
+        padding=True,
+        truncation="only_second",
+        max_length=RERANK_MAX_LENGTH
+    )
+
+    with torch.inference_mode():
+        logits = model(**inputs).logits
+
+    return logits[:, 0].float().tolist()
+
+
+def warmup():
+    """
+    Load the model and time one full batch, so the budget check has a real
+    per-batch estimate before the first request reranks
+    """
+    global _batch_seconds
+
+    get_model()
+    texts = [" ".join(["warmup"] * RERANK_MAX_LENGTH)] * RERANK_BATCH_SIZE
+
+    # The first forward pass pays for one-off allocations; time the second
+    score_pairs("warmup", texts)
+    started = time.perf_counter()
+    score_pairs("warmup", texts)
+    _batch_seconds = time.perf_counter() - started
+    logger.info("Reranker warm: %.1fms per batch of %d", _batch_seconds * 1000, RERANK_BATCH_SIZE)
+
+
+def _warm_in_background():
+    """
+    Start warmup() on a daemon thread unless one is already running
+    """
+    global _warming
+
+    with _warm_lock:
+        if _warming:
+            return
+        _warming = True
+
+    def run():
+        global _warming
+        try:
+            warmup()
+        except Exception:
+            logger.error("Reranker warmup failed", exc_info=True)
+        finally:
+            _warming = False
+
+    threading.Thread(target=run, name="rerank-warmup", daemon=True).start()
+
+
+def _cache_key(query: str, text: str) -> Tuple[str, str, str]:
+    return (RERANK_MODEL_NAME, query, hashlib.sha1(text.encode("utf-8")).hexdigest())
+
+
+def _score_within_budget(query: str, texts: List[str], deadline: float) -> Tuple[Dict[int, float], int, Optional[str]]:
+    """
+    (scores by position in texts, cache hits, skip reason); the reason is
+    "cold" before warmup has timed a batch and "budget" when the next batch
+    would not have finished within the deadline, None when every text is scored
+    """
+    global _batch_seconds
+
+    scores, missing = {}, []
+    for i, text in enumerate(texts):
+        cached = rerank_cache.get(_cache_key(query, text))
+        if cached is None:
+            missing.append(i)
+        else:
+            scores[i] = cached
+    cached = len(scores)
+
+    # Without a timed batch there is nothing to budget with, and the first
+    # batch may include the model load
+    if missing and (_model is None or _batch_seconds is None):
+        _warm_in_background()
+        return scores, cached, "cold"
+
+    # Similar lengths in a batch keep padding (and CPU time) down
+    missing.sort(key=lambda i: len(texts[i]))
+
+    for start in range(0, len(missing), RERANK_BATCH_SIZE):
+        if time.perf_counter() + _batch_seconds > deadline:
+            return scores, cached, "budget"
+
+        batch = missing[start:start + RERANK_BATCH_SIZE]
+        started = time.perf_counter()
+        batch_scores = score_pairs(query, [texts[i] for i in batch])
+        elapsed = time.perf_counter() - started
+        _batch_seconds = (1 - _BATCH_EMA) * _batch_seconds + _BATCH_EMA * elapsed
+
+        for i, score in zip(batch, batch_scores):
+            scores[i] = score
+            rerank_cache.set(_cache_key(query, texts[i]), score)
+
+    return scores, cached, None
+
+
+def _top(results: List[Dict], top_k: int) -> List[Dict]:
+    """
+    Retrieval order cut to top_k per modality
+    """
+    text = [r for r in results if r.get("type") == "text"][:top_k]
+    images = [r for r in results if r.get("type") != "text"][:top_k]
+    return sorted(text + images, key=lambda r: r.get("norm_score", 0.0), reverse=True)
+
+
+def rerank(
+    query: str,
+    results: List[Dict],
+    top_k: int = RERANK_TOP_K,
+    budget_ms: float = RERANK_BUDGET_MS
+) -> Tuple[List[Dict], Dict]:
+    """
+    (results, report): text hits reordered by cross-encoder score, cut to
+    top_k per modality. The report has ms, candidates, cached, skipped and
+    mean_rank_shift.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+
+    text = [r for r in results if r.get("type") == "text" and r.get("text")]
+    report = {"candidates": len(text), "cached": 0, "skipped": None, "mean_rank_shift": 0.0}
+
+    if len(text) < 2:
+        report["ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return _top(results, top_k), report
+
+    try:
+        scores, report["cached"], report["skipped"] = _score_within_budget(query, [r["text"] for r in text], deadline)
+    except Exception:
+        logger.error("Reranking failed, keeping retrieval order", exc_info=True)
+        report["skipped"] = "error"
+
+    if report["skipped"]:
+        RERANK_SKIPPED.inc(reason=report["skipped"])
+        report["ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return _top(results, top_k), report
+
+    order = sorted(range(len(text)), key=lambda i: scores[i], reverse=True)[:top_k]
+
+    # How far the kept hits moved from their retrieval rank
+    report["mean_rank_shift"] = sum(abs(new - old) for new, old in enumerate(order)) / len(order)
+    RERANK_RANK_SHIFT.observe(report["mean_rank_shift"])
+
+    # Logits are not on the image scale: the k-th reranked hit takes the k-th
+    # best calibrated retrieval score of the text candidates
+    calibrated = sorted((r.get("norm_score", 0.0) for r in text), reverse=True)
+
+    reranked = []
+    for rank, i in enumerate(order):
+        hit = dict(text[i], rerank_score=scores[i], retrieval_rank=i)
+        hit["norm_score"] = calibrated[rank]
+        reranked.append(hit)
+
+    images = [r for r in results if r.get("type") != "text"][:top_k]
+    merged = sorted(reranked + images, key=lambda r: r.get("norm_score", 0.0), reverse=True)
+
+    report["ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return merged, report
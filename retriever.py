@@ -1,75 +1,223 @@
-from functools import lru_cache
-from typing import List
-from pymilvus import connections, Collection
-from embedder import embed_query
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from embedder import embed_query, embed_queries
+from milvus_config import TEXT_COLLECTION_NAME, IMAGE_COLLECTION_NAME
+from search_backends import get_backend, current_index_version
+from lexical_index import get_lexical_index
+from cache import embedding_cache, retrieval_cache
+from metrics import span
+
+logger = logging.getLogger("Retriever")
+
+# Minimum similarity for a hit to be used as context (COSINE: higher = closer).
+# CLIP text-text and text-image similarities live in very different ranges,
+# so each modality has its own floor, and a "ceiling" where a hit counts as
+# a near-certain match; norm_score maps [floor, ceiling] onto [0, 1] with the
+# same constants for every query, so scores compare across modalities.
+MIN_SCORE = float(os.getenv("RETRIEVAL_TEXT_MIN_SCORE", os.getenv("RETRIEVAL_MIN_SCORE", "0.2")))
+IMAGE_MIN_SCORE = float(os.getenv("RETRIEVAL_IMAGE_MIN_SCORE", "0.2"))
+TEXT_SCORE_CEIL = float(os.getenv("RETRIEVAL_TEXT_SCORE_CEIL", "0.9"))
+IMAGE_SCORE_CEIL = float(os.getenv("RETRIEVAL_IMAGE_SCORE_CEIL", "0.35"))
+
+# norm_score of fused text hits when no vector hit passed the floor (BM25 only)
+LEXICAL_ONLY_SCORE = float(os.getenv("RETRIEVAL_LEXICAL_ONLY_SCORE", "0.5"))
+
+# Text and image searches run side by side on this pool
+RETRIEVAL_THREADS = int(os.getenv("RETRIEVAL_THREADS", "8"))
+_search_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_THREADS, thread_name_prefix="retrieval")
+
+# Hybrid text retrieval: BM25 (lexical_index.py) fused with the vector hits by
+# reciprocal-rank fusion. Both rankings are taken HYBRID_CANDIDATES deep, then
+# the fused list is cut back to top_k.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+# Caching Layer (cache.py: bounded LRU + TTL, concurrent misses computed once)
+def cached_embed_query(query: str):
+    """
+    Cache embeddings for repeated queries
+    """
+    return embedding_cache.get_or_compute(query, lambda: embed_query(query))
 
-# Milvus Connection
-connections.connect(host="localhost", port="19530")
 
-TEXT_COLLECTION_NAME = "text_chunks_collection"
-IMAGE_COLLECTION_NAME = "image_embeddings_collection"
+# Ranking
+def _calibrate(score: float, floor: float, ceil: float) -> float:
+    return min(1.0, max(0.0, (score - floor) / max(ceil - floor, 1e-6)))
 
-TEXT_COLLECTION = Collection(TEXT_COLLECTION_NAME)
-IMAGE_COLLECTION = Collection(IMAGE_COLLECTION_NAME)
 
-# Ensure collections are loaded (important for prod)
-TEXT_COLLECTION.load()
-IMAGE_COLLECTION.load()
+def _normalize(hits: List[Dict], floor: float, ceil: float) -> List[Dict]:
+    """
+    norm_score from the raw cosine on the modality's fixed [floor, ceil]
+    scale (not min-max within the query, which always gave the top hit 1.0)
+    """
+    for h in hits:
+        h["norm_score"] = _calibrate(h["score"], floor, ceil)
+    return hits
 
 
-# Caching Layer
-@lru_cache(maxsize=256)
-def cached_embed_query(query: str):
+def _fuse(text: List[Dict], lexical_hits: List[Dict], top_k: int, min_score: float) -> List[Dict]:
     """
-    Cache embeddings for repeated queries
+    Reciprocal-rank fusion of the vector text hits (best first) with the BM25
+    hits. Chunks found only by BM25 have score None. norm_score stays on the
+    calibrated cosine scale so it compares with image hits: the fused order
+    is kept and the k-th hit gets the query's k-th best calibrated text score.
+    """
+    fused = {}
+    for rank, h in enumerate(text):
+        fused[h["chunk_id"] or h["text"]] = dict(h, rrf=1.0 / (RRF_K + rank + 1))
+
+    for rank, h in enumerate(lexical_hits):
+        item = fused.setdefault(
+            h["chunk_id"],
+            {"type": "text", "text": h["text"], "chunk_id": h["chunk_id"], "score": None, "rrf": 0.0}
+        )
+        item["rrf"] += 1.0 / (RRF_K + rank + 1)
+        item["bm25"] = h["bm25"]
+
+    ranked = sorted(fused.values(), key=lambda h: h["rrf"], reverse=True)[:top_k]
+
+    # The k-th fused hit takes the k-th best calibrated vector score
+    calibrated = sorted(
+        (_calibrate(h["score"], min_score, TEXT_SCORE_CEIL) for h in fused.values() if h["score"] is not None),
+        reverse=True
+    ) or [LEXICAL_ONLY_SCORE]
+    for rank, h in enumerate(ranked):
+        h["norm_score"] = calibrated[min(rank, len(calibrated) - 1)]
+    return ranked
+
+
+def _merge(
+    text_hits: List[Dict],
+    image_hits: List[Dict],
+    min_score: float,
+    lexical_hits: Optional[List[Dict]] = None,
+    top_k: int = 3,
+    image_min_score: float = IMAGE_MIN_SCORE
+) -> List[Dict]:
     """
-    return embed_query(query)
+    One ranking over both modalities by calibrated norm_score, best first
+    """
+    text = [
+        {"type": "text", "text": h["text"], "chunk_id": h.get("chunk_id"), "score": h["score"]}
+        for h in text_hits if h["score"] >= min_score
+    ]
+    images = [
+        {"type": "image", "image_path": h["image_path"], "score": h["score"]}
+        for h in image_hits if h["score"] >= image_min_score
+    ]
+
+    if lexical_hits is None:
+        text = _normalize(text, min_score, TEXT_SCORE_CEIL)
+    else:
+        text = _fuse(text, lexical_hits, top_k, min_score)
+
+    merged = text + _normalize(images, image_min_score, IMAGE_SCORE_CEIL)
+    merged.sort(key=lambda h: h["norm_score"], reverse=True)
+    return merged
 
 
 # Retrieval
-def retrieve_context(
-    query: str,
+def _lexical_search(index, queries: List[str], depth: int) -> List[List[Dict]]:
+    with span("lexical_search"):
+        return [index.search(q, depth) for q in queries]
+
+
+def _open_lexical_index():
+    """
+    get_lexical_index, or None when opening it fails (e.g. a segment removed
+    by a concurrent update_index); retrieval then runs vector-only
+    """
+    try:
+        return get_lexical_index()
+    except Exception:
+        logger.warning("Opening the lexical index failed, using vector hits only", exc_info=True)
+        return None
+
+
+def search_vectors(
+    query_vectors: List[List[float]],
     top_k: int = 3,
-    max_distance: float = 0.8
-) -> List[str]:
+    min_score: float = MIN_SCORE,
+    queries: Optional[List[str]] = None
+) -> List[List[Dict]]:
     """
-    Retrieve relevant text chunks and images using vector similarity.
-    Lower distance = higher similarity.
+    Search text and image collections concurrently for many query vectors at
+    once (one backend call per collection), returning one merged ranking per query.
+    With the query strings and a lexical index, text hits are BM25 + vector fused.
+    min_score is the floor for text hits; image hits use IMAGE_MIN_SCORE.
     """
+    backend = get_backend()
+    index = _open_lexical_index() if HYBRID_SEARCH and queries is not None else None
+    text_k = max(top_k, HYBRID_CANDIDATES) if index is not None else top_k
 
-    query_vector = cached_embed_query(query)
+    text_future = _search_pool.submit(
+        backend.search, TEXT_COLLECTION_NAME, query_vectors, text_k, ["text", "chunk_id"]
+    )
+    image_future = _search_pool.submit(
+        backend.search, IMAGE_COLLECTION_NAME, query_vectors, top_k, ["image_path"]
+    )
+    lexical_future = (
+        _search_pool.submit(_lexical_search, index, queries, text_k)
+        if index is not None else None
+    )
 
-    search_params = {
-        "metric_type": "L2",
-        "params": {"nprobe": 10}
-    }
+    text_hits, image_hits = text_future.result(), image_future.result()
 
-    results = []
+    # BM25 only adds to the vector hits; if it fails, search vector-only
+    lexical_hits = [None] * len(query_vectors)
+    if lexical_future is not None:
+        try:
+            lexical_hits = lexical_future.result()
+        except Exception:
+            logger.warning("Lexical search failed, using vector hits only", exc_info=True)
 
-    # -------- TEXT SEARCH --------
-    text_hits = TEXT_COLLECTION.search(
-        data=[query_vector],
-        anns_field="embedding",
-        param=search_params,
-        limit=top_k,
-        output_fields=["text"]
-    )
+    return [
+        _merge(t, i, min_score, l, top_k)
+        for t, i, l in zip(text_hits, image_hits, lexical_hits)
+    ]
 
-    for hit in text_hits[0]:
-        if hit.distance <= max_distance:
-            results.append(hit.entity.get("text"))
-
-    # -------- IMAGE SEARCH --------
-    image_hits = IMAGE_COLLECTION.search(
-        data=[query_vector],
-        anns_field="embedding",
-        param=search_params,
-        limit=top_k,
-        output_fields=["image_path"]
-    )
 
-    for hit in image_hits[0]:
-        if hit.distance <= max_distance:
-            results.append(f"Related image: {hit.entity.get('image_path')}")
+def retrieve_context_batch(
+    queries: List[str],
+    top_k: int = 3,
+    min_score: float = MIN_SCORE
+) -> List[List[Dict]]:
+    """
+    Batched retrieve_context for offline evaluation and multi-query expansion:
+    queries are embedded in one batch and searched in one call per collection
+    """
+    if not queries:
+        return []
+
+    return search_vectors(embed_queries(queries), top_k, min_score, queries)
+
+
+def retrieve_context(
+    query: str,
+    top_k: int = 3,
+    min_score: Optional[float] = None
+) -> List[Dict]:
+    """
+    Retrieve relevant text chunks and images using vector similarity, with
+    text hits fused with BM25 matches when a lexical index exists.
+    The search backend (Milvus or in-process) is selected by SEARCH_BACKEND.
+
+    Returns one ranking over both modalities, best first:
+        {"type": "text", "text", "chunk_id", "score", "norm_score"[, "bm25"]}
+        {"type": "image", "image_path", "score", "norm_score"}
+    """
+    if min_score is None:
+        min_score = MIN_SCORE
+
+    def search():
+        with span("query_embedding"):
+            query_vector = cached_embed_query(query)
+        with span("vector_search"):
+            return search_vectors([query_vector], top_k, min_score, [query])[0]
 
-    return results
+    # Keyed by index version so re-ingested data is never served from the cache
+    return retrieval_cache.get_or_compute((current_index_version(), query, top_k, min_score), search)
@@ -1,7 +1,8 @@
 import os
 from datetime import datetime
 
-RUN_ID = datetime.now().strftime("run_%Y-%m-%d_%H-%M-%S")
+# Set PIPELINE_RUN_ID to make separate stage scripts write into the same run
+RUN_ID = os.getenv("PIPELINE_RUN_ID") or datetime.now().strftime("run_%Y-%m-%d_%H-%M-%S")
 BASE_RUN_DIR = os.path.join("data", "runs", RUN_ID)
 
 PATHS = {
@@ -9,10 +10,25 @@ PATHS = {
     "extracted_images": os.path.join(BASE_RUN_DIR, "extracted_images"),
     "chunks": os.path.join(BASE_RUN_DIR, "chunks"),
     "metadata": os.path.join(BASE_RUN_DIR, "metadata"),
-    "embeddings": os.path.join(BASE_RUN_DIR, "embeddings")
+    "embeddings": os.path.join(BASE_RUN_DIR, "embeddings"),
+    "captions": os.path.join(BASE_RUN_DIR, "captions")
 }
 
-for path in PATHS.values():
-    os.makedirs(path, exist_ok=True)
+_dirs_ready = False
 
-print(f"🚀 Pipeline Run Started → {RUN_ID}")
+
+def ensure_run_dirs():
+    """
+    Create the run directories (once per process); stage scripts call this
+    before writing so importing run_config has no side effects
+    """
+    global _dirs_ready
+
+    if _dirs_ready:
+        return
+
+    for path in PATHS.values():
+        os.makedirs(path, exist_ok=True)
+
+    _dirs_ready = True
+    print(f"🚀 Pipeline Run Started → {RUN_ID}")
@@ -0,0 +1,562 @@
+"""
+search_backends.py
+
+Purpose:
+- One search interface behind retriever.retrieve_context
+- MilvusBackend: the Milvus server through a pooled, self-healing set of
+  connections (milvus_pool.py), created lazily on first search
+- LocalBackend: in-process search over the memory-mapped embedding stores,
+  no external service needed (edge deployments, tests, small corpora)
+
+Select with SEARCH_BACKEND=milvus|local. The local backend reads the run
+directory in LOCAL_INDEX_RUN_DIR (default: the latest run with embeddings)
+and searches it in one of three modes (LOCAL_INDEX_MODE):
+
+    exact   blocked matmul + argpartition over the full matrix
+    ivf     k-means coarse quantizer, scan only the nprobe nearest lists
+    ivfpq   ivf with product-quantized codes, exact re-rank of the best candidates
+
+Every backend returns, per query vector, a list of hits:
+    {"score": <higher is more similar>, <output field>: <value>, ...}
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from milvus_config import (
+    MILVUS_HOST,
+    MILVUS_PORT,
+    TEXT_COLLECTION_NAME,
+    IMAGE_COLLECTION_NAME,
+    VERSION_COLLECTION_NAME,
+    VERSION_ROW_ID,
+    search_params,
+    similarity
+)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "milvus")   # milvus | local
+INDEX_VERSION_CHECK = float(os.getenv("INDEX_VERSION_CHECK", "30"))   # seconds between version lookups
+
+logger = logging.getLogger("SearchBackends")
+LOCAL_INDEX_RUN_DIR = os.getenv("LOCAL_INDEX_RUN_DIR")
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "exact")  # exact | ivf | ivfpq
+LOCAL_NPROBE = int(os.getenv("LOCAL_NPROBE", "8"))
+LOCAL_PQ_SUBVECTORS = int(os.getenv("LOCAL_PQ_SUBVECTORS", "16"))
+
+# Rows scored per matmul block, bounds memory for large memory-mapped stores
+EXACT_BLOCK_ROWS = 65536
+MILVUS_SEARCH_TIMEOUT = float(os.getenv("MILVUS_SEARCH_TIMEOUT", "5"))
+LATENCY_WINDOW = 1024  # recent searches kept for percentiles
+KMEANS_ITERATIONS = 20
+KMEANS_TRAIN_ROWS = 50000
+PQ_RERANK_FACTOR = 8
+
+
+class SearchBackend:
+    """
+    Base interface: batched top-k search over a named collection
+    """
+
+    def search(
+        self,
+        collection: str,
+        vectors: List[List[float]],
+        top_k: int,
+        output_fields: List[str]
+    ) -> List[List[Dict]]:
+        raise NotImplementedError
+
+    def version(self) -> Optional[str]:
+        """
+        Identifier that changes whenever the indexed data changes (used to
+        invalidate answer caches); None when unknown
+        """
+        return None
+
+    def health(self) -> Dict:
+        return {"status": "ok"}
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class LatencyTracker:
+    """
+    Percentiles over the most recent LATENCY_WINDOW latencies (searches, LLM calls)
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        q-th percentile in seconds, None with fewer than min_samples samples
+        """
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            samples = np.array(self._samples)
+        return float(np.percentile(samples, q))
+
+    def summary(self) -> Dict:
+        with self._lock:
+            samples = np.array(self._samples)
+            count = self.count
+
+        if not len(samples):
+            return {"count": count}
+
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        return {
+            "count": count,
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(samples.max()) * 1000, 2),
+        }
+
+
+# -------- MILVUS --------
+class MilvusBackend(SearchBackend):
+    """
+    Milvus server behind a connection pool with retries and a circuit breaker
+    (milvus_pool.py); raises CircuitOpenError while Milvus is considered down
+    """
+
+    def __init__(self, host: str = MILVUS_HOST, port: str = MILVUS_PORT):
+        from milvus_pool import MilvusPool
+
+        self.host = host
+        self.port = port
+        self.pool = MilvusPool(host, port)
+        self.latency = LatencyTracker()
+
+    def version(self):
+        # The marker milvus_loader writes after every load; a re-ingest that
+        # replaces rows by key leaves the row counts unchanged. Deployments
+        # loaded before the marker existed fall back to the counts.
+        def marker(slot):
+            from pymilvus import utility
+
+            if utility.has_collection(VERSION_COLLECTION_NAME, using=slot.alias):
+                rows = self.pool.collection(slot, VERSION_COLLECTION_NAME).query(
+                    expr=f"id == {VERSION_ROW_ID}",
+                    output_fields=["version"],
+                    timeout=slot.remaining(MILVUS_SEARCH_TIMEOUT)
+                )
+                if rows:
+                    return rows[0]["version"]
+
+            return "counts:" + ":".join(
+                str(self.pool.collection(slot, name).num_entities)
+                for name in (TEXT_COLLECTION_NAME, IMAGE_COLLECTION_NAME)
+            )
+
+        return "milvus:" + self.pool.run(marker)
+
+    def search(self, collection, vectors, top_k, output_fields):
+        data = [list(v) for v in vectors]
+
+        def query(slot):
+            return self.pool.collection(slot, collection).search(
+                data=data,
+                anns_field="embedding",
+                param=search_params(),
+                limit=top_k,
+                output_fields=output_fields,
+                timeout=slot.remaining(MILVUS_SEARCH_TIMEOUT)
+            )
+
+        started = time.perf_counter()
+        hits = self.pool.run(query)
+        self.latency.record(time.perf_counter() - started)
+
+        return [
+            [
+                {"score": similarity(hit.distance), **{f: hit.entity.get(f) for f in output_fields}}
+                for hit in per_query
+            ]
+            for per_query in hits
+        ]
+
+    def health(self):
+        if self.pool.breaker.state == "open":
+            return {"status": "circuit_open"}
+        return {"status": "ok" if self.pool.ping() else "down"}
+
+    def stats(self):
+        return {"pool": self.pool.stats(), "search_latency": self.latency.summary()}
+
+
+# -------- LOCAL (IN-PROCESS) --------
+def _top_k(scores: np.ndarray, k: int):
+    """
+    Row-wise top-k (indices, scores) of a 2-D score matrix, best first
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0))
+
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+    return np.argmax(data @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0):
+    """
+    Lloyd's k-means trained on a sample of at most KMEANS_TRAIN_ROWS rows;
+    returns (centroids, assignments of every row)
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    train = data
+    if len(data) > KMEANS_TRAIN_ROWS:
+        train = data[np.sort(rng.choice(len(data), size=KMEANS_TRAIN_ROWS, replace=False))]
+
+    centroids = train[rng.choice(len(train), size=k, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        assign = _nearest(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+
+    return centroids, _nearest(data, centroids)
+
+
+class LocalIndex:
+    """
+    Top-k inner-product search over one memory-mapped (n, dim) matrix.
+    Vectors are L2-normalised, so inner product == cosine similarity.
+    """
+
+    def __init__(self, vectors: np.ndarray, mode: str = LOCAL_INDEX_MODE, nprobe: int = LOCAL_NPROBE):
+        self.vectors = vectors
+        self.mode = mode
+        self.nprobe = nprobe
+        self._lists = None
+
+        if mode in ("ivf", "ivfpq") and len(vectors):
+            self._build_ivf()
+        if mode == "ivfpq" and len(vectors):
+            self._build_pq()
+
+    # -------- IVF --------
+    def _build_ivf(self):
+        data = np.asarray(self.vectors, dtype=np.float32)
+        nlist = max(1, int(np.sqrt(len(data))))
+        self.centroids, assign = _kmeans(data, nlist)
+        self._lists = [np.flatnonzero(assign == c) for c in range(len(self.centroids))]
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        return np.concatenate([self._lists[c] for c in probe])
+
+    # -------- PQ --------
+    def _build_pq(self):
+        data = np.asarray(self.vectors, dtype=np.float32)
+        m = LOCAL_PQ_SUBVECTORS
+        while data.shape[1] % m:
+            m -= 1
+        self.pq_m = m
+        self.pq_sub = data.shape[1] // m
+
+        self.codebooks = []
+        codes = np.empty((len(data), m), dtype=np.uint8)
+        for j in range(m):
+            sub = data[:, j * self.pq_sub:(j + 1) * self.pq_sub]
+            book, assign = _kmeans(sub, 256, iterations=10, seed=j)
+            self.codebooks.append(book)
+            codes[:, j] = assign
+        self.codes = codes
+
+    def _pq_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        Asymmetric distance: per-subspace lookup tables of query . codeword
+        """
+        tables = [
+            book @ query[j * self.pq_sub:(j + 1) * self.pq_sub]
+            for j, book in enumerate(self.codebooks)
+        ]
+        codes = self.codes[rows]
+        return sum(tables[j][codes[:, j]] for j in range(self.pq_m))
+
+    # -------- SEARCH --------
+    def _exact(self, queries: np.ndarray, k: int):
+        n = len(self.vectors)
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+
+        for start in range(0, n, EXACT_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + EXACT_BLOCK_ROWS], dtype=np.float32)
+            idx, scores = _top_k(queries @ block.T, k)
+            best_idx = np.concatenate([best_idx, idx + start], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+
+        order, scores = _top_k(best_scores, k)
+        return np.take_along_axis(best_idx, order, axis=1), scores
+
+    def search(self, queries: np.ndarray, k: int):
+        """
+        Returns per query a list of (row, score), best first
+        """
+        if len(self.vectors) == 0:
+            return [[] for _ in queries]
+
+        if self.mode == "exact":
+            idx, scores = self._exact(queries, k)
+            return [list(zip(i.tolist(), s.tolist())) for i, s in zip(idx, scores)]
+
+        results = []
+        for q in queries:
+            rows = self._candidates(q)
+            if len(rows) == 0:
+                results.append([])
+                continue
+
+            if self.mode == "ivfpq":
+                approx = self._pq_scores(q, rows)
+                keep = min(len(rows), k * PQ_RERANK_FACTOR)
+                rows = rows[np.argpartition(-approx, keep - 1)[:keep]]
+
+            # Sorted rows keep memory-mapped reads sequential
+            rows = np.sort(rows)
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ q
+            idx, top = _top_k(scores[None, :], k)
+            results.append(list(zip(rows[idx[0]].tolist(), top[0].tolist())))
+
+        return results
+
+
+def latest_run_dir(base: str = os.path.join("data", "runs")) -> Optional[str]:
+    """
+    Most recent run directory that contains embedding stores
+    """
+    if not os.path.isdir(base):
+        return None
+
+    runs = sorted(
+        (d for d in os.listdir(base)
+         if os.path.exists(os.path.join(base, d, "embeddings", "clip_text_store", "meta.json"))),
+        reverse=True
+    )
+    return os.path.join(base, runs[0]) if runs else None
+
+
+class LocalBackend(SearchBackend):
+    """
+    In-process backend over a pipeline run's embedding stores. Without an
+    explicit run_dir it follows the latest run; loaded collections are
+    reloaded when version() changes (checked every INDEX_VERSION_CHECK seconds).
+    """
+
+    def __init__(self, run_dir: Optional[str] = None, mode: str = LOCAL_INDEX_MODE):
+        self._pinned_run_dir = run_dir or LOCAL_INDEX_RUN_DIR
+        self.run_dir = self._resolve_run_dir()
+        self.mode = mode
+        self._collections = {}   # name -> (version, index, fields)
+        self._current = None   # (run_dir, version) last checked
+        self._version_checked = 0.0
+        self._lock = threading.Lock()
+        self.latency = LatencyTracker()
+
+    def _resolve_run_dir(self) -> str:
+        run_dir = self._pinned_run_dir or latest_run_dir()
+        if run_dir is None:
+            raise FileNotFoundError("No run with embeddings found for the local search backend")
+        return run_dir
+
+    def _load(self, name):
+        from embedding_store import EmbeddingStore
+        from chunk_records import iter_folder
+
+        embeddings = os.path.join(self.run_dir, "embeddings")
+
+        if name == TEXT_COLLECTION_NAME:
+            store = EmbeddingStore(os.path.join(embeddings, "clip_text_store"))
+            chunk_text = {
+                r["chunk_id"]: r["text"]
+                for r in iter_folder(os.path.join(self.run_dir, "chunks"), columns=["chunk_id", "text"])
+            }
+            fields = [
+                {
+                    "text": chunk_text.get(r["chunk_id"], ""),
+                    "chunk_id": r["chunk_id"],
+                    "source": r["source_document"]
+                }
+                for r in store.records()
+            ]
+        elif name == IMAGE_COLLECTION_NAME:
+            store = EmbeddingStore(os.path.join(embeddings, "clip_image_store"))
+            image_folder = os.path.join(self.run_dir, "extracted_images")
+            fields = [
+                {"image_path": os.path.join(image_folder, r["image_file"])}
+                for r in store.records()
+            ]
+        else:
+            raise KeyError(f"Unknown collection '{name}'")
+
+        return LocalIndex(store.vectors(), self.mode), fields
+
+    def _current_version(self):
+        """
+        (run_dir, version), re-resolved at most every INDEX_VERSION_CHECK seconds
+        """
+        now = time.monotonic()
+        if self._current is None or now - self._version_checked >= INDEX_VERSION_CHECK:
+            run_dir = self._resolve_run_dir()
+            self._current, self._version_checked = (run_dir, self._stamp(run_dir)), now
+        return self._current
+
+    def _collection(self, name):
+        run_dir, version = self._current_version()
+        loaded = self._collections.get(name)
+        if loaded is None or loaded[0] != version:
+            with self._lock:
+                loaded = self._collections.get(name)
+                if loaded is None or loaded[0] != version:
+                    logger.info("Loading local collection %s (%s)", name, version)
+                    self.run_dir = run_dir
+                    loaded = self._collections[name] = (version, *self._load(name))
+        return loaded[1], loaded[2]
+
+    def version(self):
+        return self._stamp(self._resolve_run_dir())
+
+    @staticmethod
+    def _stamp(run_dir: str) -> str:
+        # Stores are append-only: the run directory plus the meta.json
+        # mtimes change on every write, and a new run changes the directory
+        embeddings = os.path.join(run_dir, "embeddings")
+        stamps = []
+        for store in ("clip_text_store", "clip_image_store"):
+            meta = os.path.join(embeddings, store, "meta.json")
+            stamps.append(str(os.stat(meta).st_mtime_ns) if os.path.exists(meta) else "-")
+        return f"local:{run_dir}:" + ":".join(stamps)
+
+    def search(self, collection, vectors, top_k, output_fields):
+        index, fields = self._collection(collection)
+        queries = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+
+        started = time.perf_counter()
+        results = index.search(queries, top_k)
+        self.latency.record(time.perf_counter() - started)
+
+        return [
+            [
+                {"score": score, **{f: fields[row].get(f) for f in output_fields}}
+                for row, score in per_query
+            ]
+            for per_query in results
+        ]
+
+    def stats(self):
+        return {"mode": self.mode, "run_dir": self.run_dir, "search_latency": self.latency.summary()}
+
+
+# -------- SELECTION --------
+_backend: Optional[SearchBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> SearchBackend:
+    """
+    Process-wide backend chosen by SEARCH_BACKEND, created on first use
+    """
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if SEARCH_BACKEND == "local":
+                    _backend = LocalBackend()
+                elif SEARCH_BACKEND == "milvus":
+                    _backend = MilvusBackend()
+                else:
+                    raise ValueError(f"Unknown SEARCH_BACKEND '{SEARCH_BACKEND}'")
+
+    return _backend
+
+
+def active_backend() -> Optional[SearchBackend]:
+    """
+    The backend if one has been created, without creating it (metrics, health)
+    """
+    return _backend
+
+
+def index_version() -> Optional[str]:
+    """
+    Version of the indexed data; INDEX_VERSION overrides the backend's own
+    (set it from the deployment when re-ingesting into the same collections)
+    """
+    override = os.getenv("INDEX_VERSION")
+    if override:
+        return override
+
+    from lexical_index import loaded_index
+
+    version = get_backend().version()
+    lexical = loaded_index()
+    if lexical is not None and version is not None:
+        version = f"{version}|{lexical.version()}"
+    return version
+
+
+_version = None
+_version_checked = 0.0
+_version_lock = threading.Lock()
+
+
+def current_index_version() -> Optional[str]:
+    """
+    index_version looked up at most every INDEX_VERSION_CHECK seconds, for
+    the query path (cache keys, answer-cache invalidation). One caller does
+    the lookup; the others keep using the last known version meanwhile.
+    """
+    global _version, _version_checked
+
+    now = time.monotonic()
+    with _version_lock:
+        if _version_checked and now - _version_checked < INDEX_VERSION_CHECK:
+            return _version
+        _version_checked = now   # claims the lookup
+
+    try:
+        version = index_version()
+    except Exception:
+        logger.warning("Index version lookup failed", exc_info=True)
+        return _version
+
+    with _version_lock:
+        _version = version
+    return version
+
+
+def set_backend(backend: SearchBackend):
+    """
+    Install a backend explicitly (benchmarks, tests)
+    """
+    global _backend
+    _backend = backend
@@ -0,0 +1,195 @@
+"""
+semantic_cache.py
+
+Purpose:
+- Answer cache keyed by query embedding instead of the exact question
+  string, so rephrased questions reuse a stored answer
+- A lookup hits when the cosine similarity between the new query vector and
+  a cached one is at least SEMANTIC_CACHE_THRESHOLD and both questions name
+  the same codes and numbers ("error E42" never gets the answer for "E43")
+- Entries expire after SEMANTIC_CACHE_TTL seconds; when full, expired
+  entries go first, then the least recently used
+- The whole cache is dropped when the index version changes (re-ingestion),
+  checked at most every SEMANTIC_CACHE_VERSION_CHECK seconds
+- Hit / miss / eviction / invalidation counters via stats()
+
+Query vectors come from retriever.cached_embed_query and are L2-normalised,
+so a single matrix-vector product scores every cached entry.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+import numpy as np
+
+from lexical_index import tokenize
+
+logger = logging.getLogger("SemanticCache")
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_VERSION_CHECK = float(os.getenv("SEMANTIC_CACHE_VERSION_CHECK", "30"))
+
+
+def exact_terms(text: Optional[str]) -> FrozenSet[str]:
+    """
+    Codes and numbers in a question (the lexical_index tokens with a digit),
+    which must match exactly for a cached answer to be reused
+    """
+    if not text:
+        return frozenset()
+    return frozenset(t for t in tokenize(text) if any(c.isdigit() for c in t))
+
+
+class SemanticCache:
+    """
+    Bounded, thread-safe nearest-neighbour cache of answers
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        version_fn: Optional[Callable[[], Optional[str]]] = None,
+        version_check: float = SEMANTIC_CACHE_VERSION_CHECK
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self.version_check = version_check
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None        # (max_entries, dim)
+        self._values: List[Any] = [None] * max_entries
+        self._terms: List[FrozenSet[str]] = [frozenset()] * max_entries
+        self._expires = np.zeros(max_entries)             # 0 = free slot
+        self._last_used = np.zeros(max_entries)
+
+        self._version = None
+        self._version_checked = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # -------- VERSIONING --------
+    def _check_version(self, now: float):
+        """
+        Called without the lock held: version_fn may be a round-trip to the
+        search backend, and lookups must not queue behind it
+        """
+        if self.version_fn is None:
+            return
+
+        with self._lock:
+            if now - self._version_checked < self.version_check:
+                return
+            self._version_checked = now
+
+        try:
+            version = self.version_fn()
+        except Exception:
+            logger.warning("Index version check failed", exc_info=True)
+            return
+
+        with self._lock:
+            if self._version is not None and version != self._version:
+                logger.info("Index version changed (%s -> %s), clearing answer cache", self._version, version)
+                self._clear()
+                self.invalidations += 1
+            self._version = version
+
+    def _clear(self):
+        self._values = [None] * self.max_entries
+        self._terms = [frozenset()] * self.max_entries
+        self._expires[:] = 0
+        self._last_used[:] = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # -------- LOOKUP / INSERT --------
+    def get(self, vector, text: Optional[str] = None) -> Optional[Any]:
+        """
+        Cached value of the most similar live entry at or above the threshold
+        whose question has the same codes and numbers as `text`, or None
+        """
+        now = time.time()
+        query = np.asarray(vector, dtype=np.float32)
+        terms = exact_terms(text)
+        self._check_version(now)
+
+        with self._lock:
+            live = self._expires > now
+            if self._vectors is None or not live.any():
+                self.misses += 1
+                return None
+
+            scores = np.where(live, self._vectors @ query, -np.inf)
+            # Most similar first; a near-identical question about another code is skipped
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for slot in candidates[np.argsort(-scores[candidates])]:
+                if self._terms[slot] == terms:
+                    self._last_used[slot] = now
+                    self.hits += 1
+                    return self._values[slot]
+
+            self.misses += 1
+            return None
+
+    def put(self, vector, value: Any, text: Optional[str] = None):
+        now = time.time()
+        query = np.asarray(vector, dtype=np.float32)
+        terms = exact_terms(text)
+        self._check_version(now)
+
+        with self._lock:
+
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+
+            # Free or expired slot first, else evict the least recently used
+            free = np.flatnonzero(self._expires <= now)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            self._vectors[slot] = query
+            self._values[slot] = value
+            self._terms[slot] = terms
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int((self._expires > time.time()).sum()),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "index_version": self._version,
+            }
+
+
+def _index_version():
+    from search_backends import current_index_version
+    return current_index_version()
+
+
+# Process-wide cache used by rag_pipeline
+answer_cache = SemanticCache(version_fn=_index_version)
@@ -0,0 +1,48 @@
+import sys
+import types
+
+import pytest
+
+from milvus_pool import CircuitBreaker, CircuitOpenError, MilvusPool, error_kind
+
+
+class MilvusException(Exception):
+    """
+    Stand-in for pymilvus.exceptions.MilvusException
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+@pytest.fixture
+def unreachable_milvus(monkeypatch):
+    """
+    pymilvus whose connections.connect always fails like a server that is down
+    """
+    def connect(**kwargs):
+        raise MilvusException(2, "Fail connecting to server on localhost:19530, illegal connection params or server unavailable")
+
+    module = types.ModuleType("pymilvus")
+    module.connections = types.SimpleNamespace(connect=connect, disconnect=lambda alias: None)
+    monkeypatch.setitem(sys.modules, "pymilvus", module)
+
+
+def test_connect_failed_code_is_a_connection_error():
+    assert error_kind(MilvusException(2, "Fail connecting to server")) == "connection"
+    assert error_kind(MilvusException(1, "server unavailable")) == "connection"
+    assert error_kind(MilvusException(1, "collection not found")) == "request"
+
+
+def test_breaker_opens_after_connect_failures(unreachable_milvus):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    pool = MilvusPool(size=1, attempts=1, budget=1, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            pool.run(lambda slot: None)
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        pool.run(lambda slot: None)
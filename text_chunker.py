@@ -1,10 +1,30 @@
 import os
 import re
-from run_config import PATHS
+from collections import namedtuple
+from run_config import PATHS, ensure_run_dirs
+from ingest_manifest import IngestManifest, file_hash, text_hash, link_or_copy
+from chunk_records import CHUNK_FORMAT, chunk_file_name, make_chunk_id, write_chunks
 
 INPUT_FOLDER = PATHS["extracted_text"]
 OUTPUT_FOLDER = PATHS["chunks"]
 
+# Chunking configuration
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))            # tokens carried into the next chunk
+CHUNK_MODE = os.getenv("CHUNK_MODE", "sentence")                # sentence | window
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "words")         # words | clip | <hf tokenizer name>
+MIN_CHUNK_WORDS = 5
+
+# A sentence fragment longer than this is emitted as-is, keeping memory bounded
+MAX_PENDING_CHARS = 20000
+
+PAGE_BREAK = re.compile(r'\[PAGE_BREAK_(\d+)\]')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+INLINE_SPACE = re.compile(r'[ \t]+')
+WORD = re.compile(r'\S+')
+
+Chunk = namedtuple("Chunk", ["page", "text", "token_count", "char_start", "char_end"])
+
 
 def clean_text(text):
     text = re.sub(r'[ \t]+', ' ', text)
@@ -13,6 +33,9 @@ def clean_text(text):
 
 
 def split_into_chunks(text, max_tokens=300):
+    """
+    Original whole-text chunker, kept for comparison (see benchmarks/bench_chunker.py)
+    """
     pages = re.split(r'\[PAGE_BREAK_\d+\]', text)
     chunks = []
 
@@ -36,25 +59,268 @@ def split_into_chunks(text, max_tokens=300):
     return chunks
 
 
+# -------- TOKEN COUNTING --------
+def word_count(text):
+    return len(text.split())
+
+
+def make_token_counter(name=CHUNK_TOKENIZER):
+    """
+    "words" counts whitespace tokens; anything else loads a Hugging Face
+    tokenizer ("clip" = the CLIP tokenizer used by the embedding stage)
+    """
+    if name == "words":
+        return word_count
+
+    from transformers import AutoTokenizer
+
+    if name == "clip":
+        from embedding_engine import CLIP_MODEL_NAME
+        name = CLIP_MODEL_NAME
+
+    tokenizer = AutoTokenizer.from_pretrained(name)
+
+    def count(text):
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    return count
+
+
+# -------- STREAMING --------
+def _strip_span(text, start):
+    """
+    Strip text and shift its start offset by the removed leading whitespace
+    """
+    stripped = text.lstrip()
+    start += len(text) - len(stripped)
+    stripped = stripped.rstrip()
+    return stripped, start, start + len(stripped)
+
+
+def iter_sentences(lines):
+    """
+    Yield (page, char_start, char_end, sentence) from an iterable of
+    extracted-text lines. Offsets index the cleaned page text (inline
+    whitespace collapsed, blank lines dropped, lines joined by "\n").
+    Only the current unfinished sentence is held in memory.
+    """
+    page = 0
+    pending = ""
+    pending_start = 0   # offset of `pending` in the cleaned page text
+    page_len = 0        # length of the cleaned page text so far
+
+    for line in lines:
+        marker = PAGE_BREAK.search(line)
+        if marker:
+            if pending.strip():
+                yield (page, *_strip_span(pending, pending_start)[1:], pending.strip())
+            pending, pending_start, page_len = "", 0, 0
+            page = int(marker.group(1))
+            continue
+
+        line = INLINE_SPACE.sub(' ', line.rstrip("\r\n"))
+        if not line.strip():
+            continue
+
+        line_start = page_len + 1 if page_len else 0
+        page_len = line_start + len(line)
+
+        if pending:
+            pending = f"{pending}\n{line}"
+        else:
+            pending, pending_start = line, line_start
+
+        prev = 0
+        for m in SENTENCE_END.finditer(pending):
+            s, s_start, s_end = _strip_span(pending[prev:m.start()], pending_start + prev)
+            if s:
+                yield page, s_start, s_end, s
+            prev = m.end()
+
+        pending, pending_start = pending[prev:], pending_start + prev
+
+        if len(pending) > MAX_PENDING_CHARS:
+            s, s_start, s_end = _strip_span(pending, pending_start)
+            yield page, s_start, s_end, s
+            pending, pending_start = "", page_len
+
+    if pending.strip():
+        s, s_start, s_end = _strip_span(pending, pending_start)
+        yield page, s_start, s_end, s
+
+
+def _sentence_chunks(sentences, max_tokens, overlap, count_tokens):
+    page = None
+    current = []        # list of (sentence, tokens, start, end)
+    current_tokens = 0
+
+    def emit():
+        return Chunk(
+            page,
+            " ".join(t for t, _, _, _ in current),
+            current_tokens,
+            current[0][2],
+            current[-1][3],
+        )
+
+    for sentence_page, start, end, s in sentences:
+        if sentence_page != page:
+            if current:
+                yield emit()
+            page, current, current_tokens = sentence_page, [], 0
+
+        n = count_tokens(s)
+
+        if current and current_tokens + n > max_tokens:
+            yield emit()
+
+            # Carry trailing sentences (up to `overlap` tokens) into the next chunk
+            carried, carried_tokens = [], 0
+            for item in reversed(current):
+                if carried_tokens + item[1] > overlap:
+                    break
+                carried.insert(0, item)
+                carried_tokens += item[1]
+            current, current_tokens = carried, carried_tokens
+
+        current.append((s, n, start, end))
+        current_tokens += n
+
+    if current:
+        yield emit()
+
+
+def _window_chunks(sentences, max_tokens, overlap, count_tokens=word_count):
+    """
+    Sliding windows of whole words, at most `max_tokens` tokens each; the
+    words making up the last `overlap` tokens of a window start the next one.
+    Each distinct word is counted once (count_tokens on the bare word).
+    """
+    costs = {}
+    page = None
+    words = []          # list of (word, tokens, start, end)
+    tokens = 0          # tokens in `words`
+    fresh = 0           # words not yet covered by an emitted window
+
+    def emit(window):
+        return Chunk(
+            page,
+            " ".join(w for w, _, _, _ in window),
+            sum(n for _, n, _, _ in window),
+            window[0][2],
+            window[-1][3],
+        )
+
+    for sentence_page, start, _, s in sentences:
+        if sentence_page != page:
+            if fresh:
+                yield emit(words)
+            page, words, tokens, fresh = sentence_page, [], 0, 0
+
+        for m in WORD.finditer(s):
+            word = m.group()
+            n = costs.get(word)
+            if n is None:
+                n = costs[word] = max(count_tokens(word), 1)
+
+            if fresh and tokens + n > max_tokens:
+                yield emit(words)
+
+                # Carry trailing words (up to `overlap` tokens) into the next window
+                keep, carried = len(words), 0
+                while keep and carried + words[keep - 1][1] <= overlap:
+                    keep -= 1
+                    carried += words[keep][1]
+                words, tokens, fresh = words[keep:], carried, 0
+
+            # A long word may not fit next to the carried ones
+            while words and tokens + n > max_tokens:
+                tokens -= words.pop(0)[1]
+
+            words.append((word, n, start + m.start(), start + m.end()))
+            tokens += n
+            fresh += 1
+
+    if fresh:
+        yield emit(words)
+
+
+def stream_chunks(
+    lines,
+    max_tokens=CHUNK_MAX_TOKENS,
+    overlap=CHUNK_OVERLAP,
+    mode=CHUNK_MODE,
+    count_tokens=word_count,
+):
+    """
+    Generator of Chunk(page, text, token_count, char_start, char_end) from
+    extracted-text lines. Chunks never cross a [PAGE_BREAK_n] boundary.
+    """
+    # An overlap as large as the chunk carries everything forward, so
+    # sentence chunks would grow without bound
+    if not 0 <= overlap < max_tokens:
+        raise ValueError(f"Chunk overlap must be at least 0 and below max_tokens (overlap={overlap}, max_tokens={max_tokens})")
+
+    sentences = iter_sentences(lines)
+
+    if mode == "window":
+        return _window_chunks(sentences, max_tokens, overlap, count_tokens)
+    return _sentence_chunks(sentences, max_tokens, overlap, count_tokens)
+
+
+def chunk_records(source_document, lines, count_tokens=word_count):
+    """
+    Chunk records (see chunk_records.py) for one extracted text, short chunks dropped.
+    chunk_id numbers chunks per page so edits on one page leave other IDs unchanged.
+    """
+    per_page = {}
+
+    for c in stream_chunks(lines, count_tokens=count_tokens):
+        if word_count(c.text) < MIN_CHUNK_WORDS:
+            continue
+
+        n = per_page[c.page] = per_page.get(c.page, 0) + 1
+        yield {
+            "chunk_id": make_chunk_id(source_document, c.page, n),
+            "source_document": source_document,
+            "page": c.page,
+            "char_start": c.char_start,
+            "char_end": c.char_end,
+            "token_count": c.token_count,
+            "text": c.text,
+        }
+
+
 def run():
+    ensure_run_dirs()
+    manifest = IngestManifest()
+    count_tokens = make_token_counter()
+    settings = f"{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP}:{CHUNK_MODE}:{CHUNK_TOKENIZER}:{CHUNK_FORMAT}"
+
     for file in os.listdir(INPUT_FOLDER):
         if file.endswith(".txt"):
-            text = open(os.path.join(INPUT_FOLDER, file), encoding="utf-8").read()
-            text = clean_text(text)
-            chunks = split_into_chunks(text)
-
-            out_file = os.path.join(
-                OUTPUT_FOLDER,
-                file.replace(".txt", "_chunks.txt")
-            )
-
-            with open(out_file, "w", encoding="utf-8") as f:
-                for i, c in enumerate(chunks):
-                    if len(c.split()) < 5:
-                        continue
-                    f.write(f"--- CHUNK {i+1} ---\n{c}\n\n")
-
-            print(f"✔ Chunked: {file}")
+            in_file = os.path.join(INPUT_FOLDER, file)
+            source_document = file[:-len(".txt")]
+            out_file = os.path.join(OUTPUT_FOLDER, chunk_file_name(source_document))
+
+            # Chunker settings are part of the key so changing them re-chunks
+            key = text_hash(f"{file_hash(in_file)}:{settings}")
+            previous = manifest.lookup("chunks", key)
+            manifest.mark("chunks", reused=previous is not None)
+            manifest.record("chunks", key, out_file)
+
+            if previous is not None:
+                link_or_copy(previous, out_file)
+                print(f"↺ Reused chunks: {file}")
+                continue
+
+            with open(in_file, encoding="utf-8") as src:
+                n = write_chunks(out_file, chunk_records(source_document, src, count_tokens))
+
+            print(f"✔ Chunked: {file} ({n} chunks)")
+
+    manifest.save()
+    manifest.write_summary()
 
 
 if __name__ == "__main__":